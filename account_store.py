@@ -0,0 +1,323 @@
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+import db
+import migrations
+from ledger import AccountNotFound, Ledger, LedgerError
+from timestamps import US_PER_SECOND, now_us
+
+# Accounts hash-partitioned over several SQLite files ("shards") so that
+# ATM writes are no longer serialized on one database's write lock. Shard 0
+# is the primary file (atm.db); the others are listed in its account_shards
+# table, so an unsharded atm.db is simply a one-shard store. An account
+# lives on shard crc32(account_number) % shard count, together with its
+# transactions.
+#
+# Transfers between two shards use a two-phase protocol recorded in each
+# shard's transfer_journal (see Ledger.transfer_out): the source is debited
+# and journalled as prepared, then the target is credited and journalled as
+# committed (or journalled as aborted), then the source is marked committed
+# or refunded. The target's journal row decides the outcome, so a transfer
+# left prepared by a crash is settled by recover() from either side.
+
+
+def shard_of(account_number, shards):
+    # Stable across processes, unlike hash()
+    return zlib.crc32(str(account_number).encode()) % shards
+
+
+def default_shard_path(db_path, shard):
+    # atm.db, atm.shard1.db, atm.shard2.db, ...
+    if shard == 0:
+        return db_path
+    stem, ext = os.path.splitext(db_path)
+    return f"{stem}.shard{shard}{ext}"
+
+
+def shard_paths(db_path='atm.db'):
+    # Shard files in shard order, from the primary's account_shards table;
+    # relative paths there are relative to the primary's directory
+    migrations.migrate(db_path, migrations.ATM_MIGRATIONS)
+    rows = db.get_connection(db_path).execute('SELECT shard, path FROM account_shards ORDER BY shard').fetchall()
+    paths = [db_path]
+    for shard, path in rows:
+        if shard != len(paths):
+            raise sqlite3.DatabaseError(f"{db_path}: account_shards is missing shard {len(paths)}")
+        paths.append(os.path.join(os.path.dirname(db_path), path))
+    return paths
+
+
+def store_files(db_path):
+    # Every file of the store whose primary is db_path, without migrating
+    # anything; just [db_path] for any other database (e.g. inventory.db)
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'account_shards'").fetchone():
+            return [db_path]
+        rows = conn.execute('SELECT path FROM account_shards ORDER BY shard').fetchall()
+    finally:
+        conn.close()
+    return [db_path] + [os.path.join(os.path.dirname(db_path), path) for path, in rows]
+
+
+def init_db(db_path='atm.db'):
+    for path in shard_paths(db_path):
+        migrations.migrate(path, migrations.ATM_MIGRATIONS)
+
+
+# Routes each account to the Ledger of its shard. The shard list is read
+# once, so every process must be restarted after reshard().
+class AccountStore:
+    def __init__(self, db_path='atm.db'):
+        self.db_path = db_path
+        self.paths = shard_paths(db_path)
+        self.ledgers = [Ledger(path) for path in self.paths]
+
+    def shard_of(self, account_number):
+        return shard_of(account_number, len(self.paths))
+
+    def path_for(self, account_number):
+        return self.paths[self.shard_of(account_number)]
+
+    def ledger_for(self, account_number):
+        return self.ledgers[self.shard_of(account_number)]
+
+    def deposit(self, account_number, amount):
+        return self.ledger_for(account_number).deposit(account_number, amount)
+
+    def withdraw(self, account_number, amount, daily_limit):
+        return self.ledger_for(account_number).withdraw(account_number, amount, daily_limit)
+
+    def set_pin_hash(self, account_number, pin_hash, version):
+        return self.ledger_for(account_number).set_pin_hash(account_number, pin_hash, version)
+
+    def transfer(self, account_number, target_account_number, amount):
+        source, target = self.shard_of(account_number), self.shard_of(target_account_number)
+        if source == target:
+            return self.ledgers[source].transfer(account_number, target_account_number, amount)
+        xid = uuid.uuid4().hex
+        result = self.ledgers[source].transfer_out(xid, account_number, target_account_number, amount)
+        try:
+            state = self.ledgers[target].transfer_in(xid, target_account_number, account_number, amount)
+        except BaseException:
+            # Outcome unknown; try to abort it now, otherwise recover() will
+            try:
+                self._settle(source, target, xid, target_account_number, account_number, amount)
+            except sqlite3.Error:
+                pass
+            raise
+        try:
+            self.ledgers[source].finish_transfer_out(xid, state)
+        except sqlite3.Error:
+            if state == "aborted":
+                raise
+            # The money has moved; recover() marks the source side later
+        if state == "aborted":
+            raise AccountNotFound("Target account not found")
+        return result
+
+    def apply_batch(self, operations):
+        # Ledger.apply_batch across shards: the operations for each shard run
+        # as one batch there, each in its own savepoint. Transfers to another
+        # shard cannot share a commit, so they go through transfer() one at a
+        # time after the batches. Returns (ok, result) per operation, in the
+        # order given.
+        results = [None] * len(operations)
+        groups = {}
+        cross = []
+        for i, op in enumerate(operations):
+            shard = self.shard_of(op.account_number)
+            if op.kind == "transfer" and self.shard_of(op.target) != shard:
+                cross.append(i)
+            else:
+                groups.setdefault(shard, []).append(i)
+        for shard, indexes in groups.items():
+            for i, result in zip(indexes, self.ledgers[shard].apply_batch([operations[i] for i in indexes])):
+                results[i] = result
+        for i in cross:
+            op = operations[i]
+            try:
+                results[i] = (True, self.transfer(op.account_number, op.target, op.amount))
+            except LedgerError as e:
+                results[i] = (False, str(e))
+        return results
+
+    def _settle(self, source, target, xid, target_account_number, account_number, amount):
+        state = self.ledgers[target].transfer_in(xid, target_account_number, account_number, amount, abort=True)
+        self.ledgers[source].finish_transfer_out(xid, state)
+        return state
+
+    def recover(self, older_than=60.0):
+        # Settle cross-shard transfers still prepared after older_than
+        # seconds, i.e. whose coordinator crashed or gave up: committed if
+        # the target was credited, otherwise aborted and refunded. Safe to
+        # run while terminals are working. Returns a Counter of outcomes.
+        outcomes = Counter()
+        cutoff = now_us() - int(older_than * US_PER_SECOND)
+        for source, path in enumerate(self.paths):
+            rows = db.get_connection(path).execute('''
+                SELECT xid, account_number, peer_account, amount_paise FROM transfer_journal
+                WHERE state = 'prepared' AND role = 'source' AND created_us < ?
+            ''', (cutoff,)).fetchall()
+            for xid, account_number, peer_account, amount in rows:
+                outcomes[self._settle(source, self.shard_of(peer_account), xid, peer_account, account_number, amount)] += 1
+        return outcomes
+
+    def purge(self, older_than_days=7, batch_size=10000):
+        # Delete finished journal rows older than older_than_days in short
+        # transactions; returns the number deleted
+        cutoff = now_us() - older_than_days * 86400 * US_PER_SECOND
+        deleted = 0
+        for path in self.paths:
+            conn = db.get_connection(path)
+            while True:
+                count = conn.execute('''
+                    DELETE FROM transfer_journal WHERE rowid IN (
+                        SELECT rowid FROM transfer_journal WHERE state != 'prepared' AND created_us < ? LIMIT ?)
+                ''', (cutoff, batch_size)).rowcount
+                conn.commit()
+                deleted += count
+                if count < batch_size:
+                    break
+        return deleted
+
+    def pending(self):
+        # Cross-shard transfers not yet settled on their source shard
+        return sum(db.get_connection(path).execute("SELECT COUNT(*) FROM transfer_journal WHERE state = 'prepared' AND role = 'source'").fetchone()[0]
+                   for path in self.paths)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(db_path='atm.db'):
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = AccountStore(db_path)
+            _stores[db_path] = store
+        return store
+
+
+def reshard(db_path='atm.db', shards=2, progress=None):
+    # Offline: move every account, with its transactions, to its shard
+    # under a layout of `shards` files, then record the layout. All
+    # terminals must be stopped first and restarted afterwards. Each move
+    # commits atomically across both files (rollback journal with ATTACH),
+    # and an interrupted run is finished by running it again. Files no
+    # longer in the layout are left in place, empty. progress, if given, is
+    # called with (source path, destination path, accounts moved). Returns
+    # the number of accounts moved.
+    if shards < 1:
+        raise ValueError("shards must be at least 1")
+    old_paths = shard_paths(db_path)
+    if AccountStore(db_path).pending():
+        raise LedgerError("Cross-shard transfers are still in progress; run recover first")
+    new_paths = [default_shard_path(db_path, shard) for shard in range(shards)]
+    created = [path for path in new_paths if not os.path.exists(path)]
+    for path in new_paths:
+        migrations.migrate(path, migrations.ATM_MIGRATIONS)
+    for path in created:
+        # The initial schema adds a sample account to every new file
+        conn = db.get_connection(path)
+        conn.execute('DELETE FROM accounts')
+        conn.commit()
+    # Switching out of WAL needs the files to ourselves
+    db.close_all()
+    with _stores_lock:
+        _stores.clear()
+    moved = 0
+    for source_path in dict.fromkeys(old_paths + new_paths):
+        conn = sqlite3.connect(source_path, isolation_level=None, timeout=30)
+        try:
+            conn.create_function("home", 1, lambda account_number: shard_of(account_number, shards), deterministic=True)
+            conn.execute('PRAGMA journal_mode = DELETE')
+            account_columns = ", ".join(migrations.columns(conn, 'accounts'))
+            transaction_columns = ", ".join(c for c in migrations.columns(conn, 'transactions') if c != 'id')
+            for shard, target_path in enumerate(new_paths):
+                if os.path.abspath(target_path) == os.path.abspath(source_path):
+                    continue
+                conn.execute('ATTACH DATABASE ? AS target', (target_path,))
+                try:
+                    conn.execute('PRAGMA target.journal_mode = DELETE')
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        count = conn.execute(f'''
+                            INSERT INTO target.accounts ({account_columns}) SELECT {account_columns} FROM main.accounts WHERE home(account_number) = ?
+                        ''', (shard,)).rowcount
+                        conn.execute(f'''
+                            INSERT INTO target.transactions ({transaction_columns})
+                            SELECT {transaction_columns} FROM main.transactions WHERE home(account_number) = ? ORDER BY id
+                        ''', (shard,))
+                        conn.execute('DELETE FROM main.transactions WHERE home(account_number) = ?', (shard,))
+                        conn.execute('DELETE FROM main.accounts WHERE home(account_number) = ?', (shard,))
+                    except BaseException:
+                        conn.execute('ROLLBACK')
+                        raise
+                    conn.execute('COMMIT')
+                    conn.execute('PRAGMA target.journal_mode = WAL')
+                finally:
+                    conn.execute('DETACH DATABASE target')
+                moved += count
+                if progress and count:
+                    progress((source_path, target_path, count))
+            conn.execute('PRAGMA journal_mode = WAL')
+        finally:
+            conn.close()
+    conn = db.get_connection(db_path)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM account_shards')
+        conn.executemany('INSERT INTO account_shards (shard, path) VALUES (?, ?)',
+                         [(shard, os.path.relpath(path, os.path.dirname(db_path) or '.')) for shard, path in enumerate(new_paths) if shard])
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return moved
+
+
+def leftover_files(db_path, paths):
+    # Shard files next to db_path that are not part of the layout
+    stem, ext = os.path.splitext(db_path)
+    in_use = {os.path.abspath(path) for path in paths}
+    return [path for path in sorted(glob.glob(f"{glob.escape(stem)}.shard*{ext}")) if os.path.abspath(path) not in in_use]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded ATM account store: reshard, settle interrupted transfers, show the layout")
+    parser.add_argument("--db", default="atm.db", help="primary database (shard 0)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    split = sub.add_parser("reshard", help="spread accounts over N shard files (stop all terminals first)")
+    split.add_argument("shards", type=int)
+    settle = sub.add_parser("recover", help="settle cross-shard transfers left prepared by a crash")
+    settle.add_argument("--older-than", type=float, default=60.0, help="only transfers prepared this many seconds ago")
+    settle.add_argument("--purge-days", type=int, default=None, help="also delete finished journal rows older than this")
+    sub.add_parser("status", help="show shard files and account counts")
+    args = parser.parse_args()
+    if args.command == "reshard":
+        start = time.perf_counter()
+        count = reshard(args.db, args.shards, lambda p: print(f"{p[0]} -> {p[1]}: {p[2]} accounts"))
+        print(f"Moved {count} accounts into {args.shards} shards in {time.perf_counter() - start:.2f}s")
+        for path in leftover_files(args.db, shard_paths(args.db)):
+            print(f"{path} is no longer used and can be removed", file=sys.stderr)
+    elif args.command == "recover":
+        store = AccountStore(args.db)
+        outcomes = store.recover(args.older_than)
+        print(f"Settled {sum(outcomes.values())} transfers: {outcomes['committed']} committed, {outcomes['aborted']} aborted")
+        if args.purge_days is not None:
+            print(f"Purged {store.purge(args.purge_days)} finished journal rows")
+    else:
+        store = AccountStore(args.db)
+        for shard, path in enumerate(store.paths):
+            count = db.get_connection(path).execute('SELECT COUNT(*) FROM accounts').fetchone()[0]
+            print(f"shard {shard}: {path} ({count} accounts)")
+        print(f"{store.pending()} cross-shard transfers pending")
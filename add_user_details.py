@@ -1,42 +1,23 @@
 import sqlite3
 import tkinter as tk
 from tkinter import messagebox
-import hashlib
+import account_store
+import credentials
+import db
+from money import format_money
+from tasks import TaskExecutor
 
-# Database setup with table recreation
+# Database setup
 def init_db():
-    conn = sqlite3.connect('atm.db')
-    cursor = conn.cursor()
-    try:
-        # Drop the existing table if it exists to recreate with new schema
-        cursor.execute("DROP TABLE IF EXISTS accounts")
-        cursor.execute('''
-            CREATE TABLE accounts (
-                account_number TEXT PRIMARY KEY,
-                pin_hash TEXT,
-                name TEXT,
-                phone_no TEXT,
-                balance REAL,
-                withdrawn_today REAL
-            )
-        ''')
-        # Optional: Add a sample account
-        cursor.execute('''
-            INSERT INTO accounts (account_number, pin_hash, name, phone_no, balance, withdrawn_today)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', ("123456", hashlib.sha256("7890".encode()).hexdigest(), "John Doe", "1234567890", 0.0, 0.0))
-        conn.commit()
-        print("Database table 'accounts' recreated successfully with new columns.")
-    except sqlite3.Error as e:
-        print(f"Error creating/updating table: {e}")
-    finally:
-        conn.close()
+    account_store.init_db('atm.db')
 
 class UserManager:
     def __init__(self, root):
         self.root = root
         self.root.title("Add User Details")
         self.root.configure(bg="#F5F5F5")
+        # PIN hashing and SQLite run here, off the Tk thread
+        self.tasks = TaskExecutor(self.root)
         self.create_add_user_screen()
 
     def create_add_user_screen(self):
@@ -66,34 +47,53 @@ class UserManager:
         pin = self.pin_entry.get()
 
         if acc_num and name and phone_no and pin:
-            conn = sqlite3.connect('atm.db')
-            cursor = conn.cursor()
-            try:
-                # Check if account already exists
-                cursor.execute('SELECT account_number, name, phone_no, balance FROM accounts WHERE account_number = ?', (acc_num,))
-                existing_account = cursor.fetchone()
-                if existing_account:
-                    existing_acc_num, existing_name, existing_phone, existing_balance = existing_account
-                    if name != existing_name or phone_no != existing_phone or pin != hashlib.sha256(self.pin_entry.get().encode()).hexdigest():
-                        messagebox.showerror("Error", f"Account {existing_acc_num} already exists with different details. Update not allowed.")
-                    else:
-                        message = f"Account {existing_acc_num} already exists.\nDetails: Name: {existing_name}, Phone: {existing_phone}, Balance: ₹{existing_balance:.2f}"
-                        messagebox.showinfo("Info", message)
-                else:
-                    cursor.execute('''
-                        INSERT INTO accounts (account_number, pin_hash, name, phone_no, balance, withdrawn_today)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (acc_num, hashlib.sha256(pin.encode()).hexdigest(), name, phone_no, 0.0, 0.0))
-                    conn.commit()
-                    messagebox.showinfo("Success", "User account created successfully!")
-                    self.clear_entries()
-            except sqlite3.Error as e:
-                messagebox.showerror("Error", f"Database error: {e}")
-            finally:
-                conn.close()
+            self.tasks.submit(self.add_user, acc_num, name, phone_no, pin, on_done=self.finish_add_user, on_error=self.add_user_failed)
         else:
             messagebox.showerror("Error", "All fields are required")
 
+    def add_user(self, acc_num, name, phone_no, pin):
+        # Runs as a task. New accounts go to their shard; returns
+        # ("created" / "exists" / "different", existing account row or None)
+        conn = db.get_connection(account_store.get_store('atm.db').path_for(acc_num))
+        cursor = conn.cursor()
+        try:
+            # Check if account already exists
+            cursor.execute('SELECT account_number, name, phone_no, balance_paise, pin_hash FROM accounts WHERE account_number = ?', (acc_num,))
+            existing_account = cursor.fetchone()
+            if existing_account:
+                existing_name, existing_phone, existing_pin_hash = existing_account[1], existing_account[2], existing_account[4]
+                if name != existing_name or phone_no != existing_phone or not credentials.verify_pin(pin, existing_pin_hash):
+                    return "different", existing_account
+                return "exists", existing_account
+            cursor.execute('''
+                INSERT INTO accounts (account_number, pin_hash, name, phone_no, balance_paise, withdrawn_today_paise)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (acc_num, credentials.hash_pin(pin), name, phone_no, 0, 0))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return "created", None
+
+    def finish_add_user(self, result):
+        outcome, existing_account = result
+        if outcome == "created":
+            messagebox.showinfo("Success", "User account created successfully!")
+            self.clear_entries()
+            return
+        existing_acc_num, existing_name, existing_phone, existing_balance, _ = existing_account
+        if outcome == "different":
+            messagebox.showerror("Error", f"Account {existing_acc_num} already exists with different details. Update not allowed.")
+        else:
+            message = f"Account {existing_acc_num} already exists.\nDetails: Name: {existing_name}, Phone: {existing_phone}, Balance: ₹{format_money(existing_balance)}"
+            messagebox.showinfo("Info", message)
+
+    def add_user_failed(self, error):
+        if isinstance(error, sqlite3.Error):
+            messagebox.showerror("Error", f"Database error: {error}")
+        else:
+            self.root.report_callback_exception(type(error), error, error.__traceback__)
+
     def clear_entries(self):
         self.acc_entry.delete(0, tk.END)
         self.name_entry.delete(0, tk.END)
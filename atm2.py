@@ -1,102 +1,24 @@
 import json
 import os
-from datetime import datetime
-import hashlib
 import random
-import sqlite3
 import tkinter as tk
 from tkinter import messagebox, simpledialog
-
-# Database setup
-def init_db():
-    conn = sqlite3.connect('atm.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS accounts (
-            account_number TEXT PRIMARY KEY,
-            pin_hash TEXT,
-            name TEXT,
-            phone_no TEXT,
-            balance REAL,
-            withdrawn_today REAL
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            account_number TEXT,
-            type TEXT,
-            amount REAL,
-            date TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-class Account:
-    def __init__(self, account_number, pin_hash, name, phone_no, balance=0.0, withdrawn_today=0.0):
-        self.account_number = account_number
-        self.pin_hash = pin_hash
-        self.name = name
-        self.phone_no = phone_no
-        self.balance = balance
-        self.withdrawn_today = withdrawn_today
-        self.daily_withdrawal_limit = 1000.0
-
-    def check_pin(self, pin):
-        return hashlib.sha256(pin.encode()).hexdigest() == self.pin_hash
-
-    def deposit(self, amount):
-        if amount > 0:
-            self.balance += amount
-            self.record_transaction("Deposit", amount)
-            return True
-        return False
-
-    def withdraw(self, amount):
-        if amount > 0 and amount <= self.balance and self.withdrawn_today + amount <= self.daily_withdrawal_limit:
-            self.balance -= amount
-            self.withdrawn_today += amount
-            self.record_transaction("Withdrawal", amount)
-            return True
-        return False
-
-    def transfer(self, target_account, amount):
-        if amount > 0 and amount <= self.balance:
-            self.balance -= amount
-            target_account.balance += amount
-            self.record_transaction("Transfer Out", amount)
-            target_account.record_transaction("Transfer In", amount)
-            return True
-        return False
-
-    def record_transaction(self, transaction_type, amount):
-        conn = sqlite3.connect('atm.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO transactions (account_number, type, amount, date)
-            VALUES (?, ?, ?, ?)
-        ''', (self.account_number, transaction_type, amount, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-        conn.commit()
-        conn.close()
-
-    def get_transaction_history(self):
-        conn = sqlite3.connect('atm.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT type, amount, date FROM transactions WHERE account_number = ? ORDER BY date DESC LIMIT 10
-        ''', (self.account_number,))
-        history = cursor.fetchall()
-        conn.close()
-        return history
+from atm_service import AtmService, init_db
+from ledger import LedgerError
+from money import format_money, to_paise
+from tasks import TaskExecutor
+from timestamps import format_us
 
 class ATM:
     def __init__(self):
+        self.service = AtmService('atm.db')
         self.current_account = None
         self.logged_in = False
         self.root = tk.Tk()
         self.root.title("ATM Interface")
         self.root.configure(bg="#F5F5F5")  # Light gray background
+        # Service calls (PIN hashing, SQLite) run here, off the Tk thread
+        self.tasks = TaskExecutor(self.root)
         self.create_welcome_screen()
 
     def create_welcome_screen(self):
@@ -121,26 +43,24 @@ class ATM:
     def login(self):
         acc_num = self.acc_entry.get()
         pin = self.pin_entry.get()
-        conn = sqlite3.connect('atm.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT pin_hash, balance, withdrawn_today, name, phone_no FROM accounts WHERE account_number = ?
-        ''', (acc_num,))
-        account_data = cursor.fetchone()
-        conn.close()
-        
-        if account_data and hashlib.sha256(pin.encode()).hexdigest() == account_data[0]:
-            otp = random.randint(100000, 999999)
-            print(f"Simulated OTP sent: {otp}")  # For simulation
-            entered_otp = simpledialog.askstring("OTP Verification", "Enter the OTP sent to your terminal:", parent=self.root)
-            if entered_otp and entered_otp == str(otp):
-                self.current_account = Account(acc_num, account_data[0], account_data[3], account_data[4], account_data[1], account_data[2])
-                self.logged_in = True
-                self.create_main_screen()
-            else:
-                messagebox.showerror("Error", "Invalid OTP", parent=self.root)
-        else:
+        self.tasks.submit(self.service.login, acc_num, pin, on_done=self.finish_login, on_error=self.login_failed)
+
+    def login_failed(self, error):
+        if isinstance(error, LedgerError):
             messagebox.showerror("Error", "Invalid account number or PIN", parent=self.root)
+        else:
+            self.root.report_callback_exception(type(error), error, error.__traceback__)
+
+    def finish_login(self, account):
+        otp = random.randint(100000, 999999)
+        print(f"Simulated OTP sent: {otp}")  # For simulation
+        entered_otp = simpledialog.askstring("OTP Verification", "Enter the OTP sent to your terminal:", parent=self.root)
+        if entered_otp and entered_otp == str(otp):
+            self.current_account = account
+            self.logged_in = True
+            self.create_main_screen()
+        else:
+            messagebox.showerror("Error", "Invalid OTP", parent=self.root)
 
     def create_main_screen(self):
         self.clear_screen()
@@ -166,7 +86,29 @@ class ATM:
         self.create_welcome_screen()
 
     def check_balance(self):
-        messagebox.showinfo("Balance", f"Current Balance: ₹{self.current_account.balance:.2f}")
+        self.tasks.submit(self.service.balance, self.current_account.account_number, on_done=self.show_balance, on_error=self.show_error)
+
+    def show_balance(self, balance):
+        self.current_account.balance = balance
+        messagebox.showinfo("Balance", f"Current Balance: ₹{format_money(self.current_account.balance)}")
+
+    def show_error(self, error):
+        if isinstance(error, LedgerError):
+            messagebox.showerror("Error", str(error))
+        else:
+            self.root.report_callback_exception(type(error), error, error.__traceback__)
+
+    def run_transaction(self, func, args, message):
+        # message() gives the (title, text) shown once the ledger call has committed
+        def done(result):
+            self.current_account.balance, self.current_account.withdrawn_today, self.current_account.version = result
+            messagebox.showinfo(*message())
+            self.create_main_screen()
+
+        def failed(error):
+            self.show_error(error)
+            self.create_main_screen()
+        self.tasks.submit(func, *args, on_done=done, on_error=failed)
 
     def deposit(self):
         self.clear_screen()
@@ -180,15 +122,13 @@ class ATM:
 
     def process_deposit(self, amount):
         try:
-            amount = float(amount)
-            if self.current_account.deposit(amount):
-                self.update_account()
-                messagebox.showinfo("Deposit", f"Deposited ₹{amount:.2f}. New balance: ₹{self.current_account.balance:.2f}")
-            else:
-                messagebox.showerror("Error", "Invalid amount")
+            amount = to_paise(amount)
         except ValueError:
             messagebox.showerror("Error", "Please enter a valid number")
-        self.create_main_screen()
+            self.create_main_screen()
+            return
+        self.run_transaction(self.service.deposit, (self.current_account.account_number, amount),
+                             lambda: ("Deposit", f"Deposited ₹{format_money(amount)}. New balance: ₹{format_money(self.current_account.balance)}"))
 
     def withdraw(self):
         self.clear_screen()
@@ -202,15 +142,13 @@ class ATM:
 
     def process_withdraw(self, amount):
         try:
-            amount = float(amount)
-            if self.current_account.withdraw(amount):
-                self.update_account()
-                messagebox.showinfo("Withdraw", "Withdrawal successful")
-            else:
-                messagebox.showerror("Error", "Invalid amount or insufficient funds")
+            amount = to_paise(amount)
         except ValueError:
             messagebox.showerror("Error", "Please enter a valid number")
-        self.create_main_screen()
+            self.create_main_screen()
+            return
+        self.run_transaction(self.service.withdraw, (self.current_account.account_number, amount),
+                             lambda: ("Withdraw", "Withdrawal successful"))
 
     def transfer(self):
         self.clear_screen()
@@ -227,44 +165,25 @@ class ATM:
 
     def process_transfer(self, amount, target_acc):
         try:
-            amount = float(amount)
-            conn = sqlite3.connect('atm.db')
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT balance FROM accounts WHERE account_number = ?
-            ''', (target_acc,))
-            target_data = cursor.fetchone()
-            if target_data:
-                target_account = Account(target_acc, "", target_data[0])
-                if self.current_account.transfer(target_account, amount):
-                    self.update_account()
-                    conn.execute('''
-                        UPDATE accounts SET balance = ? WHERE account_number = ?
-                    ''', (target_account.balance, target_acc))
-                    conn.commit()
-                    messagebox.showinfo("Transfer", "Transfer successful")
-                else:
-                    messagebox.showerror("Error", "Invalid amount or insufficient funds")
-            else:
-                messagebox.showerror("Error", "Target account not found")
-            conn.close()
+            amount = to_paise(amount)
         except ValueError:
             messagebox.showerror("Error", "Please enter a valid number")
-        self.create_main_screen()
-
-    def transaction_history(self):
-        history = self.current_account.get_transaction_history()
-        history_str = "\n".join([f"{trans[2]} - {trans[0]}: ₹{trans[1]:.2f}" for trans in history])
-        messagebox.showinfo("Transaction History", history_str if history else "No transactions yet")
-
-    def update_account(self):
-        conn = sqlite3.connect('atm.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE accounts SET balance = ?, withdrawn_today = ? WHERE account_number = ?
-        ''', (self.current_account.balance, self.current_account.withdrawn_today, self.current_account.account_number))
-        conn.commit()
-        conn.close()
+            self.create_main_screen()
+            return
+        self.run_transaction(self.service.transfer, (self.current_account.account_number, target_acc, amount),
+                             lambda: ("Transfer", "Transfer successful"))
+
+    def transaction_history(self, cursor=None):
+        self.tasks.submit(self.service.history_page, self.current_account.account_number, 10, cursor,
+                          on_done=self.show_history_page, on_error=self.show_error)
+
+    def show_history_page(self, page):
+        history, cursor = page
+        history_str = "\n".join([f"{format_us(trans[3])} - {trans[1]}: ₹{format_money(trans[2])}" for trans in history])
+        if not cursor:
+            messagebox.showinfo("Transaction History", history_str if history else "No transactions yet")
+        elif messagebox.askyesno("Transaction History", history_str + "\n\nShow older transactions?"):
+            self.transaction_history(cursor)
 
     def change_pin(self):
         self.clear_screen()
@@ -281,40 +200,34 @@ class ATM:
         tk.Button(change_pin_frame, text="Back", command=self.create_main_screen, bg="#757575", fg="white").pack(pady=5)
 
     def process_change_pin(self, current_pin, new_pin):
-        if self.current_account.check_pin(current_pin):
+        self.tasks.submit(self.current_account.check_pin, current_pin,
+                          on_done=lambda ok: self.confirm_change_pin(ok, current_pin, new_pin), on_error=self.show_error)
+
+    def confirm_change_pin(self, pin_ok, current_pin, new_pin):
+        if pin_ok:
             otp = random.randint(100000, 999999)
             print(f"Simulated OTP sent: {otp}")  # For simulation
             entered_otp = simpledialog.askstring("OTP Verification", "Enter the OTP sent to your email:", parent=self.root)
             if entered_otp and entered_otp == str(otp):
-                if len(new_pin) >= 4:  # Minimum 4 digits for security
-                    new_pin_hash = hashlib.sha256(new_pin.encode()).hexdigest()
-                    conn = sqlite3.connect('atm.db')
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        UPDATE accounts SET pin_hash = ? WHERE account_number = ?
-                    ''', (new_pin_hash, self.current_account.account_number))
-                    conn.commit()
-                    conn.close()
-                    self.current_account.pin_hash = new_pin_hash
-                    messagebox.showinfo("Success", "PIN changed successfully")
-                else:
-                    messagebox.showerror("Error", "New PIN must be at least 4 digits")
+                self.tasks.submit(self.service.change_pin, self.current_account.account_number, current_pin, new_pin,
+                                  on_done=self.finish_change_pin, on_error=self.change_pin_failed)
+                return
             else:
                 messagebox.showerror("Error", "Invalid OTP")
         else:
             messagebox.showerror("Error", "Incorrect current PIN")
         self.create_main_screen()
 
+    def finish_change_pin(self, pin_hash):
+        self.current_account.pin_hash = pin_hash
+        messagebox.showinfo("Success", "PIN changed successfully")
+        self.create_main_screen()
+
+    def change_pin_failed(self, error):
+        self.show_error(error)
+        self.create_main_screen()
+
 if __name__ == "__main__":
     init_db()
-    # Create sample account if not exists
-    conn = sqlite3.connect('atm.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR IGNORE INTO accounts (account_number, pin_hash, name, phone_no, balance, withdrawn_today)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', ("123456", hashlib.sha256("7890".encode()).hexdigest(), "John Doe", "1234567890", 1000.0, 0.0))
-    conn.commit()
-    conn.close()
     atm = ATM()
     atm.root.mainloop()
@@ -0,0 +1,256 @@
+import argparse
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import account_store
+import credentials
+import db
+import timestamps
+from ledger import ConcurrentUpdate, LedgerError
+from withdrawal_limits import LimitTracker
+
+DAILY_WITHDRAWAL_LIMIT = 100000  # paise, i.e. ₹1000
+MAX_HISTORY_PAGE = 100
+CAS_ATTEMPTS = 5
+
+# Database setup: the primary file and any shard files
+def init_db(db_path='atm.db'):
+    account_store.init_db(db_path)
+
+
+class AuthenticationError(LedgerError):
+    pass
+
+
+# Snapshot of an account row as seen at login or after the last operation;
+# balance, withdrawn_today and the daily limit are integer paise; version
+# is the row version the snapshot was read at
+class Account:
+    def __init__(self, account_number, pin_hash, name, phone_no, balance=0, withdrawn_today=0, daily_withdrawal_limit=DAILY_WITHDRAWAL_LIMIT, version=0):
+        self.account_number = account_number
+        self.pin_hash = pin_hash
+        self.name = name
+        self.phone_no = phone_no
+        self.balance = balance
+        self.withdrawn_today = withdrawn_today
+        self.daily_withdrawal_limit = daily_withdrawal_limit
+        self.version = version
+
+    def check_pin(self, pin):
+        return credentials.verify_pin(pin, self.pin_hash)
+
+
+# All ATM business logic as plain calls, with no Tk dependency. The Tk ATM
+# and the asyncio server below are both clients of this class. Each
+# account's reads and writes go to its shard of the account store.
+class AtmService:
+    def __init__(self, db_path='atm.db'):
+        self.db_path = db_path
+        self.store = account_store.get_store(db_path)
+        self.limits = LimitTracker(db_path, DAILY_WITHDRAWAL_LIMIT)
+
+    def login(self, account_number, pin):
+        account = self.get_account(account_number)
+        if account is None:
+            raise AuthenticationError("Invalid account number or PIN")
+        ok, new_hash = credentials.verify_and_upgrade(pin, account.pin_hash)
+        if not ok:
+            raise AuthenticationError("Invalid account number or PIN")
+        if new_hash:
+            # Legacy or outdated hash: store the stronger one, unless the
+            # PIN was changed concurrently
+            if self.store.set_pin_hash(account_number, new_hash, account.version):
+                account.pin_hash = new_hash
+                account.version += 1
+        return account
+
+    def get_account(self, account_number):
+        cursor = db.get_connection(self.store.path_for(account_number)).cursor()
+        cursor.execute('''
+            SELECT pin_hash, name, phone_no, balance_paise, CASE WHEN withdrawal_day = ? THEN withdrawn_today_paise ELSE 0 END,
+                   COALESCE(daily_limit_paise, ?), version
+            FROM accounts WHERE account_number = ?
+        ''', (timestamps.local_day(), DAILY_WITHDRAWAL_LIMIT, account_number))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return Account(account_number, *row)
+
+    def balance(self, account_number):
+        account = self.get_account(account_number)
+        if account is None:
+            raise LedgerError("Account not found")
+        return account.balance
+
+    def deposit(self, account_number, amount):
+        return self.store.deposit(account_number, amount)
+
+    def withdraw(self, account_number, amount, daily_limit=None):
+        # The account's own limit unless one is given
+        if daily_limit is None:
+            daily_limit = self.limits.limit(account_number)
+        return self.store.withdraw(account_number, amount, daily_limit)
+
+    def transfer(self, account_number, target_account_number, amount):
+        return self.store.transfer(account_number, target_account_number, amount)
+
+    def history(self, account_number, limit=10):
+        rows, _ = self.history_page(account_number, limit)
+        return [row[1:] for row in rows]
+
+    def history_page(self, account_number, limit=10, cursor=None, start_date=None, end_date=None):
+        # Keyset pagination: pass the returned next_cursor back in to get the
+        # following (older) page. Dates are inclusive YYYY-MM-DD strings.
+        # Rows are (id, type, amount_paise, date_us); next_cursor is None on the last page.
+        sql = 'SELECT id, type, amount_paise, date_us FROM transactions WHERE account_number = ?'
+        params = [account_number]
+        if start_date or end_date:
+            conditions, params_range = timestamps.range_sql('date_us', start_date, end_date)
+            sql += ''.join(f' AND {condition}' for condition in conditions)
+            params.extend(params_range)
+            if cursor:
+                sql += ' AND (date_us, id) < (?, ?)'
+                params.extend(cursor)
+            sql += ' ORDER BY date_us DESC, id DESC LIMIT ?'
+        else:
+            if cursor:
+                sql += ' AND id < ?'
+                params.append(cursor[1])
+            sql += ' ORDER BY id DESC LIMIT ?'
+        params.append(limit)
+        rows = db.get_connection(self.store.path_for(account_number)).execute(sql, params).fetchall()
+        next_cursor = (rows[-1][3], rows[-1][0]) if len(rows) == limit else None
+        return rows, next_cursor
+
+    def change_pin(self, account_number, current_pin, new_pin):
+        account = self.login(account_number, current_pin)
+        if len(new_pin) < 4:  # Minimum 4 digits for security
+            raise LedgerError("New PIN must be at least 4 digits")
+        new_pin_hash = credentials.hash_pin(new_pin)
+        for attempt in range(CAS_ATTEMPTS):
+            if attempt:
+                # Someone else wrote the account since it was read: check
+                # the current PIN against the row as it is now
+                account = self.login(account_number, current_pin)
+            if self.store.set_pin_hash(account_number, new_pin_hash, account.version):
+                return new_pin_hash
+        raise ConcurrentUpdate("The account is busy on another terminal; please try again")
+
+
+def paise(value):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError("amount must be an integer number of paise")
+    return value
+
+
+def history_limit(value):
+    # Page size from a client, clamped to 1..MAX_HISTORY_PAGE
+    return min(max(int(value), 1), MAX_HISTORY_PAGE)
+
+
+def history_cursor(value):
+    # A next_cursor sent back by a client: [date_us, id] or null
+    if value is None:
+        return None
+    if not (isinstance(value, (list, tuple)) and len(value) == 2
+            and all(isinstance(v, int) and not isinstance(v, bool) for v in value)):
+        raise ValueError("cursor must be a [date_us, id] pair of integers")
+    return tuple(value)
+
+
+# Line-delimited JSON front end. Every client connection is one terminal
+# session; requests look like {"op": "deposit", "amount": 10000} and replies
+# like {"ok": true, "result": ...} or {"ok": false, "error": "..."}.
+# Amounts and balances are integer paise.
+class AtmServer:
+    def __init__(self, service, max_workers=32):
+        self.service = service
+        # SQLite calls block, so they run on worker threads, each holding
+        # its own pooled connection, while the event loop serves sessions
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="atm-worker")
+
+    async def handle_session(self, reader, writer):
+        session = {"account_number": None}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    result = await self.dispatch(session, request)
+                    reply = {"ok": True, "result": result}
+                except LedgerError as e:
+                    reply = {"ok": False, "error": str(e)}
+                except (ValueError, KeyError, TypeError) as e:
+                    reply = {"ok": False, "error": f"Bad request: {e}"}
+                except sqlite3.Error as e:
+                    # e.g. still busy after every retry; the session goes on
+                    reply = {"ok": False, "error": f"Database error: {e}"}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, session, request):
+        op = request["op"]
+        account_number = session["account_number"]
+        if op == "login":
+            account = await self.call(self.service.login, str(request["account_number"]), str(request["pin"]))
+            session["account_number"] = account.account_number
+            return {"name": account.name, "balance": account.balance}
+        if op == "logout":
+            session["account_number"] = None
+            return None
+        if account_number is None:
+            raise AuthenticationError("Not logged in")
+        if op == "balance":
+            return await self.call(self.service.balance, account_number)
+        if op == "deposit":
+            return (await self.call(self.service.deposit, account_number, paise(request["amount"])))[0]
+        if op == "withdraw":
+            return (await self.call(self.service.withdraw, account_number, paise(request["amount"])))[0]
+        if op == "transfer":
+            return (await self.call(self.service.transfer, account_number, str(request["target"]), paise(request["amount"])))[0]
+        if op == "history":
+            rows, next_cursor = await self.call(
+                self.service.history_page, account_number, history_limit(request.get("limit", 10)),
+                history_cursor(request.get("cursor")), request.get("start_date"), request.get("end_date"))
+            return {
+                "rows": [{"id": row[0], "type": row[1], "amount": row[2], "date": timestamps.format_us(row[3]), "date_us": row[3]} for row in rows],
+                "next_cursor": next_cursor,
+            }
+        if op == "change_pin":
+            await self.call(self.service.change_pin, account_number, str(request["current_pin"]), str(request["new_pin"]))
+            return None
+        raise ValueError(f"unknown op {op!r}")
+
+    async def call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def serve(self, host="127.0.0.1", port=8765, unix_path=None):
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle_session, path=unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_session, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless ATM service")
+    parser.add_argument("--db", default="atm.db", help="primary database; shard files are found from it")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="serve on a Unix socket path instead of TCP")
+    parser.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args()
+    init_db(args.db)
+    server = AtmServer(AtmService(args.db), max_workers=args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
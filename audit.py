@@ -0,0 +1,195 @@
+import argparse
+import atexit
+import os
+import sqlite3
+import threading
+import time
+import db
+import migrations
+from timestamps import US_PER_SECOND, now_us
+
+INSERT_SQL = 'INSERT INTO audit_logs (action, details, user, timestamp_us) VALUES (?, ?, ?, ?)'
+
+
+# Collects audit events for one database. Rows are
+# (action, details, user, timestamp_us).
+#
+# add() buffers an event and returns at once; a background thread writes
+# the buffer in one transaction when it reaches batch_size or every
+# flush_interval seconds, and at exit. Events still buffered when the
+# process dies are lost, so it is meant for high-rate events like sales.
+#
+# write(cursor, rows) is for events that must not be lost. When the audit
+# table lives in the business database they are inserted through the
+# caller's cursor, inside its transaction. With a separate audit file they
+# are written to it straight away, before the caller commits.
+class AuditSink:
+    def __init__(self, audit_path, shared, batch_size=500, flush_interval=1.0):
+        self.audit_path = audit_path
+        self.shared = shared
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.flushed = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def add(self, action, details, user, timestamp_us=None):
+        self.add_many([(action, details, user, timestamp_us or now_us())])
+
+    def add_many(self, rows):
+        with self._lock:
+            self._buffer.extend(rows)
+            full = len(self._buffer) >= self.batch_size
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-flush", daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def write(self, cursor, rows):
+        if self.shared:
+            cursor.executemany(INSERT_SQL, rows)
+        else:
+            self.add_many(rows)
+            self.flush()
+
+    def flush(self):
+        # Writes everything buffered so far; returns the number of rows.
+        # Must not be called from inside a transaction on the audit file.
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            if not rows:
+                return 0
+            if not self.shared:
+                migrations.migrate(self.audit_path, migrations.AUDIT_MIGRATIONS)
+            conn = db.get_connection(self.audit_path)
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.executemany(INSERT_SQL, rows)
+            except BaseException:
+                conn.rollback()
+                with self._lock:
+                    self._buffer[:0] = rows
+                raise
+            conn.commit()
+            self.flushed += len(rows)
+            return len(rows)
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error:
+                pass  # the rows stay buffered and are retried on the next tick
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_sink(db_path):
+    # The sink for events about db_path; by default they go to its own
+    # audit_logs table
+    with _sinks_lock:
+        sink = _sinks.get(db_path)
+        if sink is None:
+            sink = AuditSink(db_path, True)
+            _sinks[db_path] = sink
+        return sink
+
+
+def configure(db_path, audit_path=None, batch_size=500, flush_interval=1.0):
+    # Replace the sink for db_path, e.g. to keep audit events in a separate
+    # file so their writes do not take the business database's write lock
+    audit_path = audit_path or db_path
+    shared = os.path.abspath(audit_path) == os.path.abspath(db_path)
+    with _sinks_lock:
+        old = _sinks.pop(db_path, None)
+        sink = AuditSink(audit_path, shared, batch_size, flush_interval)
+        _sinks[db_path] = sink
+    if old is not None:
+        old.close()
+    return sink
+
+
+def close(db_path):
+    with _sinks_lock:
+        sink = _sinks.pop(db_path, None)
+    if sink is not None:
+        sink.close()
+
+
+def close_all():
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+        _sinks.clear()
+    for sink in sinks:
+        sink.close()
+
+
+atexit.register(close_all)
+
+
+def rotate(audit_path, older_than_days=90, archive_path=None, batch_size=10000):
+    # Moves audit rows older than older_than_days into archive_path (or
+    # deletes them if there is none), oldest first in short transactions.
+    # Returns the number of rows moved.
+    cutoff = now_us() - older_than_days * 86400 * US_PER_SECOND
+    if archive_path:
+        migrations.migrate(archive_path, migrations.AUDIT_MIGRATIONS)
+    conn = sqlite3.connect(audit_path, timeout=5)
+    moved = 0
+    try:
+        if archive_path:
+            conn.execute('ATTACH DATABASE ? AS archive', (archive_path,))
+        batch = 'SELECT id FROM main.audit_logs WHERE timestamp_us < ? ORDER BY id LIMIT ?'
+        while True:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if archive_path:
+                    conn.execute(f'''
+                        INSERT INTO archive.audit_logs (id, action, details, user, timestamp_us)
+                        SELECT id, action, details, user, timestamp_us FROM main.audit_logs WHERE id IN ({batch})
+                    ''', (cutoff, batch_size))
+                count = conn.execute(f'DELETE FROM main.audit_logs WHERE id IN ({batch})', (cutoff, batch_size)).rowcount
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+            moved += count
+            if count < batch_size:
+                return moved
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old audit log rows into an archive database")
+    parser.add_argument("--db", default="inventory.db", help="database holding audit_logs")
+    parser.add_argument("--days", type=int, default=90, help="keep this many days")
+    parser.add_argument("--archive", help="archive database (default: <db>-audit-archive.db); use --delete to drop rows instead")
+    parser.add_argument("--delete", action="store_true")
+    args = parser.parse_args()
+    archive = None if args.delete else args.archive or f"{os.path.splitext(args.db)[0]}-audit-archive.db"
+    start = time.perf_counter()
+    count = rotate(args.db, args.days, archive)
+    print(f"{'Deleted' if archive is None else 'Archived'} {count} audit rows older than {args.days} days in {time.perf_counter() - start:.2f}s"
+          + (f" ({archive})" if archive else ""))
@@ -0,0 +1,217 @@
+import argparse
+import glob
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime
+import account_store
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIONS = ("gzip", "zstd")
+SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+# Raised when the copy fails PRAGMA integrity_check
+class BackupError(sqlite3.DatabaseError):
+    pass
+
+
+def backup(db_path, dest_path, compress=None, progress=None, verify=True, source=None):
+    # Hot copy of db_path to dest_path while the application keeps running.
+    # VACUUM INTO copies a single read snapshot, so in WAL mode writers are
+    # never held up and, unlike a paged backup, a busy database cannot make
+    # the copy start over. progress, if given, is called now and then with
+    # (pages written, total pages); if it raises, the copy stops. The copy
+    # is checked with PRAGMA integrity_check and then optionally compressed
+    # ("gzip" or "zstd"; default from a .gz/.zst dest_path). dest_path only
+    # appears once the backup is complete. source, if given, is a connection
+    # to db_path inside a read transaction (see snapshot()); the copy is then
+    # taken from that snapshot instead. Returns the size of dest_path in
+    # bytes.
+    if compress is None:
+        compress = next((name for name, suffix in SUFFIXES.items() if suffix and dest_path.endswith(suffix)), None)
+    if compress not in SUFFIXES:
+        raise ValueError(f"Unknown compression: {compress}")
+    if compress == "zstd" and zstandard is None:
+        raise RuntimeError("zstd backups need the zstandard package (pip install zstandard)")
+    copy_path = dest_path + ".partial"
+    if os.path.exists(copy_path):
+        os.remove(copy_path)
+    try:
+        if source is None:
+            _vacuum_into(db_path, copy_path, progress)
+        else:
+            _copy_snapshot(source, copy_path, progress)
+        target = sqlite3.connect(copy_path)
+        try:
+            if verify:
+                problems = [row[0] for row in target.execute('PRAGMA integrity_check')]
+                if problems != ["ok"]:
+                    raise BackupError(f"Backup of {db_path} failed integrity check: {'; '.join(problems[:5])}")
+            # A backup of a WAL database is in WAL mode too; make the copy a
+            # single self-contained file
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+        if compress:
+            packed_path = copy_path + SUFFIXES[compress]
+            with open(copy_path, "rb") as src, _open_compressed(packed_path, compress) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.remove(copy_path)
+            copy_path = packed_path
+        os.replace(copy_path, dest_path)
+    except BaseException:
+        for path in (copy_path, dest_path + ".partial"):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    return os.path.getsize(dest_path)
+
+
+def _vacuum_into(db_path, copy_path, progress):
+    source = sqlite3.connect(db_path, timeout=30)
+    stopped = []
+    try:
+        page_size = source.execute('PRAGMA page_size').fetchone()[0]
+        total = source.execute('PRAGMA page_count').fetchone()[0]
+
+        def report():
+            try:
+                written = os.path.getsize(copy_path) // page_size if os.path.exists(copy_path) else 0
+                progress((min(written, total), total))
+            except BaseException as e:
+                stopped.append(e)
+                return 1  # interrupts the VACUUM
+            return 0
+        if progress:
+            source.set_progress_handler(report, 100000)
+        try:
+            source.execute('VACUUM INTO ?', (copy_path,))
+        except sqlite3.OperationalError:
+            if stopped:
+                raise stopped[0]
+            raise
+        if progress:
+            progress((total, total))
+    finally:
+        source.close()
+
+
+def _copy_snapshot(source, copy_path, progress):
+    # The backup API reads through source's open read transaction, so the
+    # copy is that snapshot however many steps it takes
+    target = sqlite3.connect(copy_path)
+    try:
+        source.backup(target, pages=25600, progress=(lambda status, remaining, total: progress((total - remaining, total))) if progress else None)
+    finally:
+        target.close()
+
+
+def snapshot(paths):
+    # One read transaction per file, all opened at the same moment: writers
+    # to every file are held off (BEGIN IMMEDIATE, in order) just long
+    # enough to open them. For the shards of an ATM store this is a
+    # consistent cut, with no cross-shard transfer half-applied beyond what
+    # the transfer journals record. Returns the reading connections; close
+    # them when done.
+    locks = []
+    readers = []
+    try:
+        for path in paths:
+            lock = sqlite3.connect(path, isolation_level=None, timeout=30)
+            locks.append(lock)
+            lock.execute('BEGIN IMMEDIATE')
+        for path in paths:
+            reader = sqlite3.connect(path, isolation_level=None, timeout=30)
+            readers.append(reader)
+            reader.execute('BEGIN')
+            reader.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+    except BaseException:
+        for reader in readers:
+            reader.close()
+        raise
+    finally:
+        for lock in locks:
+            lock.close()
+    return readers
+
+
+def _open_compressed(path, compress):
+    if compress == "gzip":
+        return gzip.open(path, "wb", compresslevel=6)
+    return zstandard.ZstdCompressor(level=3).stream_writer(open(path, "wb"), closefd=True)
+
+
+def backup_name(db_path, directory, compress=None, when=None):
+    # <directory>/<db name>-YYYYMMDD-HHMMSS.db[.gz|.zst]
+    stem, ext = os.path.splitext(os.path.basename(db_path))
+    stamp = (when or datetime.now()).strftime("%Y%m%d-%H%M%S")
+    return os.path.join(directory, f"{stem}-{stamp}{ext}{SUFFIXES[compress]}")
+
+
+def prune(db_path, directory, keep):
+    # Delete all but the newest keep backups of db_path in directory;
+    # returns the deleted paths
+    stem, ext = os.path.splitext(os.path.basename(db_path))
+    pattern = os.path.join(glob.escape(directory), f"{glob.escape(stem)}-????????-??????{ext}*")
+    backups = sorted(path for path in glob.glob(pattern) if not path.endswith(".partial"))
+    old = backups[:-keep] if keep > 0 else backups
+    for path in old:
+        os.remove(path)
+    return old
+
+
+def backup_to(db_path, directory, compress=None, keep=None, progress=None):
+    # Timestamped backups in directory, then retention; returns their paths.
+    # For a sharded ATM database every shard file is backed up under the
+    # same timestamp, all from one snapshot(). Transfers in flight at that
+    # moment are still prepared in the source shard's journal, so after a
+    # restore "account_store.py recover" commits or refunds them.
+    os.makedirs(directory, exist_ok=True)
+    when = datetime.now()
+    files = account_store.store_files(db_path)
+    sources = snapshot(files) if len(files) > 1 else [None]
+    paths = []
+    try:
+        for path, source in zip(files, sources):
+            dest = backup_name(path, directory, compress, when)
+            backup(path, dest, compress, progress=progress, source=source)
+            paths.append(dest)
+    finally:
+        for source in sources:
+            if source is not None:
+                source.close()
+    if keep:
+        for path in files:
+            prune(path, directory, keep)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hot backup of inventory.db / atm.db, optionally on a schedule")
+    parser.add_argument("db", nargs="+", help="database files, e.g. inventory.db atm.db")
+    parser.add_argument("--dir", default="backups")
+    parser.add_argument("--compress", choices=COMPRESSIONS)
+    parser.add_argument("--keep", type=int, default=None, help="keep only this many backups per database")
+    parser.add_argument("--every", type=float, default=None, help="repeat every N minutes until interrupted")
+    args = parser.parse_args()
+    while True:
+        for path in args.db:
+            start = time.perf_counter()
+            try:
+                dests = backup_to(path, args.dir, args.compress, args.keep)
+            except (OSError, RuntimeError, sqlite3.Error) as e:
+                print(f"{path}: backup failed: {e}", file=sys.stderr)
+                continue
+            size = sum(os.path.getsize(dest) for dest in dests)
+            print(f"{path} -> {', '.join(dests)} ({size / 1048576:.1f} MB in {time.perf_counter() - start:.2f}s)")
+        if not args.every:
+            break
+        time.sleep(args.every * 60)
@@ -0,0 +1,174 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import account_store
+import credentials
+import db
+from atm_service import init_db
+from money import to_paise
+
+FIELDS = ["account_number", "name", "phone_no", "pin", "balance"]
+
+INSERT_SQL = '''
+    INSERT INTO accounts (account_number, pin_hash, name, phone_no, balance_paise, withdrawn_today_paise)
+    VALUES (?, ?, ?, ?, ?, 0)
+'''
+ON_CONFLICT = {
+    "skip": " ON CONFLICT(account_number) DO NOTHING",
+    "update": " ON CONFLICT(account_number) DO UPDATE SET pin_hash = excluded.pin_hash, name = excluded.name, phone_no = excluded.phone_no,"
+              " version = version + 1",
+}
+
+
+def read_rows(path, file_format):
+    # Streams dicts from a CSV (with a header row) or JSONL file
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError as e:
+                        yield {"__error__": f"invalid JSON: {e}"}
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validate(row):
+    # Returns (account_number, name, phone_no, pin, balance in paise) or raises ValueError
+    if "__error__" in row:
+        raise ValueError(row["__error__"])
+    account_number = str(row.get("account_number") or "").strip()
+    name = str(row.get("name") or "").strip()
+    phone_no = str(row.get("phone_no") or "").strip()
+    pin = str(row.get("pin") or "").strip()
+    if not (account_number and name and phone_no and pin):
+        raise ValueError("account_number, name, phone_no and pin are required")
+    if len(pin) < 4:
+        raise ValueError("PIN must be at least 4 digits")
+    balance = to_paise(row.get("balance") or 0)
+    if balance < 0:
+        raise ValueError("balance cannot be negative")
+    return account_number, name, phone_no, pin, balance
+
+
+def existing_accounts(cursor, account_numbers):
+    found = set()
+    numbers = list(account_numbers)
+    # Stay under SQLite's bound-parameter limit
+    for i in range(0, len(numbers), 900):
+        part = numbers[i:i + 900]
+        cursor.execute(f'SELECT account_number FROM accounts WHERE account_number IN ({",".join("?" * len(part))})', part)
+        found.update(r[0] for r in cursor.fetchall())
+    return found
+
+
+def load(path, db_path='atm.db', file_format=None, batch_size=5000, workers=None, on_conflict="skip", rejects_path=None):
+    file_format = file_format or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+    init_db(db_path)
+    store = account_store.get_store(db_path)
+    sql = INSERT_SQL + ON_CONFLICT[on_conflict]
+    rejects_file = open(rejects_path, "w", newline='', encoding='utf-8') if rejects_path else None
+    rejects = csv.writer(rejects_file) if rejects_file else None
+    if rejects:
+        rejects.writerow(["row"] + FIELDS + ["error"])
+    stats = {"read": 0, "inserted": 0, "updated": 0, "rejected": 0}
+    start = time.perf_counter()
+
+    def reject(row_no, row, error):
+        stats["rejected"] += 1
+        if rejects:
+            rejects.writerow([row_no] + [row.get(f, "") if isinstance(row, dict) else "" for f in FIELDS] + [error])
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            row_no = 0
+            for chunk in chunked(read_rows(path, file_format), batch_size):
+                valid = []
+                seen = set()
+                for row in chunk:
+                    row_no += 1
+                    stats["read"] += 1
+                    try:
+                        record = validate(row)
+                    except (ValueError, AttributeError, TypeError) as e:
+                        reject(row_no, row, str(e))
+                        continue
+                    if record[0] in seen:
+                        reject(row_no, row, "duplicate account_number in file")
+                        continue
+                    seen.add(record[0])
+                    valid.append((row_no, row, record))
+
+                if on_conflict == "skip":
+                    # Don't spend hashing time on rows that would be skipped
+                    taken = set()
+                    for shard_path in store.paths:
+                        taken |= existing_accounts(db.get_connection(shard_path).cursor(), [n for n in seen if store.path_for(n) == shard_path])
+                    for item in [v for v in valid if v[2][0] in taken]:
+                        reject(item[0], item[1], "account already exists")
+                    valid = [v for v in valid if v[2][0] not in taken]
+
+                pins = [v[2][3] for v in valid]
+                hashes = list(pool.map(credentials.hash_pin, pins, chunksize=max(1, len(pins) // (4 * (workers or os.cpu_count() or 1)))))
+                params = [(r[0], h, r[1], r[2], r[4]) for (_, _, r), h in zip(valid, hashes)]
+
+                # One transaction per shard the chunk touches
+                for shard_path in store.paths:
+                    shard_params = [p for p in params if store.path_for(p[0]) == shard_path]
+                    if not shard_params:
+                        continue
+                    conn = db.get_connection(shard_path)
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        # Rows already there are updated in update mode and
+                        # left alone in skip mode; either way they are not new
+                        updated = len(existing_accounts(conn.cursor(), [p[0] for p in shard_params])) if on_conflict == "update" else 0
+                        before = conn.total_changes
+                        conn.executemany(sql, shard_params)
+                        changed = conn.total_changes - before
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    conn.commit()
+                    stats["inserted"] += changed - updated
+                    stats["updated"] += updated
+                elapsed = time.perf_counter() - start
+                print(f"{stats['read']} rows read, {stats['inserted']} inserted, {stats['updated']} updated, {stats['rejected']} rejected"
+                      f" ({stats['read'] / elapsed:.0f} rows/sec)", file=sys.stderr)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-create ATM accounts from a CSV or JSONL file with columns " + ", ".join(FIELDS))
+    parser.add_argument("path")
+    parser.add_argument("--db", default="atm.db")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per transaction")
+    parser.add_argument("--workers", type=int, default=None, help="PIN hashing processes (default: CPU count)")
+    parser.add_argument("--on-conflict", choices=sorted(ON_CONFLICT), default="skip",
+                        help="skip existing accounts (reported as rejects) or update their name, phone and PIN")
+    parser.add_argument("--rejects", default="rejects.csv", help="where to write rows that could not be loaded")
+    args = parser.parse_args()
+    stats = load(args.path, args.db, args.format, args.batch_size, args.workers, args.on_conflict, args.rejects)
+    rate = stats["read"] / stats["seconds"] if stats["seconds"] else 0.0
+    print(f"Done: {stats['inserted']} accounts inserted, {stats['updated']} updated, {stats['rejected']} rejected in {stats['seconds']:.1f}s ({rate:.0f} rows/sec)")
@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import OrderedDict
+
+_caches = []
+_caches_lock = threading.Lock()
+
+
+# A read-through LRU cache with a time-to-live, safe to share between
+# worker threads. get(key, load) returns the cached value or calls
+# load(key) and keeps the result. Writers call invalidate() or clear()
+# after they commit; a load that was running while that happened is not
+# stored, so an old read can never overwrite the invalidation.
+class LookupCache:
+    def __init__(self, name, maxsize=1024, ttl=60):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires, value)
+        self._generation = 0
+        self._lock = threading.Lock()
+        with _caches_lock:
+            _caches.append(self)
+
+    def get(self, key, load):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+        value = load(key)
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def metrics():
+    # Hit/miss counters of every cache in the process, by name
+    with _caches_lock:
+        caches = list(_caches)
+    return {c.name: c.stats() for c in caches}
@@ -0,0 +1,133 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+import audit
+import db
+import migrations
+from inventory_import import INSERT_TRANSACTION_SQL
+from timestamps import now_us
+
+# The guard makes the decrement and the stock check one statement, so two
+# tills selling the last unit cannot both succeed
+DECREMENT_SQL = 'UPDATE products SET quantity = quantity - ? WHERE id = ? AND quantity >= ? RETURNING price_paise'
+
+
+# Raised when an order cannot be filled; nothing of it was sold.
+# shortages is a list of (product_id, wanted, in stock or None if unknown).
+class OrderError(ValueError):
+    def __init__(self, message, shortages=()):
+        super().__init__(message)
+        self.shortages = list(shortages)
+
+
+def merge_lines(lines):
+    # (product_id, quantity) lines -> [(product_id, total quantity)] in id
+    # order; the same product on two lines is sold as one
+    basket = {}
+    for product_id, quantity in lines:
+        product_id, quantity = int(product_id), int(quantity)
+        if quantity <= 0:
+            raise OrderError(f"Quantity for product ID {product_id} must be positive")
+        basket[product_id] = basket.get(product_id, 0) + quantity
+    if not basket:
+        raise OrderError("The order is empty")
+    return sorted(basket.items())
+
+
+def describe_shortages(shortages):
+    return "; ".join(f"Product ID {product_id} not found" if stock is None else
+                     f"Insufficient stock for product ID {product_id}: {stock} left, {wanted} ordered"
+                     for product_id, wanted, stock in shortages)
+
+
+def checkout(lines, db_path='inventory.db', user="admin"):
+    # Sells every line of the order in one transaction or none of them.
+    # Returns [(product_id, quantity, price_paise)] as sold.
+    basket = merge_lines(lines)
+    conn = db.get_connection(db_path)
+    cursor = conn.cursor()
+    now = now_us()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        sold, short = [], []
+        for product_id, quantity in basket:
+            row = cursor.execute(DECREMENT_SQL, (quantity, product_id, quantity)).fetchone()
+            if row is None:
+                short.append((product_id, quantity))
+            else:
+                sold.append((product_id, quantity, row[0]))
+        if short:
+            shortages = []
+            for product_id, quantity in short:
+                stock = cursor.execute('SELECT quantity FROM products WHERE id = ?', (product_id,)).fetchone()
+                shortages.append((product_id, quantity, stock[0] if stock else None))
+            raise OrderError(describe_shortages(shortages), shortages)
+        cursor.executemany(INSERT_TRANSACTION_SQL,
+                           [(product_id, "Withdrawal", quantity, now, user, price) for product_id, quantity, price in sold])
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    # Sales are the busiest events, so their audit rows are written behind
+    audit.get_sink(db_path).add_many([("Sold", f"Product ID: {product_id}, Quantity: {quantity}", user, now) for product_id, quantity, _ in sold])
+    return sold
+
+
+def sell_one(product_id, quantity, db_path='inventory.db', user="admin"):
+    # The old way: one transaction per product, for comparison
+    conn = db.get_connection(db_path)
+    cursor = conn.cursor()
+    cursor.execute('BEGIN TRANSACTION')
+    try:
+        cursor.execute('SELECT quantity, price_paise FROM products WHERE id = ?', (product_id,))
+        current_quantity, price = cursor.fetchone()
+        if current_quantity < quantity:
+            raise OrderError("Insufficient stock")
+        cursor.execute('UPDATE products SET quantity = ? WHERE id = ?', (current_quantity - quantity, product_id))
+        cursor.execute(INSERT_TRANSACTION_SQL, (product_id, "Withdrawal", quantity, now_us(), user, price))
+        cursor.execute(audit.INSERT_SQL, ("Sold", f"Product ID: {product_id}, Quantity: {quantity}", user, now_us()))
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def benchmark(orders=500, products=5000, min_lines=20, max_lines=50, seed=1):
+    # Orders/sec for whole-order checkout and for selling line by line, on
+    # a scratch database so the real inventory is untouched
+    rng = random.Random(seed)
+    baskets = [[(rng.randint(1, products), rng.randint(1, 5)) for _ in range(rng.randint(min_lines, max_lines))]
+               for _ in range(orders)]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ("checkout", "per line"):
+            path = os.path.join(tmp, f"{name.replace(' ', '_')}.db")
+            migrations.migrate(path, migrations.INVENTORY_MIGRATIONS)
+            conn = db.get_connection(path)
+            conn.executemany('INSERT INTO products (name, quantity, price_paise, category, low_threshold) VALUES (?, ?, ?, ?, ?)',
+                             [(f"Product {i}", 10000, rng.randint(100, 100000), f"Category {i % 20}", 10) for i in range(products)])
+            conn.commit()
+            start = time.perf_counter()
+            for basket in baskets:
+                if name == "checkout":
+                    checkout(basket, path, "benchmark")
+                else:
+                    for product_id, quantity in basket:
+                        sell_one(product_id, quantity, path, "benchmark")
+            audit.close(path)
+            results.append((name, orders / (time.perf_counter() - start)))
+            db.get_pool(path).close_all()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checkout benchmark: orders/sec for multi-line orders")
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--min-lines", type=int, default=20)
+    parser.add_argument("--max-lines", type=int, default=50)
+    args = parser.parse_args()
+    for name, rate in benchmark(args.orders, args.products, args.min_lines, args.max_lines):
+        print(f"{name:10} {rate:10.1f} orders/sec")
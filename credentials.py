@@ -0,0 +1,188 @@
+import argparse
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Stored hash formats:
+#   scrypt$<n>$<r>$<p>$<salt hex>$<hash hex>
+#   pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>
+#   <64 hex chars>  legacy unsalted sha256, upgraded on the next good login
+SCHEMES = ("scrypt", "pbkdf2_sha256")
+
+settings = {
+    "scheme": "scrypt",
+    "scrypt": {"n": 2 ** 14, "r": 8, "p": 1},
+    "pbkdf2_sha256": {"iterations": 600000},
+}
+
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+
+def configure(scheme=None, **params):
+    # e.g. configure("pbkdf2_sha256", iterations=300000) or configure(n=2 ** 15)
+    if scheme is not None:
+        if scheme not in SCHEMES:
+            raise ValueError(f"Unknown PIN hashing scheme: {scheme}")
+        settings["scheme"] = scheme
+    settings[settings["scheme"]].update(params)
+    verify_cache.clear()
+
+
+def hash_pin(pin, scheme=None, **params):
+    scheme = scheme or settings["scheme"]
+    cost = dict(settings[scheme], **params)
+    salt = os.urandom(SALT_BYTES)
+    if scheme == "scrypt":
+        digest = _scrypt(pin, salt, cost["n"], cost["r"], cost["p"])
+        return f"scrypt${cost['n']}${cost['r']}${cost['p']}${salt.hex()}${digest.hex()}"
+    if scheme == "pbkdf2_sha256":
+        digest = hashlib.pbkdf2_hmac("sha256", pin.encode(), salt, cost["iterations"], HASH_BYTES)
+        return f"pbkdf2_sha256${cost['iterations']}${salt.hex()}${digest.hex()}"
+    raise ValueError(f"Unknown PIN hashing scheme: {scheme}")
+
+
+def verify_pin(pin, stored):
+    if not stored:
+        return False
+    key = verify_cache.key(pin, stored)
+    if verify_cache.get(key):
+        return True
+    ok = _verify(pin, stored)
+    if ok:
+        verify_cache.put(key)
+    return ok
+
+
+def needs_rehash(stored):
+    # True for legacy sha256 hashes and for hashes made with another scheme
+    # or a different cost than the current settings
+    parts = stored.split("$")
+    scheme = settings["scheme"]
+    if parts[0] != scheme:
+        return True
+    if scheme == "scrypt":
+        cost = settings["scrypt"]
+        return [int(x) for x in parts[1:4]] != [cost["n"], cost["r"], cost["p"]]
+    return int(parts[1]) != settings["pbkdf2_sha256"]["iterations"]
+
+
+def verify_and_upgrade(pin, stored):
+    # Returns (ok, new_hash); new_hash is set when the caller should store
+    # an upgraded hash for this PIN
+    if not verify_pin(pin, stored):
+        return False, None
+    if needs_rehash(stored):
+        new_hash = hash_pin(pin)
+        verify_cache.put(verify_cache.key(pin, new_hash))
+        return True, new_hash
+    return True, None
+
+
+def _verify(pin, stored):
+    parts = stored.split("$")
+    try:
+        if parts[0] == "scrypt":
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            expected = bytes.fromhex(parts[5])
+            return hmac.compare_digest(_scrypt(pin, bytes.fromhex(parts[4]), n, r, p, len(expected)), expected)
+        if parts[0] == "pbkdf2_sha256":
+            expected = bytes.fromhex(parts[3])
+            digest = hashlib.pbkdf2_hmac("sha256", pin.encode(), bytes.fromhex(parts[2]), int(parts[1]), len(expected))
+            return hmac.compare_digest(digest, expected)
+    except (IndexError, ValueError):
+        return False
+    return hmac.compare_digest(hashlib.sha256(pin.encode()).hexdigest(), stored)
+
+
+def _scrypt(pin, salt, n, r, p, length=HASH_BYTES):
+    # scrypt needs about 128 * n * r bytes; hashlib's default cap is 32 MB
+    maxmem = max(64 * 1024 * 1024, 256 * n * r)
+    return hashlib.scrypt(pin.encode(), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=length)
+
+
+# Remembers recent successful verifications so a session that re-checks its
+# PIN (change PIN, re-login) does not pay the full hashing cost again.
+# Entries are keyed by an HMAC of the PIN and hash under a per-process key,
+# so the cache never holds PINs.
+class VerifyCache:
+    def __init__(self, maxsize=4096, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, pin, stored):
+        return hmac.new(self._secret, f"{stored}\0{pin}".encode(), hashlib.sha256).digest()
+
+    def get(self, key):
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._entries[key]
+                return False
+            self._entries.move_to_end(key)
+            return True
+
+    def put(self, key):
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+verify_cache = VerifyCache()
+
+BENCHMARK_SETTINGS = [
+    ("pbkdf2_sha256", {"iterations": 100000}),
+    ("pbkdf2_sha256", {"iterations": 300000}),
+    ("pbkdf2_sha256", {"iterations": 600000}),
+    ("scrypt", {"n": 2 ** 13, "r": 8, "p": 1}),
+    ("scrypt", {"n": 2 ** 14, "r": 8, "p": 1}),
+    ("scrypt", {"n": 2 ** 15, "r": 8, "p": 1}),
+]
+
+
+def benchmark(cost_settings=BENCHMARK_SETTINGS, seconds=2.0, threads=None):
+    # Measures uncached PIN verifications per second, i.e. the login
+    # throughput ceiling for each cost setting
+    threads = threads or os.cpu_count() or 4
+    results = []
+    for scheme, params in cost_settings:
+        stored = hash_pin("1234", scheme, **params)
+        deadline = time.perf_counter() + seconds
+        counts = [0] * threads
+
+        def worker(i):
+            while time.perf_counter() < deadline:
+                _verify("1234", stored)
+                counts[i] += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(worker, range(threads)))
+        elapsed = time.perf_counter() - start
+        results.append((scheme, params, sum(counts) / elapsed))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PIN hashing benchmark: logins/sec per cost setting")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+    for scheme, params, rate in benchmark(seconds=args.seconds, threads=args.threads):
+        cost = ", ".join(f"{k}={v}" for k, v in params.items())
+        print(f"{scheme:14} {cost:24} {rate:10.1f} logins/sec")
@@ -0,0 +1,122 @@
+import random
+import sqlite3
+import threading
+import time
+import instrumentation
+
+# PRAGMAs applied to every pooled connection. journal_mode=WAL lets readers
+# run alongside the single writer and, with synchronous=NORMAL, only fsyncs
+# on checkpoints instead of on every commit.
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,  # negative means KiB, so ~16 MB of page cache
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+# Number of prepared statements sqlite3 keeps per connection
+DEFAULT_CACHED_STATEMENTS = 256
+
+
+# Hands out one long-lived connection per thread for a database file
+class ConnectionPool:
+    def __init__(self, path, pragmas=None, cached_statements=DEFAULT_CACHED_STATEMENTS):
+        self.path = path
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _open(self):
+        connect = instrumentation.connect if instrumentation.enabled else sqlite3.connect
+        conn = connect(self.path, cached_statements=self.cached_statements, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            if value is not None:
+                conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def release(self):
+        # Close the calling thread's connection, e.g. when a worker thread exits
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path, pragmas=None, cached_statements=DEFAULT_CACHED_STATEMENTS):
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = ConnectionPool(path, pragmas, cached_statements)
+            _pools[path] = pool
+        return pool
+
+
+def get_connection(path):
+    return get_pool(path).connection()
+
+
+def configure(path, pragmas=None, cached_statements=DEFAULT_CACHED_STATEMENTS):
+    # Replace the pool for a path with one using different settings
+    with _pools_lock:
+        old = _pools.pop(path, None)
+        pool = ConnectionPool(path, pragmas, cached_statements)
+        _pools[path] = pool
+    if old is not None:
+        old.close_all()
+    return pool
+
+
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+
+def is_busy(error):
+    # SQLITE_BUSY / SQLITE_LOCKED, including their extended codes
+    code = getattr(error, "sqlite_errorcode", 0) & 0xFF
+    return isinstance(error, sqlite3.OperationalError) and code in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+
+def retry_busy(func, attempts=6, base_delay=0.005):
+    # Call func(), retrying with exponential backoff and jitter while SQLite
+    # still reports the database busy after busy_timeout. func must leave
+    # no transaction open when it raises.
+    for attempt in range(attempts):
+        try:
+            return func()
+        except sqlite3.OperationalError as e:
+            if attempt == attempts - 1 or not is_busy(e):
+                raise
+        time.sleep(base_delay * 2 ** attempt * (0.5 + random.random()))
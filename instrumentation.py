@@ -0,0 +1,293 @@
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+import cache
+
+# Optional timing of every database call made through db.py's pooled
+# connections. While disabled (the default) connections are plain
+# sqlite3 connections, so it costs nothing. Enabling it affects
+# connections opened from then on; set DB_INSTRUMENT=1 before starting
+# atm2.py, inventory_management.py or atm_service.py to cover them from
+# the start. Other settings:
+#   DB_SLOW_MS         slow-query threshold in milliseconds (default 100)
+#   DB_SLOW_LOG        also append slow queries to this file, one JSON per line
+#   DB_METRICS_FILE    write a snapshot here every DB_METRICS_INTERVAL
+#                      seconds (default 60) and at exit; a .prom file gets
+#                      Prometheus text format, anything else JSON
+#
+# Per statement text it records calls, rows and time, where time includes
+# fetching the rows. Counters cover connections opened, statements,
+# commits with their latency, rollbacks and fsyncs. SQLite does not report
+# fsyncs, so they are estimated as commits on connections that sync on
+# every commit (synchronous=FULL, or a rollback journal); WAL checkpoints
+# are not counted.
+
+enabled = False
+slow_seconds = 0.1
+slow_log_path = None
+MAX_SLOW_ENTRIES = 200
+
+_lock = threading.Lock()
+_queries = {}  # statement text -> [calls, rows, seconds, max seconds]
+_counters = {}
+_slow = deque(maxlen=MAX_SLOW_ENTRIES)
+
+
+def _reset():
+    _queries.clear()
+    _slow.clear()
+    _counters.clear()
+    _counters.update(connections_opened=0, statements=0, commits=0, commit_seconds=0.0, commit_max_seconds=0.0,
+                     rollbacks=0, fsyncs=0, slow_queries=0)
+
+
+_reset()
+
+
+def enable(slow_ms=100, slow_log=None):
+    global enabled, slow_seconds, slow_log_path
+    slow_seconds = slow_ms / 1000
+    slow_log_path = slow_log
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with _lock:
+        _reset()
+
+
+def connect(path, **options):
+    # Used by db.ConnectionPool in place of sqlite3.connect while enabled
+    conn = sqlite3.connect(path, factory=InstrumentedConnection, **options)
+    with _lock:
+        _counters["connections_opened"] += 1
+    return conn
+
+
+def _statement(sql):
+    return " ".join(sql.split())
+
+
+def _record(entry, sql, seconds, rows, calls, elapsed):
+    # entry is the statement's stats list, looked up on first use; elapsed
+    # is the time of this execution so far, for the maximum
+    if entry is None:
+        key = _statement(sql)
+        with _lock:
+            entry = _queries.setdefault(key, [0, 0, 0.0, 0.0])
+    with _lock:
+        entry[0] += calls
+        entry[1] += rows
+        entry[2] += seconds
+        if elapsed > entry[3]:
+            entry[3] = elapsed
+        _counters["statements"] += calls
+    return entry
+
+
+def _log_slow(sql, seconds):
+    item = {"at": time.time(), "ms": round(seconds * 1000, 3), "sql": _statement(sql), "thread": threading.current_thread().name}
+    with _lock:
+        _counters["slow_queries"] += 1
+        _slow.append(item)
+    if slow_log_path:
+        try:
+            with open(slow_log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(item) + "\n")
+        except OSError as e:
+            print(f"slow query log: {e}", file=sys.stderr)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    _entry = None
+    _sql = None
+    _elapsed = 0.0
+    _logged = False
+
+    def _begin(self, sql):
+        self._entry = None
+        self._sql = sql
+        self._elapsed = 0.0
+        self._logged = False
+
+    def _add(self, seconds, rows, calls=0):
+        if not enabled:
+            return
+        self._elapsed += seconds
+        self._entry = _record(self._entry, self._sql, seconds, rows, calls, self._elapsed)
+        if not self._logged and self._elapsed >= slow_seconds:
+            self._logged = True
+            _log_slow(self._sql, self._elapsed)
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._add(time.perf_counter() - start, max(self.rowcount, 0), 1)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._add(time.perf_counter() - start, max(self.rowcount, 0), 1)
+
+    def executescript(self, script):
+        self._begin(script)
+        start = time.perf_counter()
+        try:
+            return super().executescript(script)
+        finally:
+            self._add(time.perf_counter() - start, 0, 1)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - start, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add(time.perf_counter() - start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(time.perf_counter() - start, 0)
+            raise
+        self._add(time.perf_counter() - start, 1)
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    _syncs_on_commit = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # sqlite3's own shortcuts would bypass the cursor overrides
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+    def commit(self):
+        if not (enabled and self.in_transaction):
+            return super().commit()
+        start = time.perf_counter()
+        super().commit()
+        seconds = time.perf_counter() - start
+        if self._syncs_on_commit is None:
+            synchronous = sqlite3.Connection.execute(self, 'PRAGMA synchronous').fetchone()[0]
+            journal_mode = sqlite3.Connection.execute(self, 'PRAGMA journal_mode').fetchone()[0]
+            self._syncs_on_commit = synchronous >= 2 or (journal_mode != "wal" and synchronous >= 1)
+        with _lock:
+            _counters["commits"] += 1
+            _counters["commit_seconds"] += seconds
+            _counters["commit_max_seconds"] = max(_counters["commit_max_seconds"], seconds)
+            if self._syncs_on_commit:
+                _counters["fsyncs"] += 1
+
+    def rollback(self):
+        if enabled and self.in_transaction:
+            with _lock:
+                _counters["rollbacks"] += 1
+        return super().rollback()
+
+
+def snapshot(top=50):
+    # Counters, the top statements by total time, recent slow queries and
+    # the lookup caches' hit/miss counters, as plain JSON-able data
+    with _lock:
+        counters = dict(_counters)
+        queries = sorted(_queries.items(), key=lambda item: item[1][2], reverse=True)[:top]
+        slow = list(_slow)
+    counters["commit_avg_seconds"] = counters["commit_seconds"] / counters["commits"] if counters["commits"] else 0.0
+    return {
+        "enabled": enabled,
+        "taken_at": time.time(),
+        "counters": counters,
+        "queries": [{"sql": sql, "calls": calls, "rows": rows, "seconds": round(seconds, 6),
+                     "avg_ms": round(seconds / calls * 1000, 3) if calls else 0.0, "max_ms": round(longest * 1000, 3)}
+                    for sql, (calls, rows, seconds, longest) in queries],
+        "slow_queries": slow,
+        "caches": cache.metrics(),
+    }
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")[:200]
+
+
+def prometheus(data=None):
+    # The snapshot in Prometheus text exposition format, e.g. for the
+    # node_exporter textfile collector
+    data = data or snapshot()
+    lines = []
+    for name, value in data["counters"].items():
+        kind = "gauge" if name.endswith(("max_seconds", "avg_seconds")) else "counter"
+        metric = f"db_{name}" if kind == "gauge" else f"db_{name}_total"
+        lines += [f"# TYPE {metric} {kind}", f"{metric} {value}"]
+    for metric, key in (("db_query_calls_total", "calls"), ("db_query_rows_total", "rows"), ("db_query_seconds_total", "seconds")):
+        lines.append(f"# TYPE {metric} counter")
+        lines += [f'{metric}{{query="{_label(q["sql"])}"}} {q[key]}' for q in data["queries"]]
+    for metric, key in (("cache_hits_total", "hits"), ("cache_misses_total", "misses"), ("cache_evictions_total", "evictions")):
+        lines.append(f"# TYPE {metric} counter")
+        lines += [f'{metric}{{cache="{_label(name)}"}} {stats[key]}' for name, stats in data["caches"].items()]
+    return "\n".join(lines) + "\n"
+
+
+def write_snapshot(path, file_format=None):
+    # Replaces path atomically so a scraper never reads half a file
+    file_format = file_format or ("prometheus" if path.endswith(".prom") else "json")
+    data = snapshot()
+    text = prometheus(data) if file_format == "prometheus" else json.dumps(data, indent=2)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def start_dumping(path, interval=60.0):
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot(path)
+            except OSError as e:
+                print(f"metrics file: {e}", file=sys.stderr)
+    threading.Thread(target=run, name="metrics-dump", daemon=True).start()
+    atexit.register(write_snapshot, path)
+
+
+if os.environ.get("DB_INSTRUMENT", "") not in ("", "0"):
+    enable(float(os.environ.get("DB_SLOW_MS", "100")), os.environ.get("DB_SLOW_LOG") or None)
+    if os.environ.get("DB_METRICS_FILE"):
+        start_dumping(os.environ["DB_METRICS_FILE"], float(os.environ.get("DB_METRICS_INTERVAL", "60")))
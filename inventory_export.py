@@ -0,0 +1,146 @@
+import argparse
+import csv
+import gzip
+import sys
+import time
+import db
+import timestamps
+from money import format_money
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Column key -> (CSV header, SQL expression, value type). Money columns are
+# exported as formatted rupees in CSV (None as N/A) and as raw integer paise in Parquet;
+# timestamps as local "YYYY-MM-DD HH:MM:SS" in CSV and UTC timestamps in Parquet.
+EXPORTS = {
+    "inventory": {
+        "from": 'products p LEFT JOIN suppliers s ON p.supplier_id = s.id',
+        "date": None,
+        "columns": {
+            "id": ("ID", "p.id", "int"),
+            "name": ("Name", "p.name", "str"),
+            "quantity": ("Quantity", "p.quantity", "int"),
+            "price": ("Price", "p.price_paise", "money"),
+            "category": ("Category", "p.category", "str"),
+            "threshold": ("Threshold", "p.low_threshold", "int"),
+            "supplier": ("Supplier", "s.name", "str"),
+        },
+        "order": 'p.id',
+    },
+    "sales": {
+        "from": "transactions t JOIN products p ON t.product_id = p.id WHERE t.type = 'Withdrawal'",
+        "date": "t.date_us",
+        "columns": {
+            "product": ("Product", "p.name", "str"),
+            "quantity": ("Quantity Sold", "t.quantity", "int"),
+            "date": ("Date", "t.date_us", "timestamp"),
+            "price": ("Price", "t.new_price_paise", "money"),
+        },
+        "order": 't.date_us, t.id',
+    },
+}
+FORMATS = ("csv", "parquet")
+FORMATTERS = {"money": format_money, "timestamp": timestamps.format_us}
+
+def guess_format(path):
+    return "parquet" if path.endswith(".parquet") else "csv"
+
+
+def build_query(kind, columns=None, start_date=None, end_date=None):
+    # Only the selected columns are read. Dates are inclusive YYYY-MM-DD
+    # strings and use the (type, date_us) index on transactions.
+    spec = EXPORTS[kind]
+    columns = list(columns or spec["columns"])
+    for column in columns:
+        if column not in spec["columns"]:
+            raise ValueError(f"Unknown {kind} column: {column}")
+    sql = f'SELECT {", ".join(spec["columns"][c][1] for c in columns)} FROM {spec["from"]}'
+    params = []
+    if (start_date or end_date) and not spec["date"]:
+        raise ValueError(f"{kind} export has no date column")
+    if start_date or end_date:
+        conditions, params = timestamps.range_sql(spec["date"], start_date, end_date)
+        sql += (' AND ' if ' WHERE ' in sql else ' WHERE ') + ' AND '.join(conditions)
+    return sql + f' ORDER BY {spec["order"]}', params, columns
+
+
+def export(kind, path, db_path='inventory.db', columns=None, start_date=None, end_date=None,
+           file_format=None, compress=None, chunk_size=5000, progress=None):
+    # Streams rows with fetchmany, so memory stays flat however large the
+    # table is. compress defaults to gzip when path ends in .gz (CSV only;
+    # Parquet pages are always compressed). progress, if given, is called
+    # with the number of rows written after every chunk.
+    file_format = file_format or guess_format(path)
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown export format: {file_format}")
+    if file_format == "parquet" and pyarrow is None:
+        raise RuntimeError("Parquet export needs the pyarrow package (pip install pyarrow)")
+    sql, params, columns = build_query(kind, columns, start_date, end_date)
+    spec = [EXPORTS[kind]["columns"][c] for c in columns]
+    cursor = db.get_connection(db_path).cursor()
+    cursor.arraysize = chunk_size
+    cursor.execute(sql, params)
+    try:
+        if file_format == "parquet":
+            return _write_parquet(cursor, path, columns, spec, progress)
+        return _write_csv(cursor, path, spec, path.endswith(".gz") if compress is None else compress, progress)
+    finally:
+        cursor.close()
+
+
+def _write_csv(cursor, path, spec, compress, progress):
+    opener = gzip.open if compress else open
+    written = 0
+    with opener(path, 'wt', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow([header for header, _, _ in spec])
+        formatters = {i: FORMATTERS[value_type] for i, (_, _, value_type) in enumerate(spec) if value_type in FORMATTERS}
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            writer.writerows(["N/A" if value is None else formatters[i](value) if i in formatters else value for i, value in enumerate(row)] for row in rows)
+            written += len(rows)
+            if progress:
+                progress(written)
+    return written
+
+
+def _write_parquet(cursor, path, columns, spec, progress):
+    types = {"int": pyarrow.int64(), "money": pyarrow.int64(), "str": pyarrow.string(), "timestamp": pyarrow.timestamp("us", tz="UTC")}
+    # Money stays integer paise, named accordingly
+    names = [f"{c}_paise" if value_type == "money" else c for c, (_, _, value_type) in zip(columns, spec)]
+    schema = pyarrow.schema([(name, types[value_type]) for name, (_, _, value_type) in zip(names, spec)])
+    written = 0
+    with pyarrow.parquet.ParquetWriter(path, schema, compression="zstd") as writer:
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            writer.write_batch(pyarrow.record_batch([list(values) for values in zip(*rows)], schema=schema))
+            written += len(rows)
+            if progress:
+                progress(written)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export inventory or sales data to CSV (optionally gzipped) or Parquet")
+    parser.add_argument("kind", choices=sorted(EXPORTS))
+    parser.add_argument("path", help="output file; .gz compresses CSV, .parquet writes Parquet")
+    parser.add_argument("--db", default="inventory.db")
+    parser.add_argument("--columns", help="comma-separated subset of: " + "; ".join(f"{k}: {','.join(v['columns'])}" for k, v in EXPORTS.items()))
+    parser.add_argument("--start-date", help="YYYY-MM-DD, sales only")
+    parser.add_argument("--end-date", help="YYYY-MM-DD inclusive, sales only")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    count = export(args.kind, args.path, args.db, args.columns.split(",") if args.columns else None,
+                   args.start_date, args.end_date, args.format, chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+    print(f"{count} rows written to {args.path} in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} rows/sec)", file=sys.stderr)
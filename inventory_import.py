@@ -0,0 +1,181 @@
+import argparse
+import csv
+import sys
+import time
+import audit
+import db
+import migrations
+from money import to_paise
+from timestamps import now_us
+
+FIELDS = ["name", "quantity", "price", "category", "low_threshold", "supplier_id"]
+MODES = ("skip", "upsert")
+
+INSERT_PRODUCT_SQL = '''
+    INSERT INTO products (name, quantity, price_paise, category, low_threshold, supplier_id)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+ON_CONFLICT = {
+    "skip": " ON CONFLICT(name) DO NOTHING",
+    "upsert": " ON CONFLICT(name) DO UPDATE SET quantity = excluded.quantity, price_paise = excluded.price_paise,"
+              " category = excluded.category, low_threshold = excluded.low_threshold, supplier_id = excluded.supplier_id",
+}
+INSERT_TRANSACTION_SQL = 'INSERT INTO transactions (product_id, type, quantity, date_us, user, new_price_paise) VALUES (?, ?, ?, ?, ?, ?)'
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validate(row, supplier_ids):
+    # Same rules as InventorySystem.validate_input, against a preloaded
+    # supplier id set. Returns (name, quantity, price_paise, category,
+    # low_threshold, supplier_id) or raises ValueError.
+    name = (row.get("name") or "").strip()
+    category = (row.get("category") or "").strip()
+    if not name or not category:
+        raise ValueError("Name and category are required.")
+    try:
+        quantity = int(row.get("quantity") or "")
+        price = to_paise(row.get("price") or "")
+        threshold = int(row["low_threshold"]) if (row.get("low_threshold") or "").strip() else 10
+        supplier_id = int(row["supplier_id"]) if (row.get("supplier_id") or "").strip() else None
+    except ValueError:
+        raise ValueError("Quantity, price, and threshold must be numbers.")
+    if threshold < 0 or threshold > 100:
+        raise ValueError("Threshold must be between 0 and 100.")
+    if quantity < 0 or quantity > 10000 or price < 0 or price > 10000000:
+        raise ValueError("Quantity (0-10000) and price (0-100000) out of range.")
+    if supplier_id is not None and supplier_id not in supplier_ids:
+        raise ValueError("Invalid supplier ID.")
+    return name, quantity, price, category, threshold, supplier_id
+
+
+def existing_products(cursor, names):
+    # name -> (id, quantity, price_paise)
+    found = {}
+    names = list(names)
+    for i in range(0, len(names), 900):
+        part = names[i:i + 900]
+        cursor.execute(f'SELECT name, id, quantity, price_paise FROM products WHERE name IN ({",".join("?" * len(part))})', part)
+        found.update((r[0], r[1:]) for r in cursor.fetchall())
+    return found
+
+
+def import_csv(path, db_path='inventory.db', user="admin", mode="skip", progress=None, batch_size=2000, rejects_path=None):
+    # Streams the CSV in chunks of batch_size rows; each chunk is one
+    # transaction writing products, transactions and audit events with
+    # executemany. "skip" leaves existing products alone (reported as
+    # rejects), "upsert" overwrites them and records the stock change.
+    # progress, if given, is called with the stats dict after every chunk.
+    migrations.migrate(db_path, migrations.INVENTORY_MIGRATIONS)
+    conn = db.get_connection(db_path)
+    cursor = conn.cursor()
+    audit_sink = audit.get_sink(db_path)
+    supplier_ids = {r[0] for r in cursor.execute('SELECT id FROM suppliers')}
+    product_sql = INSERT_PRODUCT_SQL + ON_CONFLICT[mode]
+    stats = {"read": 0, "inserted": 0, "updated": 0, "rejected": 0, "errors": []}
+    seen = set()
+    rejects_file = open(rejects_path, "w", newline='', encoding='utf-8') if rejects_path else None
+    rejects = csv.writer(rejects_file) if rejects_file else None
+    if rejects:
+        rejects.writerow(["row"] + FIELDS + ["error"])
+    start = time.perf_counter()
+
+    def reject(row_no, row, error):
+        stats["rejected"] += 1
+        if len(stats["errors"]) < 20:
+            stats["errors"].append(f"Row {row_no}: {error}")
+        if rejects:
+            rejects.writerow([row_no] + [row.get(f, "") for f in FIELDS] + [error])
+
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            row_no = 0
+            for chunk in chunked(csv.DictReader(f), batch_size):
+                valid = []
+                for row in chunk:
+                    row_no += 1
+                    stats["read"] += 1
+                    try:
+                        record = validate(row, supplier_ids)
+                    except ValueError as e:
+                        reject(row_no, row, str(e))
+                        continue
+                    if record[0] in seen:
+                        reject(row_no, row, "duplicate name in file")
+                        continue
+                    seen.add(record[0])
+                    valid.append((row_no, row, record))
+
+                now = now_us()
+                cursor.execute('BEGIN IMMEDIATE')
+                try:
+                    before = existing_products(cursor, [v[2][0] for v in valid])
+                    if mode == "skip":
+                        for item in [v for v in valid if v[2][0] in before]:
+                            reject(item[0], item[1], "product already exists")
+                        valid = [v for v in valid if v[2][0] not in before]
+                    cursor.executemany(product_sql, [v[2] for v in valid])
+                    after = existing_products(cursor, [v[2][0] for v in valid])
+
+                    moves, audit_rows = [], []
+                    for _, _, (name, quantity, price, *_rest) in valid:
+                        product_id = after[name][0]
+                        if name in before:
+                            _, old_quantity, old_price = before[name]
+                            diff = quantity - old_quantity
+                            # A price-only change is in the audit row; a
+                            # zero-quantity stock move would just be noise
+                            if diff != 0:
+                                moves.append((product_id, "Adjust" if diff > 0 else "Reduce", abs(diff), now, user, price if price != old_price else None))
+                            audit_rows.append(("Import Updated", f"Product: {name}, ID: {product_id}", user, now))
+                        else:
+                            moves.append((product_id, "Add", quantity, now, user, price))
+                            audit_rows.append(("Imported", f"Product: {name}, ID: {product_id}", user, now))
+                    cursor.executemany(INSERT_TRANSACTION_SQL, moves)
+                    audit_sink.write(cursor, audit_rows)
+                except BaseException:
+                    conn.rollback()
+                    raise
+                conn.commit()
+                updated = sum(1 for v in valid if v[2][0] in before)
+                stats["updated"] += updated
+                stats["inserted"] += len(valid) - updated
+                stats["seconds"] = time.perf_counter() - start
+                stats["rows_per_sec"] = stats["read"] / stats["seconds"] if stats["seconds"] else 0.0
+                if progress:
+                    progress(dict(stats))
+    finally:
+        if rejects_file:
+            rejects_file.close()
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_sec"] = stats["read"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+def describe(stats):
+    return (f"{stats['read']} rows read, {stats['inserted']} added, {stats['updated']} updated, "
+            f"{stats['rejected']} rejected ({stats.get('rows_per_sec', 0.0):.0f} rows/sec)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import products from a CSV file with columns " + ", ".join(FIELDS))
+    parser.add_argument("path")
+    parser.add_argument("--db", default="inventory.db")
+    parser.add_argument("--user", default="admin", help="recorded in transactions and audit_logs")
+    parser.add_argument("--mode", choices=MODES, default="skip", help="skip or overwrite products that already exist")
+    parser.add_argument("--batch-size", type=int, default=2000, help="rows per transaction")
+    parser.add_argument("--rejects", default=None, help="write rows that could not be imported to this CSV")
+    parser.add_argument("--audit-db", default=None, help="write audit events to this file instead of --db")
+    args = parser.parse_args()
+    audit.configure(args.db, args.audit_db)
+    stats = import_csv(args.path, args.db, args.user, args.mode, lambda s: print(describe(s), file=sys.stderr),
+                       args.batch_size, args.rejects)
+    print(f"Done in {stats['seconds']:.1f}s: {describe(stats)}")
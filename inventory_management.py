@@ -2,79 +2,41 @@ import sqlite3
 import tkinter as tk
 from tkinter import messagebox, simpledialog, ttk, filedialog
 from tkinter import scrolledtext
-import hashlib
-from datetime import datetime
 import csv
 import os
+import audit
+import backup
+import cache
+import checkout
+import credentials
+import db
+import inventory_export
+import inventory_import
+import inventory_search
+import migrations
+import sales_rollup
+from money import format_money, to_paise
+from tasks import TaskExecutor
+from timestamps import format_us, now_us, parse_day
+from virtual_tree import VirtualTreeview
+
+DB_PATH = 'inventory.db'
 
 # Database setup
 def init_db():
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            username TEXT PRIMARY KEY,
-            password_hash TEXT,
-            role TEXT DEFAULT 'staff' CHECK(role IN ('admin', 'staff', 'pending')),
-            approved INTEGER DEFAULT 0
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            quantity INTEGER NOT NULL CHECK(quantity >= 0 AND quantity <= 10000),
-            price REAL NOT NULL CHECK(price >= 0 AND price <= 100000),
-            category TEXT NOT NULL,
-            low_threshold INTEGER DEFAULT 10 CHECK(low_threshold >= 0 AND low_threshold <= 100),
-            supplier_id INTEGER,
-            FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS suppliers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            contact TEXT
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            product_id INTEGER,
-            type TEXT,
-            quantity INTEGER,
-            date TEXT,
-            user TEXT,
-            new_price REAL,
-            FOREIGN KEY (product_id) REFERENCES products(id)
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS notifications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            message TEXT NOT NULL,
-            date TEXT,
-            status TEXT DEFAULT 'pending' CHECK(status IN ('pending', 'resolved'))
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS audit_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            action TEXT,
-            details TEXT,
-            user TEXT,
-            timestamp TEXT
-        )
-    ''')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_product_id ON transactions(product_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_username ON users(username)')
-    cursor.execute('SELECT COUNT(*) FROM users WHERE username = ?', ('admin',))
-    if cursor.fetchone()[0] == 0:
-        cursor.execute('INSERT INTO users (username, password_hash, role, approved) VALUES (?, ?, ?, ?)', 
-                      ('admin', hashlib.sha256('password123'.encode()).hexdigest(), 'admin', 1))
-    conn.commit()
-    conn.close()
+    migrations.migrate(DB_PATH, migrations.INVENTORY_MIGRATIONS)
+
+# Lookups the screens repeat. The write paths below drop what they change;
+# the TTL bounds how long a change made by another process (e.g. the
+# import CLI) can go unseen.
+product_cache = cache.LookupCache("products", maxsize=1024, ttl=60)
+supplier_cache = cache.LookupCache("suppliers", maxsize=256, ttl=300)
+counts_cache = cache.LookupCache("dashboard_counts", maxsize=1, ttl=30)
+
+
+# Raised by background work with a message meant for the user
+class InventoryError(Exception):
+    pass
 
 class InventorySystem:
     def __init__(self, root):
@@ -83,6 +45,8 @@ class InventorySystem:
         self.current_user = None
         self.theme = "light"
         self.style = ttk.Style()
+        # All database and file work runs here; results come back on the Tk thread
+        self.tasks = TaskExecutor(root)
         self.init_ui()
         self.configure_styles()  # Initialize styles
         init_db()
@@ -145,13 +109,49 @@ class InventorySystem:
     def login(self):
         username = self.username_entry.get()
         password = self.password_entry.get()
-        conn = sqlite3.connect('inventory.db')
+        self.run_task(self.check_credentials, username, password, on_done=self.finish_login)
+
+    def run_task(self, func, *args, on_done=None, on_error=None):
+        return self.tasks.submit(func, *args, on_done=on_done, on_error=on_error or self.show_task_error)
+
+    def show_task_error(self, error):
+        if isinstance(error, (InventoryError, ValueError, sqlite3.Error, OSError)):
+            messagebox.showerror("Error", str(error))
+        else:
+            self.root.report_callback_exception(type(error), error, error.__traceback__)
+
+    def finish_action(self, message):
+        messagebox.showinfo("Success", message)
+        self.create_main_screen()
+
+    # Small statements for run_task
+    def query(self, sql, params=()):
+        return db.get_connection(DB_PATH).execute(sql, params).fetchall()
+
+    def execute(self, sql, params=()):
+        conn = db.get_connection(DB_PATH)
+        cursor = conn.execute(sql, params)
+        conn.commit()
+        return cursor.lastrowid
+
+    def check_credentials(self, username, password):
+        conn = db.get_connection(DB_PATH)
         cursor = conn.cursor()
         cursor.execute('SELECT password_hash, role, approved FROM users WHERE username = ?', (username,))
         result = cursor.fetchone()
-        conn.close()
-        if result and hashlib.sha256(password.encode()).hexdigest() == result[0] and result[2]:
-            self.current_user = {"username": username, "role": result[1]}
+        if not result or not result[2]:
+            return None
+        ok, new_hash = credentials.verify_and_upgrade(password, result[0])
+        if not ok:
+            return None
+        if new_hash:
+            cursor.execute('UPDATE users SET password_hash = ? WHERE username = ? AND password_hash = ?', (new_hash, username, result[0]))
+            conn.commit()
+        return {"username": username, "role": result[1]}
+
+    def finish_login(self, user):
+        if user:
+            self.current_user = user
             self.create_main_screen()
         else:
             messagebox.showerror("Error", "Invalid username, password, or unapproved account")
@@ -174,18 +174,21 @@ class InventorySystem:
         if not username or not password:
             messagebox.showerror("Error", "Username and password are required")
             return
-        conn = sqlite3.connect('inventory.db')
+        self.run_task(self.register_user, username, password, on_done=self.finish_register)
+
+    def register_user(self, username, password):
+        conn = db.get_connection(DB_PATH)
         cursor = conn.cursor()
         try:
             cursor.execute('INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)', 
-                          (username, hashlib.sha256(password.encode()).hexdigest(), 'pending'))
+                          (username, credentials.hash_pin(password), 'pending'))
             conn.commit()
-            messagebox.showinfo("Success", "Registration submitted. Awaiting admin approval.")
         except sqlite3.IntegrityError:
             conn.rollback()
-            messagebox.showerror("Error", "Username already exists")
-        finally:
-            conn.close()
+            raise InventoryError("Username already exists")
+
+    def finish_register(self, _):
+        messagebox.showinfo("Success", "Registration submitted. Awaiting admin approval.")
         self.create_login_screen()
 
     def create_main_screen(self):
@@ -193,15 +196,11 @@ class InventorySystem:
         frame = ttk.Frame(self.root, padding="10", style=f"{self.theme.capitalize()}.TFrame")
         frame.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
         ttk.Label(frame, text="Dashboard", font=("Arial", 18, "bold"), style=f"{self.theme.capitalize()}.TLabel").grid(row=0, column=0, columnspan=3, pady=10)
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM products')
-        total_products = cursor.fetchone()[0]
-        cursor.execute('SELECT COUNT(*) FROM products WHERE quantity < low_threshold')
-        low_stock_count = cursor.fetchone()[0]
-        conn.close()
-        ttk.Label(frame, text=f"Total Products: {total_products}", style=f"{self.theme.capitalize()}.TLabel").grid(row=1, column=0, padx=5, pady=5)
-        ttk.Label(frame, text=f"Low Stock Items: {low_stock_count}", style=f"{self.theme.capitalize()}.TLabel").grid(row=1, column=1, padx=5, pady=5)
+        total_label = ttk.Label(frame, text="Total Products: ...", style=f"{self.theme.capitalize()}.TLabel")
+        total_label.grid(row=1, column=0, padx=5, pady=5)
+        low_stock_label = ttk.Label(frame, text="Low Stock Items: ...", style=f"{self.theme.capitalize()}.TLabel")
+        low_stock_label.grid(row=1, column=1, padx=5, pady=5)
+        self.run_task(self.dashboard_counts, on_done=lambda counts: self.show_dashboard_counts(counts, total_label, low_stock_label))
         ttk.Button(frame, text="Add Product", command=self.add_product, style=f"{self.theme.capitalize()}.TButton").grid(row=2, column=0, pady=5)
         ttk.Button(frame, text="Edit Product", command=self.edit_product, style=f"{self.theme.capitalize()}.TButton").grid(row=2, column=1, pady=5)
         if self.current_user["role"] == "admin":
@@ -219,6 +218,21 @@ class InventorySystem:
         ttk.Button(frame, text="View Notifications", command=self.view_notifications, style=f"{self.theme.capitalize()}.TButton").grid(row=8, column=0, pady=5)
         ttk.Button(frame, text="Logout", command=lambda: self.confirm_action("logout", self.logout), style=f"{self.theme.capitalize()}.TButton").grid(row=9, column=0, columnspan=2, pady=10)
 
+    def dashboard_counts(self):
+        return counts_cache.get("counts", self.count_products)
+
+    def count_products(self, _):
+        cursor = db.get_connection(DB_PATH).cursor()
+        cursor.execute('SELECT COUNT(*) FROM products')
+        total_products = cursor.fetchone()[0]
+        cursor.execute('SELECT COUNT(*) FROM products WHERE quantity < low_threshold')
+        return total_products, cursor.fetchone()[0]
+
+    def show_dashboard_counts(self, counts, total_label, low_stock_label):
+        if total_label.winfo_exists():
+            total_label.config(text=f"Total Products: {counts[0]}")
+            low_stock_label.config(text=f"Low Stock Items: {counts[1]}")
+
     def clear_screen(self):
         for widget in self.root.winfo_children():
             widget.destroy()
@@ -236,25 +250,33 @@ class InventorySystem:
             return False, "Name and category are required."
         try:
             quantity = int(quantity)
-            price = float(price)
+            price = to_paise(price)
             if threshold is not None:
                 threshold = int(threshold)
                 if threshold < 0 or threshold > 100:
                     return False, "Threshold must be between 0 and 100."
-            if quantity < 0 or quantity > 10000 or price < 0 or price > 100000:
+            if quantity < 0 or quantity > 10000 or price < 0 or price > 10000000:
                 return False, "Quantity (0-10000) and price (0-100000) out of range."
             if supplier_id is not None:
-                conn = sqlite3.connect('inventory.db')
-                cursor = conn.cursor()
-                cursor.execute('SELECT COUNT(*) FROM suppliers WHERE id = ?', (supplier_id,))
-                if cursor.fetchone()[0] == 0:
-                    conn.close()
+                if not supplier_cache.get(supplier_id, self.supplier_exists):
                     return False, "Invalid supplier ID."
-                conn.close()
             return True, ""
         except ValueError:
             return False, "Quantity, price, and threshold must be numbers."
 
+    def supplier_exists(self, supplier_id):
+        cursor = db.get_connection(DB_PATH).cursor()
+        cursor.execute('SELECT COUNT(*) FROM suppliers WHERE id = ?', (supplier_id,))
+        return cursor.fetchone()[0] > 0
+
+    def product_changed(self, product_id=None):
+        # After a committed product write; None means any product
+        if product_id is None:
+            product_cache.clear()
+        else:
+            product_cache.invalidate(product_id)
+        counts_cache.clear()
+
     def add_product(self):
         self.clear_screen()
         frame = ttk.Frame(self.root, padding="10", style=f"{self.theme.capitalize()}.TFrame")
@@ -285,34 +307,36 @@ class InventorySystem:
         ttk.Button(frame, text="Back", command=self.create_main_screen, style=f"{self.theme.capitalize()}.TButton").grid(row=8, column=0, columnspan=2, pady=5)
 
     def process_add_product(self, name, quantity, price, category, supplier_id, threshold):
+        self.run_task(self.insert_product, name, quantity, price, category, supplier_id, threshold,
+                      on_done=lambda _: self.finish_action("Product added successfully"))
+
+    def insert_product(self, name, quantity, price, category, supplier_id, threshold):
         is_valid, message = self.validate_input(name, quantity, price, category, threshold, supplier_id)
-        if is_valid:
-            conn = sqlite3.connect('inventory.db')
-            cursor = conn.cursor()
-            try:
-                cursor.execute('BEGIN TRANSACTION')
-                cursor.execute('INSERT INTO products (name, quantity, price, category, low_threshold, supplier_id) VALUES (?, ?, ?, ?, ?, ?)', 
-                              (name, int(quantity), float(price), category, int(threshold) if threshold else 10, int(supplier_id) if supplier_id else None))
-                product_id = cursor.lastrowid
-                cursor.execute('INSERT INTO transactions (product_id, type, quantity, date, user, new_price) VALUES (?, ?, ?, ?, ?, ?)', 
-                              (product_id, "Add", int(quantity), datetime.now().strftime("%Y-%m-%d %H:%M:%S"), self.current_user["username"], float(price)))
-                self.log_action(conn, cursor, "Added", f"Product: {name}, ID: {product_id}")
-                conn.commit()
-                self.check_low_stock(product_id)
-                messagebox.showinfo("Success", "Product added successfully")
-            except sqlite3.IntegrityError:
-                conn.rollback()
-                messagebox.showerror("Error", "Product name must be unique or invalid supplier ID")
-            finally:
-                conn.close()
-            self.create_main_screen()
-        else:
-            messagebox.showerror("Error", message)
+        if not is_valid:
+            raise InventoryError(message)
+        conn = db.get_connection(DB_PATH)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN TRANSACTION')
+            cursor.execute('INSERT INTO products (name, quantity, price_paise, category, low_threshold, supplier_id) VALUES (?, ?, ?, ?, ?, ?)', 
+                          (name, int(quantity), to_paise(price), category, int(threshold) if threshold else 10, int(supplier_id) if supplier_id else None))
+            product_id = cursor.lastrowid
+            cursor.execute('INSERT INTO transactions (product_id, type, quantity, date_us, user, new_price_paise) VALUES (?, ?, ?, ?, ?, ?)', 
+                          (product_id, "Add", int(quantity), now_us(), self.current_user["username"], to_paise(price)))
+            self.log_action(conn, cursor, "Added", f"Product: {name}, ID: {product_id}")
+            conn.commit()
+            self.product_changed(product_id)
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            raise InventoryError("Product name must be unique or invalid supplier ID")
+        except BaseException:
+            conn.rollback()
+            raise
 
     def log_action(self, conn, cursor, action, details):
-        cursor.execute('INSERT INTO audit_logs (action, details, user, timestamp) VALUES (?, ?, ?, ?)', 
-                      (action, details, self.current_user["username"], datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-        # No commit here, as it’s handled by the calling method
+        # Product changes are critical events, written with the change itself;
+        # no commit here, as it’s handled by the calling method
+        audit.get_sink(DB_PATH).write(cursor, [(action, details, self.current_user["username"], now_us())])
 
     def edit_product(self):
         self.clear_screen()
@@ -328,80 +352,91 @@ class InventorySystem:
     def load_product_for_edit(self, product_id, frame):
         try:
             product_id = int(product_id)
-            conn = sqlite3.connect('inventory.db')
-            cursor = conn.cursor()
-            cursor.execute('SELECT id, name, quantity, price, category, low_threshold, supplier_id FROM products WHERE id = ?', (product_id,))
-            product = cursor.fetchone()
-            conn.close()
-            if product:
-                for widget in frame.winfo_children():
-                    widget.destroy()
-                ttk.Label(frame, text="Edit Product", font=("Arial", 14, "bold"), style=f"{self.theme.capitalize()}.TLabel").grid(row=0, column=0, columnspan=2, pady=10)
-                ttk.Label(frame, text=f"ID: {product[0]}", style=f"{self.theme.capitalize()}.TLabel").grid(row=1, column=0, columnspan=2, pady=5)
-                ttk.Label(frame, text="Name:", style=f"{self.theme.capitalize()}.TLabel").grid(row=2, column=0, padx=5, pady=5)
-                name_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
-                name_entry.insert(0, product[1])
-                name_entry.grid(row=2, column=1, padx=5, pady=5)
-                ttk.Label(frame, text="Quantity:", style=f"{self.theme.capitalize()}.TLabel").grid(row=3, column=0, padx=5, pady=5)
-                quantity_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
-                quantity_entry.insert(0, str(product[2]))
-                quantity_entry.grid(row=3, column=1, padx=5, pady=5)
-                ttk.Label(frame, text="Price (₹):", style=f"{self.theme.capitalize()}.TLabel").grid(row=4, column=0, padx=5, pady=5)
-                price_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
-                price_entry.insert(0, str(product[3]))
-                price_entry.grid(row=4, column=1, padx=5, pady=5)
-                ttk.Label(frame, text="Category:", style=f"{self.theme.capitalize()}.TLabel").grid(row=5, column=0, padx=5, pady=5)
-                category_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
-                category_entry.insert(0, product[4])
-                category_entry.grid(row=5, column=1, padx=5, pady=5)
-                ttk.Label(frame, text="Supplier ID (optional):", style=f"{self.theme.capitalize()}.TLabel").grid(row=6, column=0, padx=5, pady=5)
-                supplier_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
-                supplier_entry.insert(0, str(product[6]) if product[6] else "")
-                supplier_entry.grid(row=6, column=1, padx=5, pady=5)
-                if self.current_user["role"] == "admin":
-                    ttk.Label(frame, text="Low Threshold:", style=f"{self.theme.capitalize()}.TLabel").grid(row=7, column=0, padx=5, pady=5)
-                    threshold_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
-                    threshold_entry.insert(0, str(product[5]))
-                    threshold_entry.grid(row=7, column=1, padx=5, pady=5)
-                else:
-                    threshold_entry = None
-                ttk.Button(frame, text="Update", command=lambda: self.process_edit_product(product_id, name_entry.get(), quantity_entry.get(), price_entry.get(), category_entry.get(), supplier_entry.get() if supplier_entry.get() else None, threshold_entry.get() if threshold_entry else None), style=f"{self.theme.capitalize()}.TButton").grid(row=8, column=0, columnspan=2, pady=10)
-                ttk.Button(frame, text="Back", command=self.create_main_screen, style=f"{self.theme.capitalize()}.TButton").grid(row=9, column=0, columnspan=2, pady=5)
-            else:
-                messagebox.showerror("Error", "Product not found")
         except ValueError:
             messagebox.showerror("Error", "Invalid Product ID")
+            return
+        self.run_task(self.fetch_product, product_id, on_done=lambda product: self.show_edit_form(product, frame))
+
+    def fetch_product(self, product_id):
+        product = product_cache.get(product_id, self.read_product)
+        if not product:
+            raise InventoryError("Product not found")
+        return product
+
+    def read_product(self, product_id):
+        cursor = db.get_connection(DB_PATH).cursor()
+        cursor.execute('SELECT id, name, quantity, price_paise, category, low_threshold, supplier_id FROM products WHERE id = ?', (product_id,))
+        return cursor.fetchone()
+
+    def show_edit_form(self, product, frame):
+        for widget in frame.winfo_children():
+            widget.destroy()
+        ttk.Label(frame, text="Edit Product", font=("Arial", 14, "bold"), style=f"{self.theme.capitalize()}.TLabel").grid(row=0, column=0, columnspan=2, pady=10)
+        ttk.Label(frame, text=f"ID: {product[0]}", style=f"{self.theme.capitalize()}.TLabel").grid(row=1, column=0, columnspan=2, pady=5)
+        ttk.Label(frame, text="Name:", style=f"{self.theme.capitalize()}.TLabel").grid(row=2, column=0, padx=5, pady=5)
+        name_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
+        name_entry.insert(0, product[1])
+        name_entry.grid(row=2, column=1, padx=5, pady=5)
+        ttk.Label(frame, text="Quantity:", style=f"{self.theme.capitalize()}.TLabel").grid(row=3, column=0, padx=5, pady=5)
+        quantity_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
+        quantity_entry.insert(0, str(product[2]))
+        quantity_entry.grid(row=3, column=1, padx=5, pady=5)
+        ttk.Label(frame, text="Price (₹):", style=f"{self.theme.capitalize()}.TLabel").grid(row=4, column=0, padx=5, pady=5)
+        price_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
+        price_entry.insert(0, format_money(product[3]))
+        price_entry.grid(row=4, column=1, padx=5, pady=5)
+        ttk.Label(frame, text="Category:", style=f"{self.theme.capitalize()}.TLabel").grid(row=5, column=0, padx=5, pady=5)
+        category_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
+        category_entry.insert(0, product[4])
+        category_entry.grid(row=5, column=1, padx=5, pady=5)
+        ttk.Label(frame, text="Supplier ID (optional):", style=f"{self.theme.capitalize()}.TLabel").grid(row=6, column=0, padx=5, pady=5)
+        supplier_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
+        supplier_entry.insert(0, str(product[6]) if product[6] else "")
+        supplier_entry.grid(row=6, column=1, padx=5, pady=5)
+        if self.current_user["role"] == "admin":
+            ttk.Label(frame, text="Low Threshold:", style=f"{self.theme.capitalize()}.TLabel").grid(row=7, column=0, padx=5, pady=5)
+            threshold_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
+            threshold_entry.insert(0, str(product[5]))
+            threshold_entry.grid(row=7, column=1, padx=5, pady=5)
+        else:
+            threshold_entry = None
+        ttk.Button(frame, text="Update", command=lambda: self.process_edit_product(product[0], name_entry.get(), quantity_entry.get(), price_entry.get(), category_entry.get(), supplier_entry.get() if supplier_entry.get() else None, threshold_entry.get() if threshold_entry else None), style=f"{self.theme.capitalize()}.TButton").grid(row=8, column=0, columnspan=2, pady=10)
+        ttk.Button(frame, text="Back", command=self.create_main_screen, style=f"{self.theme.capitalize()}.TButton").grid(row=9, column=0, columnspan=2, pady=5)
 
     def process_edit_product(self, product_id, name, quantity, price, category, supplier_id, threshold):
+        self.run_task(self.update_product, product_id, name, quantity, price, category, supplier_id, threshold,
+                      on_done=lambda _: self.finish_action("Product updated successfully"))
+
+    def update_product(self, product_id, name, quantity, price, category, supplier_id, threshold):
         is_valid, message = self.validate_input(name, quantity, price, category, threshold, supplier_id)
-        if is_valid:
-            conn = sqlite3.connect('inventory.db')
-            cursor = conn.cursor()
-            try:
-                cursor.execute('BEGIN TRANSACTION')
-                cursor.execute('SELECT price FROM products WHERE id = ?', (product_id,))
-                old_price = cursor.fetchone()[0]
-                new_quantity = int(quantity)
-                cursor.execute('SELECT quantity FROM products WHERE id = ?', (product_id,))
-                old_quantity = cursor.fetchone()[0]
-                diff = new_quantity - old_quantity
-                cursor.execute('UPDATE products SET name = ?, quantity = ?, price = ?, category = ?, low_threshold = ?, supplier_id = ? WHERE id = ?', 
-                              (name, new_quantity, float(price), category, int(threshold) if threshold else 10, int(supplier_id) if supplier_id else None, product_id))
-                if diff != 0 or float(price) != old_price:
-                    cursor.execute('INSERT INTO transactions (product_id, type, quantity, date, user, new_price) VALUES (?, ?, ?, ?, ?, ?)', 
-                                  (product_id, "Adjust" if diff > 0 else "Reduce", abs(diff), datetime.now().strftime("%Y-%m-%d %H:%M:%S"), self.current_user["username"], float(price) if float(price) != old_price else None))
-                self.log_action(conn, cursor, "Edited", f"Product: {name}, ID: {product_id}")
-                conn.commit()
-                self.check_low_stock(product_id)
-                messagebox.showinfo("Success", "Product updated successfully")
-            except sqlite3.IntegrityError:
-                conn.rollback()
-                messagebox.showerror("Error", "Product name must be unique or invalid supplier ID")
-            finally:
-                conn.close()
-            self.create_main_screen()
-        else:
-            messagebox.showerror("Error", message)
+        if not is_valid:
+            raise InventoryError(message)
+        conn = db.get_connection(DB_PATH)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN TRANSACTION')
+            cursor.execute('SELECT price_paise, quantity FROM products WHERE id = ?', (product_id,))
+            row = cursor.fetchone()
+            if row is None:
+                raise InventoryError("Product not found")
+            old_price, old_quantity = row
+            price = to_paise(price)
+            new_quantity = int(quantity)
+            diff = new_quantity - old_quantity
+            cursor.execute('UPDATE products SET name = ?, quantity = ?, price_paise = ?, category = ?, low_threshold = ?, supplier_id = ? WHERE id = ?', 
+                          (name, new_quantity, price, category, int(threshold) if threshold else 10, int(supplier_id) if supplier_id else None, product_id))
+            if diff != 0 or price != old_price:
+                cursor.execute('INSERT INTO transactions (product_id, type, quantity, date_us, user, new_price_paise) VALUES (?, ?, ?, ?, ?, ?)', 
+                              (product_id, "Adjust" if diff > 0 else "Reduce", abs(diff), now_us(), self.current_user["username"], price if price != old_price else None))
+            self.log_action(conn, cursor, "Edited", f"Product: {name}, ID: {product_id}")
+            conn.commit()
+            self.product_changed(product_id)
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            raise InventoryError("Product name must be unique or invalid supplier ID")
+        except BaseException:
+            conn.rollback()
+            raise
 
     def delete_product(self):
         self.clear_screen()
@@ -417,50 +452,68 @@ class InventorySystem:
     def process_delete_product(self, product_id):
         try:
             product_id = int(product_id)
-            conn = sqlite3.connect('inventory.db')
-            cursor = conn.cursor()
-            cursor.execute('SELECT name, quantity FROM products WHERE id = ?', (product_id,))
-            product = cursor.fetchone()
-            if product:
-                cursor.execute('BEGIN TRANSACTION')
-                cursor.execute('DELETE FROM products WHERE id = ?', (product_id,))
-                cursor.execute('INSERT INTO transactions (product_id, type, quantity, date, user) VALUES (?, ?, ?, ?, ?)', 
-                              (product_id, "Delete", product[1], datetime.now().strftime("%Y-%m-%d %H:%M:%S"), self.current_user["username"]))
-                self.log_action(conn, cursor, "Deleted", f"Product: {product[0]}, ID: {product_id}")
-                conn.commit()
-                messagebox.showinfo("Success", "Product deleted successfully")
-            else:
-                messagebox.showerror("Error", "Product not found")
-            conn.close()
-            self.create_main_screen()
         except ValueError:
             messagebox.showerror("Error", "Invalid Product ID")
+            return
+        self.run_task(self.remove_product, product_id, on_done=lambda _: self.finish_action("Product deleted successfully"))
+
+    def remove_product(self, product_id):
+        conn = db.get_connection(DB_PATH)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN TRANSACTION')
+            cursor.execute('SELECT name, quantity FROM products WHERE id = ?', (product_id,))
+            product = cursor.fetchone()
+            if not product:
+                raise InventoryError("Product not found")
+            cursor.execute('DELETE FROM products WHERE id = ?', (product_id,))
+            cursor.execute('INSERT INTO transactions (product_id, type, quantity, date_us, user) VALUES (?, ?, ?, ?, ?)', 
+                          (product_id, "Delete", product[1], now_us(), self.current_user["username"]))
+            self.log_action(conn, cursor, "Deleted", f"Product: {product[0]}, ID: {product_id}")
+            conn.commit()
+            self.product_changed(product_id)
+        except BaseException:
+            conn.rollback()
+            raise
 
     def view_inventory(self):
         self.clear_screen()
         frame = ttk.Frame(self.root, padding="10", style=f"{self.theme.capitalize()}.TFrame")
         frame.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
-        # Progress bar with correct style
-        progress = ttk.Progressbar(frame, mode="indeterminate", style='Horizontal.TProgressbar')
-        progress.grid(row=0, column=0, columnspan=2, pady=5)
-        progress.start()
-        self.root.update()
         # Search bar
         search_frame = ttk.Frame(frame, style=f"{self.theme.capitalize()}.TFrame")
         search_frame.grid(row=1, column=0, pady=5, columnspan=2)
         ttk.Label(search_frame, text="Search:", style=f"{self.theme.capitalize()}.TLabel").grid(row=0, column=0, padx=5)
         search_entry = ttk.Entry(search_frame, style=f"{self.theme.capitalize()}.TEntry")
         search_entry.grid(row=0, column=1, padx=5)
-        ttk.Button(search_frame, text="Filter", command=lambda: self.filter_inventory(tree, search_entry.get()), style=f"{self.theme.capitalize()}.TButton").grid(row=0, column=2, padx=5)
-        # Treeview
-        tree = ttk.Treeview(frame, columns=("ID", "Name", "Quantity", "Price", "Category", "Threshold", "Supplier"), show="headings", style=f"{self.theme.capitalize()}.Treeview")
-        tree.heading("ID", text="ID")
-        tree.heading("Name", text="Name")
-        tree.heading("Quantity", text="Quantity")
-        tree.heading("Price", text="Price (₹)")
-        tree.heading("Category", text="Category")
-        tree.heading("Threshold", text="Threshold")
-        tree.heading("Supplier", text="Supplier Name")
+        category_box = ttk.Combobox(search_frame, state="readonly", width=24)
+        category_box.facets = {"All categories": None}
+        category_box.set("All categories")
+        category_box.grid(row=0, column=2, padx=5)
+        ttk.Button(search_frame, text="Filter", command=lambda: self.filter_inventory(grid, search_entry.get(), category_box), style=f"{self.theme.capitalize()}.TButton").grid(row=0, column=3, padx=5)
+        # Search as you type, once typing pauses
+        pending = [None]
+
+        def schedule_filter(event=None):
+            if pending[0]:
+                self.root.after_cancel(pending[0])
+            pending[0] = self.root.after(250, lambda: self.filter_inventory(grid, search_entry.get(), category_box))
+        search_entry.bind("<KeyRelease>", schedule_filter)
+        search_entry.bind("<Return>", lambda event: self.filter_inventory(grid, search_entry.get(), category_box))
+        category_box.bind("<<ComboboxSelected>>", lambda event: self.filter_inventory(grid, search_entry.get(), category_box, refresh_facets=False))
+        # Only the visible rows are fetched and held as Tk items; pages are
+        # read on demand as the grid scrolls, sorted by SQL
+        grid = VirtualTreeview(frame, inventory_search.pager(DB_PATH), ("ID", "Name", "Quantity", "Price", "Category", "Threshold", "Supplier"),
+                               lambda product: (product[0], product[1], product[2], format_money(product[3]), product[4], product[5], product[6] or "N/A"),
+                               run_task=self.run_task, style=f"{self.theme.capitalize()}.Treeview")
+        tree = grid.tree
+        grid.heading("ID", "ID", "id")
+        grid.heading("Name", "Name", "name")
+        grid.heading("Quantity", "Quantity", "quantity")
+        grid.heading("Price", "Price (₹)", "price")
+        grid.heading("Category", "Category", "category")
+        grid.heading("Threshold", "Threshold")
+        grid.heading("Supplier", "Supplier Name")
         tree.column("ID", width=50)
         tree.column("Name", width=150)
         tree.column("Quantity", width=80)
@@ -469,45 +522,60 @@ class InventorySystem:
         tree.column("Threshold", width=80)
         tree.column("Supplier", width=150)
         tree.bind("<Double-1>", lambda event: self.on_tree_double_click(event, tree))
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT p.id, p.name, p.quantity, p.price, p.category, p.low_threshold, s.name FROM products p LEFT JOIN suppliers s ON p.supplier_id = s.id')
-        products = cursor.fetchall()
-        conn.close()
-        for product in products:
-            tree.insert("", "end", values=(product[0], product[1], product[2], f"{product[3]:.2f}", product[4], product[5], product[6] or "N/A"))
-        tree.grid(row=2, column=0, columnspan=2, sticky=(tk.N, tk.S, tk.E, tk.W))
+        grid.grid(row=2, column=0, columnspan=2, sticky=(tk.N, tk.S, tk.E, tk.W))
+        grid.refresh()
+        self.update_category_facets(grid, category_box, "")
         ttk.Button(frame, text="Back", command=self.create_main_screen, style=f"{self.theme.capitalize()}.TButton").grid(row=3, column=0, columnspan=2, pady=10)
-        progress.stop()
-        progress.destroy()
 
-    def filter_inventory(self, tree, search_term):
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT p.id, p.name, p.quantity, p.price, p.category, p.low_threshold, s.name FROM products p LEFT JOIN suppliers s ON p.supplier_id = s.id WHERE p.name LIKE ? OR p.id LIKE ?', 
-                      (f'%{search_term}%', f'%{search_term}%'))
-        products = cursor.fetchall()
-        conn.close()
-        for item in tree.get_children():
-            tree.delete(item)
-        for product in products:
-            tree.insert("", "end", values=(product[0], product[1], product[2], f"{product[3]:.2f}", product[4], product[5], product[6] or "N/A"))
+    def filter_inventory(self, grid, search_term, category_box, refresh_facets=True):
+        category = category_box.facets.get(category_box.get())
+        grid.set_pager(inventory_search.pager(DB_PATH, search_term, category))
+        if refresh_facets:
+            self.update_category_facets(grid, category_box, search_term)
+
+    def update_category_facets(self, grid, category_box, search_term):
+        # Counting matches per category is an FTS match plus a GROUP BY over
+        # the whole table, so it runs as a task; only the latest one is shown
+        request = category_box.facets_request = object()
+        self.run_task(inventory_search.category_facets, DB_PATH, search_term,
+                      on_done=lambda facets: self.show_category_facets(grid, category_box, search_term, facets, request))
+
+    def show_category_facets(self, grid, category_box, search_term, facets, request):
+        # "All" plus each category with its number of matches; keeps the
+        # current category selected if it still has matches
+        if request is not category_box.facets_request or not category_box.winfo_exists():
+            return
+        selected = category_box.facets.get(category_box.get())
+        labels = {f"{category} ({count})": category for category, count in facets}
+        category_box.facets = dict({"All categories": None}, **labels)
+        category_box["values"] = list(category_box.facets)
+        category_box.set(next((label for label, category in labels.items() if category == selected), "All categories"))
+        if selected is not None and selected not in labels.values():
+            grid.set_pager(inventory_search.pager(DB_PATH, search_term))
 
     def on_tree_double_click(self, event, tree):
+        if not tree.selection():
+            return
         item = tree.selection()[0]
         product_id = tree.item(item, "values")[0]
         self.load_product_for_edit(product_id, ttk.Frame(self.root, padding="10", style=f"{self.theme.capitalize()}.TFrame"))
 
     def low_stock_alert(self):
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
+        self.run_task(self.find_low_stock, on_done=self.show_low_stock)
+
+    def find_low_stock(self):
+        cursor = db.get_connection(DB_PATH).cursor()
+        # Reads only the low rows through the partial index; notifications
+        # for them are already kept by triggers
         cursor.execute('SELECT id, name, quantity, low_threshold FROM products WHERE quantity < low_threshold')
-        low_stock = cursor.fetchall()
-        conn.close()
+        return cursor.fetchall()
+
+    def low_stock_message(self, low_stock):
+        return "Low Stock Alert:\n" + "\n".join([f"ID: {item[0]}, Name: {item[1]}, Qty: {item[2]}, Threshold: {item[3]}" for item in low_stock])
+
+    def show_low_stock(self, low_stock):
         if low_stock:
-            message = "Low Stock Alert:\n" + "\n".join([f"ID: {item[0]}, Name: {item[1]}, Qty: {item[2]}, Threshold: {item[3]}" for item in low_stock])
-            self.add_notification(f"Low stock detected: {message}")
-            messagebox.showinfo("Low Stock Alert", message)
+            messagebox.showinfo("Low Stock Alert", self.low_stock_message(low_stock))
         else:
             messagebox.showinfo("Low Stock Alert", "No low stock items")
 
@@ -526,19 +594,20 @@ class InventorySystem:
         ttk.Button(frame, text="Back", command=self.create_main_screen, style=f"{self.theme.capitalize()}.TButton").grid(row=4, column=0, columnspan=2, pady=5)
 
     def generate_sales_summary(self, start_date, end_date):
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
-        query = 'SELECT p.name, SUM(t.quantity) as total_sold, SUM(t.quantity * p.price) as total_revenue FROM products p LEFT JOIN transactions t ON p.id = t.product_id WHERE t.type = "Withdrawal"'
-        params = []
-        if start_date and end_date:
-            query += ' AND t.date BETWEEN ? AND ?'
-            params.extend([start_date, end_date])
-        query += ' GROUP BY p.name'
-        cursor.execute(query, params)
-        summary = cursor.fetchall()
-        conn.close()
+        self.run_task(self.sales_totals, start_date, end_date, on_done=self.show_sales_summary)
+
+    def sales_totals(self, start_date, end_date):
+        try:
+            for value in (start_date, end_date):
+                if value:
+                    parse_day(value)
+        except ValueError:
+            raise InventoryError("Dates must be YYYY-MM-DD")
+        return sales_rollup.summary(DB_PATH, start_date or None, end_date or None)
+
+    def show_sales_summary(self, summary):
         if summary:
-            message = "Sales Summary:\n" + "\n".join([f"Product: {item[0]}, Total Sold: {item[1] or 0}, Revenue: ₹{item[2]:.2f}" for item in summary])
+            message = "Sales Summary:\n" + "\n".join([f"Product: {item[0]}, Total Sold: {item[1] or 0}, Revenue: ₹{format_money(item[2] or 0)}" for item in summary])
             messagebox.showinfo("Sales Summary", message)
         else:
             messagebox.showinfo("Sales Summary", "No sales data available")
@@ -547,135 +616,211 @@ class InventorySystem:
         self.clear_screen()
         frame = ttk.Frame(self.root, padding="10", style=f"{self.theme.capitalize()}.TFrame")
         frame.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
-        ttk.Label(frame, text="Sell Product", font=("Arial", 14, "bold"), style=f"{self.theme.capitalize()}.TLabel").grid(row=0, column=0, columnspan=2, pady=10)
+        ttk.Label(frame, text="Sell Products", font=("Arial", 14, "bold"), style=f"{self.theme.capitalize()}.TLabel").grid(row=0, column=0, columnspan=2, pady=10)
         ttk.Label(frame, text="Product ID:", style=f"{self.theme.capitalize()}.TLabel").grid(row=1, column=0, padx=5, pady=5)
         id_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
         id_entry.grid(row=1, column=1, padx=5, pady=5)
         ttk.Label(frame, text="Quantity to Sell:", style=f"{self.theme.capitalize()}.TLabel").grid(row=2, column=0, padx=5, pady=5)
         qty_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
         qty_entry.grid(row=2, column=1, padx=5, pady=5)
-        ttk.Button(frame, text="Sell", command=lambda: self.process_sell_product(id_entry.get(), qty_entry.get()), style=f"{self.theme.capitalize()}.TButton").grid(row=3, column=0, columnspan=2, pady=10)
-        ttk.Button(frame, text="Back", command=self.create_main_screen, style=f"{self.theme.capitalize()}.TButton").grid(row=4, column=0, columnspan=2, pady=5)
-
-    def process_sell_product(self, product_id, quantity):
+        # The order being built; it is sold all at once by Checkout
+        basket = ttk.Treeview(frame, columns=("ID", "Quantity"), show="headings", height=8, style=f"{self.theme.capitalize()}.Treeview")
+        basket.heading("ID", text="Product ID")
+        basket.heading("Quantity", text="Quantity")
+        basket.column("ID", width=100)
+        basket.column("Quantity", width=80)
+        ttk.Button(frame, text="Add Line", command=lambda: self.add_order_line(basket, id_entry, qty_entry), style=f"{self.theme.capitalize()}.TButton").grid(row=3, column=0, pady=5)
+        ttk.Button(frame, text="Remove Line", command=lambda: basket.delete(*basket.selection()), style=f"{self.theme.capitalize()}.TButton").grid(row=3, column=1, pady=5)
+        qty_entry.bind("<Return>", lambda event: self.add_order_line(basket, id_entry, qty_entry))
+        basket.grid(row=4, column=0, columnspan=2, pady=5)
+        ttk.Button(frame, text="Checkout", command=lambda: self.process_checkout([basket.item(item, "values") for item in basket.get_children()]), style=f"{self.theme.capitalize()}.TButton").grid(row=5, column=0, columnspan=2, pady=10)
+        ttk.Button(frame, text="Back", command=self.create_main_screen, style=f"{self.theme.capitalize()}.TButton").grid(row=6, column=0, columnspan=2, pady=5)
+
+    def add_order_line(self, basket, id_entry, qty_entry):
         try:
-            product_id = int(product_id)
-            quantity = int(quantity)
-            if quantity <= 0:
-                messagebox.showerror("Error", "Quantity must be positive")
-                return
-            conn = sqlite3.connect('inventory.db')
-            cursor = conn.cursor()
-            cursor.execute('BEGIN TRANSACTION')
-            cursor.execute('SELECT quantity, price FROM products WHERE id = ?', (product_id,))
-            result = cursor.fetchone()
-            if not result:
-                messagebox.showerror("Error", "Product not found")
-                conn.rollback()
-                conn.close()
-                return
-            current_quantity, price = result
-            if current_quantity < quantity:
-                messagebox.showerror("Error", "Insufficient stock")
-                conn.rollback()
-                conn.close()
-                return
-            new_quantity = current_quantity - quantity
-            cursor.execute('UPDATE products SET quantity = ? WHERE id = ?', (new_quantity, product_id))
-            cursor.execute('INSERT INTO transactions (product_id, type, quantity, date, user, new_price) VALUES (?, ?, ?, ?, ?, ?)', 
-                          (product_id, "Withdrawal", quantity, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), self.current_user["username"], price))
-            self.log_action(conn, cursor, "Sold", f"Product ID: {product_id}, Quantity: {quantity}")
-            conn.commit()
-            self.check_low_stock(product_id)
-            messagebox.showinfo("Success", f"Sold {quantity} units of product ID {product_id}")
+            product_id = int(id_entry.get())
+            quantity = int(qty_entry.get())
         except ValueError:
             messagebox.showerror("Error", "Invalid Product ID or Quantity")
-        finally:
-            conn.close()
-        self.create_main_screen()
+            return
+        if quantity <= 0:
+            messagebox.showerror("Error", "Quantity must be positive")
+            return
+        basket.insert("", "end", values=(product_id, quantity))
+        id_entry.delete(0, tk.END)
+        qty_entry.delete(0, tk.END)
+        id_entry.focus_set()
+
+    def process_checkout(self, lines):
+        if not lines:
+            messagebox.showerror("Error", "Add at least one line to the order")
+            return
+        self.run_task(self.sell_order, lines,
+                      on_done=lambda sold: self.finish_action(f"Sold {sum(line[1] for line in sold)} units across {len(sold)} products"))
+
+    def sell_order(self, lines):
+        # All lines or none: any shortage rolls back the whole order
+        sold = checkout.checkout(lines, DB_PATH, self.current_user["username"])
+        for product_id, _, _ in sold:
+            self.product_changed(product_id)
+        return sold
 
     def import_csv(self):
         file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
         if not file_path:
             return
-        with open(file_path, 'r', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            conn = sqlite3.connect('inventory.db')
-            cursor = conn.cursor()
-            for row in reader:
-                is_valid, message = self.validate_input(row['name'], row['quantity'], row['price'], row['category'], row.get('low_threshold'), row.get('supplier_id'))
-                if is_valid:
-                    try:
-                        cursor.execute('BEGIN TRANSACTION')
-                        cursor.execute('INSERT INTO products (name, quantity, price, category, low_threshold, supplier_id) VALUES (?, ?, ?, ?, ?, ?)', 
-                                      (row['name'], int(row['quantity']), float(row['price']), row['category'], int(row['low_threshold']) if row.get('low_threshold') else 10, int(row['supplier_id']) if row.get('supplier_id') else None))
-                        product_id = cursor.lastrowid
-                        cursor.execute('INSERT INTO transactions (product_id, type, quantity, date, user, new_price) VALUES (?, ?, ?, ?, ?, ?)', 
-                                      (product_id, "Add", int(row['quantity']), datetime.now().strftime("%Y-%m-%d %H:%M:%S"), self.current_user["username"], float(row['price'])))
-                        self.log_action(conn, cursor, "Imported", f"Product: {row['name']}, ID: {product_id}")
-                        conn.commit()
-                    except sqlite3.IntegrityError:
-                        conn.rollback()
-                        continue
-            conn.close()
-        messagebox.showinfo("Success", "CSV imported successfully")
-        self.create_main_screen()
+        mode = "upsert" if messagebox.askyesno("Import CSV", "Update products that already exist?\n(No skips them)") else "skip"
+        self.clear_screen()
+        frame = ttk.Frame(self.root, padding="10", style=f"{self.theme.capitalize()}.TFrame")
+        frame.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
+        ttk.Label(frame, text="Importing CSV", font=("Arial", 14, "bold"), style=f"{self.theme.capitalize()}.TLabel").grid(row=0, column=0, pady=10)
+        status = ttk.Label(frame, text="Starting...", style=f"{self.theme.capitalize()}.TLabel")
+        status.grid(row=1, column=0, padx=5, pady=5)
+        # Each chunk commits on its own, so cancelling keeps what was
+        # already imported
+        task = self.tasks.submit(self.import_products, file_path, mode,
+                                 on_progress=lambda stats: status.config(text=inventory_import.describe(stats)),
+                                 on_done=self.finish_import, on_error=self.import_failed,
+                                 on_cancel=lambda: self.finish_action("Import cancelled; rows imported before that were kept"))
+        ttk.Button(frame, text="Cancel", command=task.cancel, style=f"{self.theme.capitalize()}.TButton").grid(row=2, column=0, pady=5)
+
+    def import_products(self, file_path, mode, progress):
+        try:
+            return inventory_import.import_csv(file_path, DB_PATH, self.current_user["username"], mode, progress)
+        finally:
+            self.product_changed()
+
+    def finish_import(self, stats):
+        details = "\n".join(stats["errors"][:10])
+        self.finish_action(f"CSV imported in {stats['seconds']:.1f}s\n{inventory_import.describe(stats)}" + (f"\n\n{details}" if details else ""))
+
+    def import_failed(self, error):
+        if isinstance(error, (OSError, UnicodeDecodeError, csv.Error, sqlite3.Error)):
+            messagebox.showerror("Error", f"Import failed: {error}")
+            self.create_main_screen()
+        else:
+            self.show_task_error(error)
 
     def export_data(self, type):
-        file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
+        self.clear_screen()
+        frame = ttk.Frame(self.root, padding="10", style=f"{self.theme.capitalize()}.TFrame")
+        frame.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
+        ttk.Label(frame, text=f"Export {type.capitalize()}", font=("Arial", 14, "bold"), style=f"{self.theme.capitalize()}.TLabel").grid(row=0, column=0, columnspan=2, pady=10)
+        selected = {}
+        row = 1
+        for key, (header, _, _) in inventory_export.EXPORTS[type]["columns"].items():
+            selected[key] = tk.BooleanVar(value=True)
+            ttk.Checkbutton(frame, text=header, variable=selected[key]).grid(row=row, column=0, columnspan=2, sticky=tk.W, padx=5)
+            row += 1
+        start_entry = end_entry = None
+        if inventory_export.EXPORTS[type]["date"]:
+            ttk.Label(frame, text="From (YYYY-MM-DD):", style=f"{self.theme.capitalize()}.TLabel").grid(row=row, column=0, padx=5, pady=5)
+            start_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
+            start_entry.grid(row=row, column=1, padx=5, pady=5)
+            ttk.Label(frame, text="To (YYYY-MM-DD):", style=f"{self.theme.capitalize()}.TLabel").grid(row=row + 1, column=0, padx=5, pady=5)
+            end_entry = ttk.Entry(frame, style=f"{self.theme.capitalize()}.TEntry")
+            end_entry.grid(row=row + 1, column=1, padx=5, pady=5)
+            row += 2
+        status = ttk.Label(frame, text="", style=f"{self.theme.capitalize()}.TLabel")
+        status.grid(row=row + 2, column=0, columnspan=2, pady=5)
+        ttk.Button(frame, text="Export", command=lambda: self.process_export(
+            type, [key for key, var in selected.items() if var.get()],
+            start_entry.get().strip() if start_entry else None, end_entry.get().strip() if end_entry else None, status),
+            style=f"{self.theme.capitalize()}.TButton").grid(row=row, column=0, columnspan=2, pady=5)
+        ttk.Button(frame, text="Back", command=self.create_main_screen, style=f"{self.theme.capitalize()}.TButton").grid(row=row + 1, column=0, columnspan=2, pady=5)
+
+    def process_export(self, type, columns, start_date, end_date, status):
+        if not columns:
+            messagebox.showerror("Error", "Select at least one column")
+            return
+        try:
+            for value in (start_date, end_date):
+                if value:
+                    parse_day(value)
+        except ValueError:
+            messagebox.showerror("Error", "Dates must be YYYY-MM-DD")
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv"), ("Gzipped CSV files", "*.csv.gz"), ("Parquet files", "*.parquet")])
         if not file_path:
             return
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
-        if type == "inventory":
-            cursor.execute('SELECT p.id, p.name, p.quantity, p.price, p.category, p.low_threshold, s.name FROM products p LEFT JOIN suppliers s ON p.supplier_id = s.id')
-            data = cursor.fetchall()
-            with open(file_path, 'w', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(["ID", "Name", "Quantity", "Price", "Category", "Threshold", "Supplier"])
-                for row in data:
-                    writer.writerow([row[0], row[1], row[2], f"{row[3]:.2f}", row[4], row[5], row[6] or "N/A"])
-        elif type == "sales":
-            cursor.execute('SELECT p.name, t.quantity, t.date, t.new_price FROM transactions t JOIN products p ON t.product_id = p.id WHERE t.type = "Withdrawal"')
-            data = cursor.fetchall()
-            with open(file_path, 'w', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(["Product", "Quantity Sold", "Date", "Price"])
-                for row in data:
-                    writer.writerow([row[0], row[1], row[2], f"{row[3]:.2f}" if row[3] else "N/A"])
-        conn.close()
-        messagebox.showinfo("Success", f"{type.capitalize()} data exported to {file_path}")
+        status.config(text="Exporting...")
+
+        def show(text):
+            # The user may have left this screen while the export runs
+            if status.winfo_exists():
+                status.config(text=text)
+        cancel_button = ttk.Button(status.master, text="Cancel", style=f"{self.theme.capitalize()}.TButton")
+        cancel_button.grid(row=int(status.grid_info()["row"]) + 1, column=0, columnspan=2, pady=5)
+
+        def done(count):
+            cancel_button.destroy()
+            show(f"{count} rows written")
+            messagebox.showinfo("Success", f"{type.capitalize()} data exported to {file_path} ({count} rows)")
+
+        def failed(error):
+            cancel_button.destroy()
+            show("")
+            if isinstance(error, (OSError, RuntimeError, ValueError, sqlite3.Error)):
+                messagebox.showerror("Error", f"Export failed: {error}")
+            else:
+                self.show_task_error(error)
+
+        def cancelled():
+            # Don't leave a truncated file behind
+            cancel_button.destroy()
+            show("Export cancelled")
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+        task = self.tasks.submit(inventory_export.export, type, file_path, DB_PATH, columns, start_date or None, end_date or None,
+                                 on_progress=lambda count: show(f"{count} rows written..."),
+                                 on_done=done, on_error=failed, on_cancel=cancelled)
+        cancel_button.config(command=task.cancel)
 
     def backup_db(self):
-        backup_path = filedialog.asksaveasfilename(defaultextension=".db", filetypes=[("Database files", "*.db")])
+        backup_path = filedialog.asksaveasfilename(defaultextension=".db", filetypes=[("Database files", "*.db"), ("Gzipped database files", "*.db.gz"), ("Zstandard database files", "*.db.zst")])
         if not backup_path:
             return
-        conn = sqlite3.connect('inventory.db')
-        conn.backup(sqlite3.connect(backup_path))
-        conn.close()
-        messagebox.showinfo("Success", f"Database backed up to {backup_path}")
+        self.clear_screen()
+        frame = ttk.Frame(self.root, padding="10", style=f"{self.theme.capitalize()}.TFrame")
+        frame.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
+        ttk.Label(frame, text="Backing up database", font=("Arial", 14, "bold"), style=f"{self.theme.capitalize()}.TLabel").grid(row=0, column=0, pady=10)
+        status = ttk.Label(frame, text="Starting...", style=f"{self.theme.capitalize()}.TLabel")
+        status.grid(row=1, column=0, padx=5, pady=5)
+        # The copy is one read snapshot, so the app and other writers keep
+        # working; nothing is left behind if it is cancelled
+        task = self.tasks.submit(backup.backup, DB_PATH, backup_path,
+                                 on_progress=lambda done: status.config(text=f"{done[0]} of {done[1]} pages written..."),
+                                 on_done=lambda size: self.finish_action(f"Database backed up to {backup_path} ({size / 1048576:.1f} MB, integrity check passed)"),
+                                 on_error=self.backup_failed,
+                                 on_cancel=lambda: self.finish_action("Backup cancelled"))
+        ttk.Button(frame, text="Cancel", command=task.cancel, style=f"{self.theme.capitalize()}.TButton").grid(row=2, column=0, pady=5)
+
+    def backup_failed(self, error):
+        if isinstance(error, (OSError, RuntimeError, sqlite3.Error)):
+            messagebox.showerror("Error", f"Backup failed: {error}")
+            self.create_main_screen()
+        else:
+            self.show_task_error(error)
 
     def approve_users(self):
+        self.run_task(self.query, 'SELECT username FROM users WHERE role = "pending" AND approved = 0', on_done=self.show_pending_users)
+
+    def show_pending_users(self, pending_users):
         self.clear_screen()
         frame = ttk.Frame(self.root, padding="10", style=f"{self.theme.capitalize()}.TFrame")
         frame.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
         ttk.Label(frame, text="Approve Users", font=("Arial", 14, "bold"), style=f"{self.theme.capitalize()}.TLabel").grid(row=0, column=0, pady=10)
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT username FROM users WHERE role = "pending" AND approved = 0')
-        pending_users = cursor.fetchall()
-        conn.close()
         for i, user in enumerate(pending_users, start=1):
             ttk.Label(frame, text=user[0], style=f"{self.theme.capitalize()}.TLabel").grid(row=i, column=0, padx=5, pady=5)
             ttk.Button(frame, text="Approve", command=lambda u=user[0]: self.approve_user(u), style=f"{self.theme.capitalize()}.TButton").grid(row=i, column=1, padx=5, pady=5)
         ttk.Button(frame, text="Back", command=self.create_main_screen, style=f"{self.theme.capitalize()}.TButton").grid(row=len(pending_users) + 1, column=0, columnspan=2, pady=5)
 
     def approve_user(self, username):
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET approved = 1, role = "staff" WHERE username = ?', (username,))
-        conn.commit()
-        conn.close()
+        self.run_task(self.execute, 'UPDATE users SET approved = 1, role = "staff" WHERE username = ?', (username,),
+                      on_done=lambda _: self.finish_approve_user(username))
+
+    def finish_approve_user(self, username):
         messagebox.showinfo("Success", f"User {username} approved")
         self.approve_users()
 
@@ -693,14 +838,8 @@ class InventorySystem:
         tree.column("ID", width=50)
         tree.column("Name", width=150)
         tree.column("Contact", width=150)
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, name, contact FROM suppliers')
-        suppliers = cursor.fetchall()
-        conn.close()
-        for supplier in suppliers:
-            tree.insert("", "end", values=supplier)
         tree.grid(row=1, column=0, columnspan=2, pady=5)
+        self.run_task(self.query, 'SELECT id, name, contact FROM suppliers', on_done=lambda suppliers: self.fill_tree(tree, suppliers))
 
         # Add new supplier form
         ttk.Label(frame, text="New Supplier Name:", style=f"{self.theme.capitalize()}.TLabel").grid(row=2, column=0, padx=5, pady=5)
@@ -712,29 +851,35 @@ class InventorySystem:
         ttk.Button(frame, text="Add Supplier", command=lambda: self.process_add_supplier(name_entry.get(), contact_entry.get()), style=f"{self.theme.capitalize()}.TButton").grid(row=4, column=0, columnspan=2, pady=5)
         ttk.Button(frame, text="Back", command=self.create_main_screen, style=f"{self.theme.capitalize()}.TButton").grid(row=5, column=0, columnspan=2, pady=5)
 
+    def fill_tree(self, tree, rows):
+        if tree.winfo_exists():
+            for row in rows:
+                tree.insert("", "end", values=row)
+
     def process_add_supplier(self, name, contact):
         if not name:
             messagebox.showerror("Error", "Supplier name is required")
             return
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
+        self.run_task(self.add_supplier, name, contact, on_done=lambda supplier_id: self.finish_add_supplier(name, supplier_id))
+
+    def add_supplier(self, name, contact):
         try:
-            cursor.execute('INSERT INTO suppliers (name, contact) VALUES (?, ?)', (name, contact))
-            conn.commit()
-            messagebox.showinfo("Success", f"Supplier '{name}' added with ID {cursor.lastrowid}")
-            self.manage_suppliers()  # Refresh the screen
+            supplier_id = self.execute('INSERT INTO suppliers (name, contact) VALUES (?, ?)', (name, contact))
+            # Entries are keyed by the ID as typed, so drop them all
+            supplier_cache.clear()
+            return supplier_id
         except sqlite3.IntegrityError:
-            conn.rollback()
-            messagebox.showerror("Error", "Supplier name must be unique")
-        finally:
-            conn.close()
+            db.get_connection(DB_PATH).rollback()
+            raise InventoryError("Supplier name must be unique")
+
+    def finish_add_supplier(self, name, supplier_id):
+        messagebox.showinfo("Success", f"Supplier '{name}' added with ID {supplier_id}")
+        self.manage_suppliers()  # Refresh the screen
 
     def view_notifications(self):
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, message, date, status FROM notifications')
-        notifications = cursor.fetchall()
-        conn.close()
+        self.run_task(self.query, 'SELECT id, message, date_us, status FROM notifications', on_done=self.show_notifications)
+
+    def show_notifications(self, notifications):
         self.clear_screen()
         frame = ttk.Frame(self.root, padding="10", style=f"{self.theme.capitalize()}.TFrame")
         frame.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
@@ -742,36 +887,14 @@ class InventorySystem:
         text = scrolledtext.ScrolledText(frame, width=50, height=10, bg=self.style.lookup(f"{self.theme.capitalize()}.TEntry", 'fieldbackground'), fg=self.style.lookup(f"{self.theme.capitalize()}.TEntry", 'foreground'))
         text.grid(row=1, column=0, pady=5)
         for notif in notifications:
-            text.insert(tk.END, f"ID: {notif[0]}, Msg: {notif[1]}, Date: {notif[2]}, Status: {notif[3]}\n")
+            text.insert(tk.END, f"ID: {notif[0]}, Msg: {notif[1]}, Date: {format_us(notif[2])}, Status: {notif[3]}\n")
         if self.current_user["role"] == "admin":
             ttk.Button(frame, text="Mark All Resolved", command=self.mark_all_resolved, style=f"{self.theme.capitalize()}.TButton").grid(row=2, column=0, pady=5)
         ttk.Button(frame, text="Back", command=self.create_main_screen, style=f"{self.theme.capitalize()}.TButton").grid(row=3, column=0, pady=5)
 
     def mark_all_resolved(self):
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
-        cursor.execute('UPDATE notifications SET status = ? WHERE status = ?', ('resolved', 'pending'))
-        conn.commit()
-        conn.close()
-        messagebox.showinfo("Success", "All notifications marked as resolved")
-        self.create_main_screen()
-
-    def add_notification(self, message):
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO notifications (message, date) VALUES (?, ?)', 
-                      (message, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-        conn.commit()
-        conn.close()
-
-    def check_low_stock(self, product_id):
-        conn = sqlite3.connect('inventory.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT quantity, low_threshold FROM products WHERE id = ?', (product_id,))
-        result = cursor.fetchone()
-        if result and result[0] < result[1]:
-            self.add_notification(f"Low stock for product ID {product_id}: Quantity {result[0]} below threshold {result[1]}")
-        conn.close()
+        self.run_task(self.execute, 'UPDATE notifications SET status = ? WHERE status = ?', ('resolved', 'pending'),
+                      on_done=lambda _: self.finish_action("All notifications marked as resolved"))
 
 if __name__ == "__main__":
     root = tk.Tk()
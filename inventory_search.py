@@ -0,0 +1,59 @@
+import re
+import db
+from virtual_tree import KeysetPager
+
+# Shared by the plain inventory grid and search results
+SELECT_SQL = 'p.id, p.name, p.quantity, p.price_paise, p.category, p.low_threshold, s.name'
+FROM_SQL = 'products p LEFT JOIN suppliers s ON p.supplier_id = s.id'
+SORT_COLUMNS = {"id": "p.id", "name": "p.name", "quantity": "p.quantity", "price": "p.price_paise", "category": "p.category"}
+SEARCH_FROM_SQL = 'products_fts f JOIN products p ON p.id = f.rowid LEFT JOIN suppliers s ON p.supplier_id = s.id'
+
+
+def match_query(term):
+    # Every word must match the start of a token in the product's id, name,
+    # category or supplier: "blu wid" finds "Blue Widget". Quoting each
+    # word keeps FTS5 operators in user input from being interpreted.
+    words = re.findall(r"\w+", term)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def _filter(term, category):
+    where, params = [], []
+    query = match_query(term or "")
+    if query:
+        where.append('products_fts MATCH ?')
+        params.append(query)
+    if category:
+        where.append('p.category = ?')
+        params.append(category)
+    return " AND ".join(where), params
+
+
+def pager(db_path='inventory.db', term="", category=None):
+    # A KeysetPager for the inventory grid. With a search term the rows
+    # come from the FTS index, best matches first (bm25 rank); without one
+    # it is the whole catalog in id order.
+    where, params = _filter(term, category)
+    if match_query(term or ""):
+        result = KeysetPager(db_path, SELECT_SQL, SEARCH_FROM_SQL, dict(rank="f.rank", **SORT_COLUMNS), "p.id")
+    else:
+        result = KeysetPager(db_path, SELECT_SQL, FROM_SQL, SORT_COLUMNS, "p.id")
+    result.set_filter(where, params)
+    return result
+
+
+def category_facets(db_path='inventory.db', term=""):
+    # (category, number of matching products), largest first
+    query = match_query(term or "")
+    conn = db.get_connection(db_path)
+    if query:
+        return conn.execute('''
+            SELECT p.category, COUNT(*) FROM products_fts f JOIN products p ON p.id = f.rowid
+            WHERE products_fts MATCH ? GROUP BY p.category ORDER BY COUNT(*) DESC, p.category
+        ''', (query,)).fetchall()
+    return conn.execute('SELECT category, COUNT(*) FROM products GROUP BY category ORDER BY COUNT(*) DESC, category').fetchall()
+
+
+def search(db_path='inventory.db', term="", category=None, limit=20):
+    # Top matches as (id, name, quantity, price_paise, category, threshold, supplier)
+    return pager(db_path, term, category).rows(0, limit)
@@ -0,0 +1,230 @@
+from collections import namedtuple
+import db
+from timestamps import local_day, now_us
+
+
+class LedgerError(Exception):
+    pass
+
+
+class AccountNotFound(LedgerError):
+    pass
+
+
+class InsufficientFunds(LedgerError):
+    pass
+
+
+# A compare-and-swap on an account's version kept failing
+class ConcurrentUpdate(LedgerError):
+    pass
+
+
+# One entry for Ledger.apply_batch; target is only used by "transfer",
+# daily_limit only by "withdraw", where it is required
+class Operation(namedtuple("Operation", ["kind", "account_number", "amount", "target", "daily_limit"])):
+    __slots__ = ()
+
+    def __new__(cls, kind, account_number, amount, target=None, daily_limit=None):
+        if kind == "withdraw" and daily_limit is None:
+            raise ValueError("A withdraw operation needs a daily_limit")
+        return super().__new__(cls, kind, account_number, amount, target, daily_limit)
+
+
+# Applies deposits, withdrawals and transfers as single BEGIN IMMEDIATE
+# transactions. All amounts are integer paise (see money.py). Balances are
+# changed with relative, guarded UPDATEs so two terminals working on the
+# same account can never overwrite each other. Every change bumps the
+# account's version. A transaction that still finds the database busy
+# after busy_timeout is retried with backoff.
+class Ledger:
+    def __init__(self, db_path='atm.db'):
+        self.db_path = db_path
+
+    def deposit(self, account_number, amount):
+        return self._run(lambda cursor: self._deposit(cursor, account_number, amount))
+
+    def withdraw(self, account_number, amount, daily_limit):
+        return self._run(lambda cursor: self._withdraw(cursor, account_number, amount, daily_limit))
+
+    def transfer(self, account_number, target_account_number, amount):
+        return self._run(lambda cursor: self._transfer(cursor, account_number, target_account_number, amount))
+
+    def apply_batch(self, operations):
+        # Apply many operations under one commit. Each operation runs in its
+        # own savepoint, so a failed one is undone without touching the rest.
+        # Returns a list of (ok, result) where result is the account's
+        # (balance_paise, withdrawn_today_paise, version) on success or the error message.
+        handlers = {
+            "deposit": lambda cursor, op: self._deposit(cursor, op.account_number, op.amount),
+            "withdraw": lambda cursor, op: self._withdraw(cursor, op.account_number, op.amount, op.daily_limit),
+            "transfer": lambda cursor, op: self._transfer(cursor, op.account_number, op.target, op.amount),
+        }
+
+        def run_all(cursor):
+            results = []
+            for op in operations:
+                handler = handlers.get(op.kind)
+                if handler is None:
+                    results.append((False, f"Unknown operation: {op.kind}"))
+                    continue
+                cursor.execute('SAVEPOINT ledger_op')
+                try:
+                    results.append((True, handler(cursor, op)))
+                except LedgerError as e:
+                    cursor.execute('ROLLBACK TO ledger_op')
+                    results.append((False, str(e)))
+                cursor.execute('RELEASE ledger_op')
+            return results
+
+        return self._run(run_all)
+
+    def set_pin_hash(self, account_number, pin_hash, version):
+        # Replace the PIN hash only if the account is still at version;
+        # returns whether it was
+        def work(cursor):
+            cursor.execute('UPDATE accounts SET pin_hash = ?, version = version + 1 WHERE account_number = ? AND version = ?',
+                           (pin_hash, account_number, version))
+            return cursor.rowcount > 0
+        return self._run(work)
+
+    # The three steps of a transfer between accounts on different shards,
+    # each one transaction on this ledger's database and recorded in its
+    # transfer_journal under the transfer id xid. account_store.AccountStore
+    # runs them in order and settles transfers whose coordinator died.
+
+    def transfer_out(self, xid, account_number, target_account_number, amount):
+        # On the source shard: debit the account and journal the transfer
+        # as prepared. Returns the account's balance like transfer().
+        def work(cursor):
+            self._check_amount(amount)
+            cursor.execute('''
+                UPDATE accounts SET balance_paise = balance_paise - ?, version = version + 1 WHERE account_number = ? AND balance_paise >= ?
+            ''', (amount, account_number, amount))
+            if cursor.rowcount == 0:
+                self._balance(cursor, account_number)  # raises AccountNotFound for unknown accounts
+                raise InsufficientFunds("Insufficient funds")
+            transaction_id = self._record(cursor, account_number, "Transfer Out", amount)
+            self._journal(cursor, xid, "source", account_number, target_account_number, amount, transaction_id, "prepared")
+            return self._balance(cursor, account_number)
+        return self._run(work)
+
+    def transfer_in(self, xid, account_number, source_account_number, amount, abort=False):
+        # On the target shard, and the point of no return: credit the
+        # account and journal the transfer as committed, or as aborted if
+        # the account does not exist or abort is set. Whichever state is
+        # journalled first for xid wins; returns it.
+        def work(cursor):
+            cursor.execute('SELECT state FROM transfer_journal WHERE xid = ?', (xid,))
+            row = cursor.fetchone()
+            if row is not None:
+                return row[0]
+            transaction_id = None
+            if not abort:
+                cursor.execute('UPDATE accounts SET balance_paise = balance_paise + ?, version = version + 1 WHERE account_number = ?', (amount, account_number))
+                if cursor.rowcount:
+                    transaction_id = self._record(cursor, account_number, "Transfer In", amount)
+            state = "aborted" if transaction_id is None else "committed"
+            self._journal(cursor, xid, "target", account_number, source_account_number, amount, transaction_id, state)
+            return state
+        return self._run(work)
+
+    def finish_transfer_out(self, xid, state):
+        # Back on the source shard: mark the transfer committed, or refund
+        # the debit and drop its history row if it was aborted. Does nothing
+        # if xid is already finished.
+        def work(cursor):
+            cursor.execute("SELECT account_number, amount_paise, transaction_id FROM transfer_journal WHERE xid = ? AND state = 'prepared'", (xid,))
+            row = cursor.fetchone()
+            if row is None:
+                return
+            account_number, amount, transaction_id = row
+            if state == "aborted":
+                cursor.execute('UPDATE accounts SET balance_paise = balance_paise + ?, version = version + 1 WHERE account_number = ?', (amount, account_number))
+                cursor.execute('DELETE FROM transactions WHERE id = ?', (transaction_id,))
+            cursor.execute('UPDATE transfer_journal SET state = ?, updated_us = ? WHERE xid = ?', (state, now_us(), xid))
+        return self._run(work)
+
+    def _run(self, work):
+        return db.retry_busy(lambda: self._attempt(work))
+
+    def _attempt(self, work):
+        conn = db.get_connection(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            result = work(cursor)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return result
+
+    def _deposit(self, cursor, account_number, amount):
+        self._check_amount(amount)
+        cursor.execute('UPDATE accounts SET balance_paise = balance_paise + ?, version = version + 1 WHERE account_number = ?', (amount, account_number))
+        if cursor.rowcount == 0:
+            raise AccountNotFound("Account not found")
+        self._record(cursor, account_number, "Deposit", amount)
+        return self._balance(cursor, account_number)
+
+    def _withdraw(self, cursor, account_number, amount, daily_limit):
+        self._check_amount(amount)
+        # A counter left from an earlier day counts as zero and is restarted
+        # by this same statement, so nothing has to reset it beforehand
+        cursor.execute('''
+            UPDATE accounts SET balance_paise = balance_paise - :amount,
+                withdrawn_today_paise = (CASE WHEN withdrawal_day = :day THEN withdrawn_today_paise ELSE 0 END) + :amount,
+                withdrawal_day = :day, version = version + 1
+            WHERE account_number = :account_number AND balance_paise >= :amount
+              AND (CASE WHEN withdrawal_day = :day THEN withdrawn_today_paise ELSE 0 END) + :amount <= :daily_limit
+        ''', {"amount": amount, "day": local_day(), "account_number": account_number, "daily_limit": daily_limit})
+        if cursor.rowcount == 0:
+            self._balance(cursor, account_number)  # raises AccountNotFound for unknown accounts
+            raise InsufficientFunds("Insufficient funds or daily withdrawal limit reached")
+        self._record(cursor, account_number, "Withdrawal", amount)
+        return self._balance(cursor, account_number)
+
+    def _transfer(self, cursor, account_number, target_account_number, amount):
+        self._check_amount(amount)
+        if account_number == target_account_number:
+            raise LedgerError("Cannot transfer to the same account")
+        cursor.execute('''
+            UPDATE accounts SET balance_paise = balance_paise - ?, version = version + 1 WHERE account_number = ? AND balance_paise >= ?
+        ''', (amount, account_number, amount))
+        if cursor.rowcount == 0:
+            self._balance(cursor, account_number)  # raises AccountNotFound for unknown accounts
+            raise InsufficientFunds("Insufficient funds")
+        cursor.execute('UPDATE accounts SET balance_paise = balance_paise + ?, version = version + 1 WHERE account_number = ?', (amount, target_account_number))
+        if cursor.rowcount == 0:
+            raise AccountNotFound("Target account not found")
+        self._record(cursor, account_number, "Transfer Out", amount)
+        self._record(cursor, target_account_number, "Transfer In", amount)
+        return self._balance(cursor, account_number)
+
+    def _check_amount(self, amount):
+        if not isinstance(amount, int) or amount <= 0:
+            raise LedgerError("Invalid amount")
+
+    def _balance(self, cursor, account_number):
+        cursor.execute('''
+            SELECT balance_paise, CASE WHEN withdrawal_day = ? THEN withdrawn_today_paise ELSE 0 END, version FROM accounts WHERE account_number = ?
+        ''', (local_day(), account_number))
+        row = cursor.fetchone()
+        if row is None:
+            raise AccountNotFound("Account not found")
+        return row
+
+    def _record(self, cursor, account_number, transaction_type, amount):
+        cursor.execute('''
+            INSERT INTO transactions (account_number, type, amount_paise, date_us)
+            VALUES (?, ?, ?, ?)
+        ''', (account_number, transaction_type, amount, now_us()))
+        return cursor.lastrowid
+
+    def _journal(self, cursor, xid, role, account_number, peer_account, amount, transaction_id, state):
+        now = now_us()
+        cursor.execute('''
+            INSERT INTO transfer_journal (xid, role, account_number, peer_account, amount_paise, transaction_id, state, created_us, updated_us)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (xid, role, account_number, peer_account, amount, transaction_id, state, now, now))
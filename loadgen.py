@@ -0,0 +1,541 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+import account_store
+import atm_service
+import audit
+import checkout
+import credentials
+import db
+import instrumentation
+import inventory_search
+import migrations
+import sales_rollup
+from ledger import LedgerError
+from timestamps import US_PER_SECOND, now_us
+
+# Synthetic datasets and a headless load generator for the ATM and
+# inventory hot paths. "seed" builds bench databases at a given scale,
+# "run" drives the business logic (AtmService, checkout, search, sales
+# summaries) from N worker threads with a weighted mix of operations and
+# writes per-operation throughput and latency percentiles as JSON,
+# "contention" hammers a few accounts from many threads and processes and
+# checks that no money was created or lost, and "compare" prints the
+# change between two result files.
+
+PIN = "1234"
+# Ten-digit account numbers, so seeded and contention accounts never meet
+# each other or the demo account the ATM schema creates
+SEED_ACCOUNT_BASE = 2000000000
+ADJECTIVES = ["Blue", "Red", "Green", "Steel", "Wooden", "Plastic", "Large", "Small", "Heavy", "Light", "Premium", "Basic",
+              "Smart", "Classic", "Compact", "Portable", "Digital", "Organic", "Frozen", "Fresh"]
+NOUNS = ["Widget", "Bolt", "Hammer", "Chair", "Table", "Lamp", "Cable", "Charger", "Bottle", "Notebook", "Pen", "Shirt",
+         "Shoe", "Rice", "Tea", "Coffee", "Soap", "Towel", "Battery", "Speaker"]
+CATEGORIES = [f"Category {i}" for i in range(50)]
+ATM_TYPES = ["Deposit", "Withdrawal", "Transfer In", "Transfer Out"]
+DEFAULT_MIX = {
+    "atm_login": 10, "atm_balance": 15, "atm_withdraw": 15, "atm_deposit": 10, "atm_transfer": 5, "atm_history": 10,
+    "inv_sale": 15, "inv_checkout": 3, "inv_search": 15, "inv_sales_summary": 2,
+}
+
+
+def _fresh(path, force):
+    if os.path.exists(path):
+        if not force:
+            raise SystemExit(f"{path} already exists; pass --force to replace it")
+        db.close_all()
+        stem, ext = os.path.splitext(path)
+        for name in [path] + glob.glob(f"{glob.escape(stem)}.shard*{ext}"):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(name + suffix):
+                    os.remove(name + suffix)
+
+
+def _spread(count, days, rng):
+    # count ascending event times over the last days days
+    end = now_us()
+    start = end - days * 86400 * US_PER_SECOND
+    step = (end - start) // max(count, 1)
+    return (start + i * step + rng.randrange(step or 1) for i in range(count))
+
+
+def seed_atm(path, accounts=10000, transactions=1000000, days=365, seed=1, force=False, chunk=50000, shards=1):
+    rng = random.Random(seed)
+    _fresh(path, force)
+    atm_service.init_db(path)
+    conn = db.get_connection(path)
+    # One hash for every account: hashing is deliberately slow and the
+    # login benchmark verifies it all the same
+    pin_hash = credentials.hash_pin(PIN)
+    numbers = [str(SEED_ACCOUNT_BASE + i) for i in range(accounts)]
+    # Every account in a bench database has PIN, so login errors mean something
+    conn.execute('DELETE FROM accounts')
+    conn.executemany('''
+        INSERT INTO accounts (account_number, pin_hash, name, phone_no, balance_paise, withdrawn_today_paise)
+        VALUES (?, ?, ?, ?, ?, 0)
+    ''', ((n, pin_hash, f"Customer {n}", f"9{i:09}", rng.randint(1000, 10000000)) for i, n in enumerate(numbers)))
+    conn.commit()
+    times = _spread(transactions, days, rng)
+    for low in range(0, transactions, chunk):
+        conn.executemany('INSERT INTO transactions (account_number, type, amount_paise, date_us) VALUES (?, ?, ?, ?)',
+                         [(rng.choice(numbers), rng.choice(ATM_TYPES), rng.randint(100, 500000), next(times))
+                          for _ in range(min(chunk, transactions - low))])
+        conn.commit()
+    if shards > 1:
+        account_store.reshard(path, shards)
+    for shard_path in account_store.shard_paths(path):
+        conn = db.get_connection(shard_path)
+        conn.execute('ANALYZE')
+        conn.commit()
+
+
+def seed_inventory(path, products=50000, suppliers=200, transactions=1000000, days=365, seed=1, force=False, chunk=50000):
+    rng = random.Random(seed)
+    _fresh(path, force)
+    migrations.migrate(path, migrations.INVENTORY_MIGRATIONS)
+    conn = db.get_connection(path)
+    conn.executemany('INSERT INTO suppliers (name, contact) VALUES (?, ?)',
+                     ((f"Supplier {i}", f"supplier{i}@example.com") for i in range(suppliers)))
+    prices = [rng.randint(100, 1000000) for _ in range(products)]
+    conn.executemany('''
+        INSERT INTO products (name, quantity, price_paise, category, low_threshold, supplier_id) VALUES (?, ?, ?, ?, ?, ?)
+    ''', ((f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}", 10000, prices[i], rng.choice(CATEGORIES), 10, rng.randint(1, suppliers))
+          for i in range(products)))
+    conn.commit()
+    times = _spread(transactions, days, rng)
+    for low in range(0, transactions, chunk):
+        rows = []
+        for _ in range(min(chunk, transactions - low)):
+            product_id = rng.randint(1, products)
+            kind = "Withdrawal" if rng.random() < 0.85 else "Adjust"
+            rows.append((product_id, kind, rng.randint(1, 5), next(times), "loadgen", prices[product_id - 1] if kind == "Withdrawal" else None))
+        conn.executemany('INSERT INTO transactions (product_id, type, quantity, date_us, user, new_price_paise) VALUES (?, ?, ?, ?, ?, ?)', rows)
+        conn.commit()
+    sales_rollup.catch_up(path)
+    conn.execute('ANALYZE')
+    conn.commit()
+
+
+# Operations: each takes (context, rng) and performs one business call.
+# Expected business failures (insufficient funds, out of stock) count as
+# "errors"; anything else is a "failure" and is reported with its message.
+
+def atm_login(ctx, rng):
+    ctx["atm"].login(rng.choice(ctx["accounts"]), PIN)
+
+
+def atm_balance(ctx, rng):
+    ctx["atm"].balance(rng.choice(ctx["accounts"]))
+
+
+def atm_withdraw(ctx, rng):
+    ctx["atm"].withdraw(rng.choice(ctx["accounts"]), rng.randint(1, 20) * 100)
+
+
+def atm_deposit(ctx, rng):
+    ctx["atm"].deposit(rng.choice(ctx["accounts"]), rng.randint(1, 200) * 100)
+
+
+def atm_transfer(ctx, rng):
+    source, target = rng.sample(ctx["accounts"], 2)
+    ctx["atm"].transfer(source, target, rng.randint(1, 50) * 100)
+
+
+def atm_history(ctx, rng):
+    ctx["atm"].history_page(rng.choice(ctx["accounts"]), 10)
+
+
+def inv_sale(ctx, rng):
+    checkout.checkout([(rng.randint(1, ctx["products"]), 1)], ctx["inventory_path"], "loadgen")
+
+
+def inv_checkout(ctx, rng):
+    lines = [(rng.randint(1, ctx["products"]), rng.randint(1, 3)) for _ in range(rng.randint(20, 50))]
+    checkout.checkout(lines, ctx["inventory_path"], "loadgen")
+
+
+def inv_search(ctx, rng):
+    term = rng.choice(ADJECTIVES)[:rng.randint(2, 5)]
+    if rng.random() < 0.5:
+        term += " " + rng.choice(NOUNS)[:3]
+    inventory_search.search(ctx["inventory_path"], term)
+
+
+def inv_sales_summary(ctx, rng):
+    end = datetime.now()
+    start = datetime.fromtimestamp(end.timestamp() - rng.randint(1, 90) * 86400)
+    sales_rollup.summary(ctx["inventory_path"], start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+
+
+OPERATIONS = {f.__name__: f for f in (atm_login, atm_balance, atm_withdraw, atm_deposit, atm_transfer, atm_history,
+                                      inv_sale, inv_checkout, inv_search, inv_sales_summary)}
+EXPECTED_ERRORS = (LedgerError, checkout.OrderError)
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of a sorted list
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def parse_mix(text):
+    # "atm_login=5,inv_search=10" -> {name: weight}
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation {name}; choose from {', '.join(OPERATIONS)}")
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+def run(atm_path, inventory_path, mix=None, workers=8, seconds=10.0, seed=1, cold_logins=False):
+    mix = {name: weight for name, weight in (mix or DEFAULT_MIX).items() if weight > 0}
+    ctx = {"atm_path": atm_path, "inventory_path": inventory_path}
+    if any(name.startswith("atm_") for name in mix):
+        ctx["atm"] = atm_service.AtmService(atm_path)
+        ctx["accounts"] = [r[0] for path in ctx["atm"].store.paths for r in db.get_connection(path).execute('SELECT account_number FROM accounts')]
+    # Every pool the workers use, ATM shards included, so their connections
+    # can be released when they finish
+    paths = [inventory_path] + (ctx["atm"].store.paths if "atm" in ctx else [atm_path])
+    if any(name.startswith("inv_") for name in mix):
+        ctx["products"] = db.get_connection(inventory_path).execute('SELECT MAX(id) FROM products').fetchone()[0] or 1
+    if cold_logins:
+        # Every login pays for the full PIN hash
+        credentials.verify_cache.maxsize = 0
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    results = []
+    deadline = time.perf_counter() + seconds
+    barrier = threading.Barrier(workers)
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        latencies = {name: [] for name in names}
+        errors = dict.fromkeys(names, 0)
+        failures = {}
+        barrier.wait()
+        try:
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                start = time.perf_counter()
+                try:
+                    OPERATIONS[name](ctx, rng)
+                except EXPECTED_ERRORS:
+                    errors[name] += 1
+                except (sqlite3.Error, ValueError, RuntimeError) as e:
+                    failures.setdefault(name, [0, str(e)])[0] += 1
+                    continue
+                latencies[name].append(time.perf_counter() - start)
+        finally:
+            results.append((latencies, errors, failures))
+            for path in paths:
+                db.get_pool(path).release()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    audit.close(inventory_path)
+
+    report = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "seconds": round(elapsed, 3),
+        "workers": workers,
+        "mix": mix,
+        "cold_logins": cold_logins,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "scale": scale(atm_path, inventory_path),
+        "operations": {},
+        # Per-query timings when run with DB_INSTRUMENT=1
+        "db": instrumentation.snapshot() if instrumentation.enabled else None,
+    }
+    for name in names:
+        values = sorted(v for latencies, _, _ in results for v in latencies[name])
+        errors = sum(e[name] for _, e, _ in results)
+        failed = [f[name] for _, _, f in results if name in f]
+        report["operations"][name] = {
+            "count": len(values),
+            "errors": errors,
+            "failures": sum(f[0] for f in failed),
+            "failure_example": failed[0][1] if failed else None,
+            "ops_per_sec": round((len(values) + errors) / elapsed, 1),
+            "p50_ms": _ms(percentile(values, 0.50)),
+            "p95_ms": _ms(percentile(values, 0.95)),
+            "p99_ms": _ms(percentile(values, 0.99)),
+            "max_ms": _ms(values[-1] if values else None),
+        }
+    for path in paths:
+        db.get_pool(path).release()
+    return report
+
+
+CONTENTION_PREFIX = "9900"
+CONTENTION_BALANCE = 1000000000  # paise
+
+
+def setup_contention(atm_path, accounts=2, shards=None):
+    # (Re)create the hot accounts with a large balance and no practical
+    # daily limit, optionally resharding the bench database first
+    atm_service.init_db(atm_path)
+    if shards:
+        account_store.reshard(atm_path, shards)
+    store = account_store.AccountStore(atm_path)
+    numbers = [f"{CONTENTION_PREFIX}{i:06}" for i in range(accounts)]
+    pin_hash = credentials.hash_pin(PIN)
+    for number in numbers:
+        conn = db.get_connection(store.path_for(number))
+        conn.execute('''
+            INSERT INTO accounts (account_number, pin_hash, name, phone_no, balance_paise, withdrawn_today_paise, daily_limit_paise)
+            VALUES (?, ?, 'Contention test', '0000000000', ?, 0, ?)
+            ON CONFLICT(account_number) DO UPDATE SET balance_paise = excluded.balance_paise, daily_limit_paise = excluded.daily_limit_paise,
+                version = version + 1
+        ''', (number, pin_hash, CONTENTION_BALANCE, 10 ** 15))
+        conn.commit()
+    return store, numbers
+
+
+def _account_state(store, numbers):
+    state = {}
+    for number in numbers:
+        state[number] = db.get_connection(store.path_for(number)).execute(
+            'SELECT balance_paise, version FROM accounts WHERE account_number = ?', (number,)).fetchone()
+    return state
+
+
+def _contention_process(atm_path, numbers, threads, seconds, seed):
+    # Runs in each process: threads doing deposits, withdrawals and
+    # transfers on the same few accounts. Returns the tallies.
+    service = atm_service.AtmService(atm_path)
+    deadline = time.perf_counter() + seconds
+    tallies = []
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        tally = {"deposited": 0, "withdrawn": 0, "ok": {}, "errors": {}, "failures": {}, "latencies": {}}
+        while time.perf_counter() < deadline:
+            kind = rng.choice(("deposit", "withdraw", "transfer"))
+            amount = rng.randint(1, 100) * 100
+            start = time.perf_counter()
+            try:
+                if kind == "deposit":
+                    service.deposit(rng.choice(numbers), amount)
+                    tally["deposited"] += amount
+                elif kind == "withdraw":
+                    service.withdraw(rng.choice(numbers), amount)
+                    tally["withdrawn"] += amount
+                else:
+                    source, target = rng.sample(numbers, 2)
+                    service.transfer(source, target, amount)
+            except LedgerError:
+                tally["errors"][kind] = tally["errors"].get(kind, 0) + 1
+                continue
+            except sqlite3.Error as e:
+                tally["failures"].setdefault(kind, [0, str(e)])[0] += 1
+                continue
+            tally["ok"][kind] = tally["ok"].get(kind, 0) + 1
+            tally["latencies"].setdefault(kind, []).append(time.perf_counter() - start)
+        tallies.append(tally)
+        for path in service.store.paths:
+            db.get_pool(path).release()
+
+    pool = [threading.Thread(target=worker, args=(seed * 100 + i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return tallies
+
+
+def contention(atm_path, accounts=2, threads=8, processes=1, seconds=5.0, seed=1, shards=None):
+    # Money is conserved if, over the run, the accounts' total balance
+    # moved by exactly deposits minus withdrawals, each account's balance
+    # moved by exactly what its transaction rows say, and the versions
+    # moved by exactly one per account row written
+    store, numbers = setup_contention(atm_path, max(accounts, 2), shards)
+    before = _account_state(store, numbers)
+    first_ids = [db.get_connection(path).execute('SELECT COALESCE(MAX(id), 0) FROM transactions').fetchone()[0] for path in store.paths]
+    started = time.perf_counter()
+    if processes > 1:
+        with multiprocessing.get_context("spawn").Pool(processes) as pool:
+            results = pool.starmap(_contention_process, [(atm_path, numbers, threads, seconds, seed + p) for p in range(processes)])
+        tallies = [tally for result in results for tally in result]
+    else:
+        tallies = _contention_process(atm_path, numbers, threads, seconds, seed)
+    elapsed = time.perf_counter() - started
+    after = _account_state(store, numbers)
+
+    deposited = sum(t["deposited"] for t in tallies)
+    withdrawn = sum(t["withdrawn"] for t in tallies)
+    ok = {kind: sum(t["ok"].get(kind, 0) for t in tallies) for kind in ("deposit", "withdraw", "transfer")}
+    logged = {}
+    for path, first_id in zip(store.paths, first_ids):
+        logged.update(db.get_connection(path).execute(f'''
+            SELECT account_number, SUM(CASE WHEN type IN ('Deposit', 'Transfer In') THEN amount_paise ELSE -amount_paise END)
+            FROM transactions WHERE id > ? AND account_number IN ({",".join("?" * len(numbers))}) GROUP BY account_number
+        ''', [first_id] + numbers).fetchall())
+    total_change = sum(after[n][0] - before[n][0] for n in numbers)
+    checks = {
+        "total_balance": total_change == deposited - withdrawn,
+        "per_account_log": all(after[n][0] - before[n][0] == (logged.get(n) or 0) for n in numbers),
+        "versions": sum(after[n][1] - before[n][1] for n in numbers) == ok["deposit"] + ok["withdraw"] + 2 * ok["transfer"],
+        "transfers_settled": store.pending() == 0,
+    }
+    operations = {}
+    for kind in ("deposit", "withdraw", "transfer"):
+        values = sorted(v for t in tallies for v in t["latencies"].get(kind, []))
+        failed = [t["failures"][kind] for t in tallies if kind in t["failures"]]
+        operations[kind] = {
+            "count": ok[kind],
+            "errors": sum(t["errors"].get(kind, 0) for t in tallies),
+            "failures": sum(f[0] for f in failed),
+            "failure_example": failed[0][1] if failed else None,
+            "ops_per_sec": round(ok[kind] / elapsed, 1),
+            "p50_ms": _ms(percentile(values, 0.50)),
+            "p95_ms": _ms(percentile(values, 0.95)),
+            "p99_ms": _ms(percentile(values, 0.99)),
+            "max_ms": _ms(values[-1] if values else None),
+        }
+    return {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "seconds": round(elapsed, 3),
+        "workers": threads * max(processes, 1),
+        "processes": max(processes, 1),
+        "accounts": len(numbers),
+        "shards": len(store.paths),
+        "pending_transfers": store.pending(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "scale": scale(atm_path, ""),
+        "deposited": deposited,
+        "withdrawn": withdrawn,
+        "total_balance_change": total_change,
+        "checks": checks,
+        "conserved": all(checks.values()),
+        "operations": operations,
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def scale(atm_path, inventory_path):
+    counts = {}
+    for label, path, tables in (("atm", atm_path, ("accounts", "transactions")),
+                                ("inventory", inventory_path, ("products", "transactions"))):
+        if os.path.exists(path):
+            paths = account_store.shard_paths(path) if label == "atm" else [path]
+            for table in tables:
+                counts[f"{label}_{table}"] = sum(db.get_connection(p).execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for p in paths)
+    return counts
+
+
+def print_report(report, file=sys.stdout):
+    print(f"{report['workers']} workers, {report['seconds']}s, scale {report['scale']}", file=file)
+    print(f"{'operation':18} {'ops/sec':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'failed':>7}", file=file)
+    for name, op in report["operations"].items():
+        cells = [f"{op[key]:9.3f}" if op[key] is not None else f"{'-':>9}" for key in ("p50_ms", "p95_ms", "p99_ms")]
+        print(f"{name:18} {op['ops_per_sec']:9.1f} {' '.join(cells)} {op['errors']:7} {op['failures']:7}", file=file)
+
+
+def compare(old, new, file=sys.stdout):
+    print(f"{'operation':18} {'ops/sec':>20} {'p95 ms':>22}", file=file)
+    for name, op in new["operations"].items():
+        before = old["operations"].get(name)
+        if before is None:
+            continue
+
+        def change(key):
+            a, b = before[key], op[key]
+            if not a or b is None:
+                return f"{'-':>22}"
+            return f"{a:9.1f} -> {b:9.1f} ({(b - a) / a * 100:+.0f}%)"
+        print(f"{name:18} {change('ops_per_sec')} {change('p95_ms')}", file=file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed benchmark databases and run a headless load test of the ATM and inventory code")
+    sub = parser.add_subparsers(dest="command", required=True)
+    seed = sub.add_parser("seed", help="create synthetic bench databases")
+    seed.add_argument("--atm", default="bench-atm.db")
+    seed.add_argument("--inventory", default="bench-inventory.db")
+    seed.add_argument("--accounts", type=int, default=10000)
+    seed.add_argument("--shards", type=int, default=1, help="spread the ATM accounts over this many database files")
+    seed.add_argument("--atm-transactions", type=int, default=1000000)
+    seed.add_argument("--products", type=int, default=50000)
+    seed.add_argument("--sales", type=int, default=1000000, help="inventory transactions")
+    seed.add_argument("--days", type=int, default=365, help="spread transactions over this many days")
+    seed.add_argument("--seed", type=int, default=1)
+    seed.add_argument("--force", action="store_true", help="replace existing files")
+    load = sub.add_parser("run", help="run the load test and write JSON results")
+    load.add_argument("--atm", default="bench-atm.db")
+    load.add_argument("--inventory", default="bench-inventory.db")
+    load.add_argument("--workers", type=int, default=8)
+    load.add_argument("--seconds", type=float, default=10.0)
+    load.add_argument("--mix", default=None, help="e.g. atm_withdraw=5,inv_sale=5 (default: all operations); choose from " + ", ".join(OPERATIONS))
+    load.add_argument("--cold-logins", action="store_true", help="disable the PIN verification cache")
+    load.add_argument("--seed", type=int, default=1)
+    load.add_argument("--out", default=None, help="results file (default: loadgen-<timestamp>.json)")
+    hot = sub.add_parser("contention", help="hammer a few accounts concurrently and check money is conserved")
+    hot.add_argument("--atm", default="bench-atm.db")
+    hot.add_argument("--accounts", type=int, default=2, help="number of hot accounts (at least 2)")
+    hot.add_argument("--threads", type=int, default=8, help="threads per process")
+    hot.add_argument("--processes", type=int, default=1)
+    hot.add_argument("--shards", type=int, default=None, help="reshard the bench database first")
+    hot.add_argument("--seconds", type=float, default=5.0)
+    hot.add_argument("--seed", type=int, default=1)
+    hot.add_argument("--out", default=None, help="results file (default: contention-<timestamp>.json)")
+    diff = sub.add_parser("compare", help="compare two result files")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        start = time.perf_counter()
+        seed_atm(args.atm, args.accounts, args.atm_transactions, args.days, args.seed, args.force, shards=args.shards)
+        print(f"{args.atm}: {args.accounts} accounts, {args.atm_transactions} transactions ({time.perf_counter() - start:.1f}s)")
+        start = time.perf_counter()
+        seed_inventory(args.inventory, args.products, transactions=args.sales, days=args.days, seed=args.seed, force=args.force)
+        print(f"{args.inventory}: {args.products} products, {args.sales} transactions ({time.perf_counter() - start:.1f}s)")
+    elif args.command == "run":
+        for path in (args.atm, args.inventory):
+            if not os.path.exists(path):
+                raise SystemExit(f"{path} does not exist; run python loadgen.py seed first")
+        report = run(args.atm, args.inventory, parse_mix(args.mix) if args.mix else None, args.workers, args.seconds, args.seed, args.cold_logins)
+        out = args.out or f"loadgen-{datetime.now():%Y%m%d-%H%M%S}.json"
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print_report(report)
+        print(f"Results written to {out}")
+    elif args.command == "contention":
+        report = contention(args.atm, args.accounts, args.threads, args.processes, args.seconds, args.seed, args.shards)
+        out = args.out or f"contention-{datetime.now():%Y%m%d-%H%M%S}.json"
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print_report(report)
+        print(f"Money conserved: {'yes' if report['conserved'] else 'NO'} {report['checks']}")
+        print(f"Results written to {out}")
+        if not report["conserved"]:
+            sys.exit(1)
+    else:
+        with open(args.old, encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        compare(old, new)
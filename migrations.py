@@ -0,0 +1,467 @@
+import threading
+import time
+from collections import namedtuple
+import credentials
+import db
+from timestamps import local_day_sql, now_us_sql, text_to_us_sql
+
+# Versioned schema migrations. Each database records the last applied
+# version in PRAGMA user_version, so a database that is already current
+# costs one PRAGMA read at startup.
+#
+# A plain migration runs in one transaction together with the version bump.
+# A batched migration (batched=True) manages its own short transactions, e.g.
+# through backfill(), so large tables are converted without holding the write
+# lock for long; it must be safe to re-run if interrupted.
+Migration = namedtuple("Migration", ["version", "description", "apply", "batched"], defaults=(False,))
+
+
+def migrate(path, migrations):
+    if path in _current:
+        return
+    with _lock:
+        conn = db.get_connection(path)
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for migration in migrations:
+            if migration.version <= version:
+                continue
+            if migration.batched:
+                migration.apply(conn)
+                if conn.in_transaction:
+                    conn.commit()
+                conn.execute('BEGIN IMMEDIATE')
+            else:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    migration.apply(conn)
+                except BaseException:
+                    conn.rollback()
+                    raise
+            conn.execute(f'PRAGMA user_version = {migration.version}')
+            conn.commit()
+            version = migration.version
+        _current.add(path)
+
+
+_current = set()
+_lock = threading.Lock()
+
+
+def columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def add_column(conn, table, column, definition):
+    # ALTER TABLE ... ADD COLUMN is not idempotent on its own
+    if column not in columns(conn, table):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def backfill(conn, table, set_sql, where_sql="1", batch_size=10000, pause=0.0):
+    # Run "UPDATE table SET set_sql WHERE where_sql" in rowid ranges of
+    # batch_size, committing after each so other writers can get in between.
+    # where_sql should exclude rows that are already done so an interrupted
+    # backfill resumes where it stopped.
+    if conn.in_transaction:
+        conn.commit()
+    max_rowid = conn.execute(f'SELECT MAX(rowid) FROM {table}').fetchone()[0]
+    if max_rowid is None:
+        return
+    low = 0
+    while low <= max_rowid:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(f'UPDATE {table} SET {set_sql} WHERE rowid > ? AND rowid <= ? AND ({where_sql})', (low, low + batch_size))
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        low += batch_size
+        if pause:
+            time.sleep(pause)
+
+
+def _paise_sql(column):
+    return f'CAST(ROUND(COALESCE({column}, 0) * 100) AS INTEGER)'
+
+
+# atm.db
+
+def atm_initial_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS accounts (
+            account_number TEXT PRIMARY KEY,
+            pin_hash TEXT,
+            name TEXT,
+            phone_no TEXT,
+            balance REAL,
+            withdrawn_today REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_number TEXT,
+            type TEXT,
+            amount REAL,
+            date TEXT
+        )
+    ''')
+    # Sample account
+    conn.execute('''
+        INSERT OR IGNORE INTO accounts (account_number, pin_hash, name, phone_no, balance, withdrawn_today)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', ("123456", credentials.hash_pin("7890"), "John Doe", "1234567890", 1000.0, 0.0))
+
+
+def atm_history_indexes(conn):
+    # History is read newest first per account, optionally within a date range
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_account_id ON transactions(account_number, id DESC)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions(account_number, date)')
+
+
+def atm_money_to_paise(conn):
+    add_column(conn, 'accounts', 'balance_paise', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(conn, 'accounts', 'withdrawn_today_paise', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(conn, 'transactions', 'amount_paise', 'INTEGER')
+    if 'balance' in columns(conn, 'accounts'):
+        backfill(conn, 'accounts', f'balance_paise = {_paise_sql("balance")}, withdrawn_today_paise = {_paise_sql("withdrawn_today")}')
+        conn.execute('ALTER TABLE accounts DROP COLUMN balance')
+        conn.execute('ALTER TABLE accounts DROP COLUMN withdrawn_today')
+    if 'amount' in columns(conn, 'transactions'):
+        backfill(conn, 'transactions', f'amount_paise = {_paise_sql("amount")}', 'amount_paise IS NULL')
+        conn.execute('ALTER TABLE transactions DROP COLUMN amount')
+
+
+def atm_timestamps_to_us(conn):
+    add_column(conn, 'transactions', 'date_us', 'INTEGER')
+    if 'date' in columns(conn, 'transactions'):
+        backfill(conn, 'transactions', f'date_us = {text_to_us_sql("date")}', 'date_us IS NULL')
+        conn.execute('DROP INDEX IF EXISTS idx_transactions_account_date')
+        conn.execute('ALTER TABLE transactions DROP COLUMN date')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_account_date_us ON transactions(account_number, date_us)')
+
+
+def atm_daily_limits(conn):
+    # withdrawn_today_paise only counts on withdrawal_day (local
+    # YYYY-MM-DD); older counters read as zero. daily_limit_paise, if set,
+    # overrides the default daily limit for that account.
+    add_column(conn, 'accounts', 'withdrawal_day', 'TEXT')
+    add_column(conn, 'accounts', 'daily_limit_paise', 'INTEGER')
+
+
+def atm_account_versions(conn):
+    # Bumped by every write to an account row, so a writer can
+    # compare-and-swap against the version it read
+    add_column(conn, 'accounts', 'version', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def atm_account_shards(conn):
+    # account_shards lists the extra shard files (shard 0 is this file) and
+    # is only filled in the primary file; see account_store.py.
+    # transfer_journal records each shard's side of cross-shard transfers.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS account_shards (
+            shard INTEGER PRIMARY KEY,
+            path TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS transfer_journal (
+            xid TEXT PRIMARY KEY,
+            role TEXT NOT NULL CHECK(role IN ('source', 'target')),
+            account_number TEXT NOT NULL,
+            peer_account TEXT NOT NULL,
+            amount_paise INTEGER NOT NULL,
+            transaction_id INTEGER,
+            state TEXT NOT NULL CHECK(state IN ('prepared', 'committed', 'aborted')),
+            created_us INTEGER NOT NULL,
+            updated_us INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transfer_journal_state ON transfer_journal(state, created_us)')
+
+
+ATM_MIGRATIONS = [
+    Migration(1, "initial schema", atm_initial_schema),
+    Migration(2, "transaction history indexes", atm_history_indexes),
+    Migration(3, "REAL rupee amounts to INTEGER paise", atm_money_to_paise, batched=True),
+    Migration(4, "text dates to INTEGER epoch microseconds", atm_timestamps_to_us, batched=True),
+    Migration(5, "day-bucketed withdrawal counters and per-account limits", atm_daily_limits),
+    Migration(6, "account row versions", atm_account_versions),
+    Migration(7, "account shards and cross-shard transfer journal", atm_account_shards),
+]
+
+
+# inventory.db
+
+def inventory_initial_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password_hash TEXT,
+            role TEXT DEFAULT 'staff' CHECK(role IN ('admin', 'staff', 'pending')),
+            approved INTEGER DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            quantity INTEGER NOT NULL CHECK(quantity >= 0 AND quantity <= 10000),
+            price REAL NOT NULL CHECK(price >= 0 AND price <= 100000),
+            category TEXT NOT NULL,
+            low_threshold INTEGER DEFAULT 10 CHECK(low_threshold >= 0 AND low_threshold <= 100),
+            supplier_id INTEGER,
+            FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS suppliers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            contact TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            type TEXT,
+            quantity INTEGER,
+            date TEXT,
+            user TEXT,
+            new_price REAL,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message TEXT NOT NULL,
+            date TEXT,
+            status TEXT DEFAULT 'pending' CHECK(status IN ('pending', 'resolved'))
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS audit_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            action TEXT,
+            details TEXT,
+            user TEXT,
+            timestamp TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_product_id ON transactions(product_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_username ON users(username)')
+    conn.execute('INSERT OR IGNORE INTO users (username, password_hash, role, approved) VALUES (?, ?, ?, ?)',
+                 ('admin', credentials.hash_pin('password123'), 'admin', 1))
+
+
+def inventory_lookup_indexes(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_type_date ON transactions(type, date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_notifications_status ON notifications(status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_role_approved ON users(role, approved)')
+
+
+def inventory_money_to_paise(conn):
+    add_column(conn, 'products', 'price_paise', 'INTEGER NOT NULL DEFAULT 0 CHECK(price_paise >= 0 AND price_paise <= 10000000)')
+    add_column(conn, 'transactions', 'new_price_paise', 'INTEGER')
+    if 'price' in columns(conn, 'products'):
+        backfill(conn, 'products', f'price_paise = {_paise_sql("price")}')
+        conn.execute('ALTER TABLE products DROP COLUMN price')
+    if 'new_price' in columns(conn, 'transactions'):
+        backfill(conn, 'transactions', f'new_price_paise = {_paise_sql("new_price")}', 'new_price IS NOT NULL AND new_price_paise IS NULL')
+        conn.execute('ALTER TABLE transactions DROP COLUMN new_price')
+
+
+def inventory_sort_indexes(conn):
+    # The inventory grid pages by (column, id) keysets; an index on the
+    # column alone also orders by rowid, so it serves both
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_quantity ON products(quantity)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_price ON products(price_paise)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_category ON products(category)')
+
+
+def inventory_search_index(conn):
+    # Full-text index over each product's id, name, category and supplier
+    # name, keyed by product id. Triggers keep it in sync; quantity and
+    # price updates don't touch it.
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            product_id, name, category, supplier,
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts (rowid, product_id, name, category, supplier)
+            VALUES (new.id, new.id, new.name, new.category, (SELECT name FROM suppliers WHERE id = new.supplier_id));
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, category, supplier_id ON products BEGIN
+            DELETE FROM products_fts WHERE rowid = old.id;
+            INSERT INTO products_fts (rowid, product_id, name, category, supplier)
+            VALUES (new.id, new.id, new.name, new.category, (SELECT name FROM suppliers WHERE id = new.supplier_id));
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+            DELETE FROM products_fts WHERE rowid = old.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS suppliers_fts_update AFTER UPDATE OF name ON suppliers BEGIN
+            UPDATE products_fts SET supplier = new.name WHERE rowid IN (SELECT id FROM products WHERE supplier_id = new.id);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS suppliers_fts_delete AFTER DELETE ON suppliers BEGIN
+            UPDATE products_fts SET supplier = NULL WHERE rowid IN (SELECT id FROM products WHERE supplier_id = old.id);
+        END
+    ''')
+    conn.execute('DELETE FROM products_fts')
+    conn.execute('''
+        INSERT INTO products_fts (rowid, product_id, name, category, supplier)
+        SELECT p.id, p.id, p.name, p.category, s.name FROM products p LEFT JOIN suppliers s ON p.supplier_id = s.id
+    ''')
+
+
+def inventory_sales_rollup(conn):
+    # Per-day, per-product sales totals, filled by sales_rollup.catch_up()
+    # from the transactions after rollup_state.last_id
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            day TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            revenue_paise INTEGER NOT NULL,
+            PRIMARY KEY (day, product_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO rollup_state (name, last_id) VALUES ('sales_daily', 0)")
+
+
+def inventory_timestamps_to_us(conn):
+    for table, old, new in [('transactions', 'date', 'date_us'), ('audit_logs', 'timestamp', 'timestamp_us'), ('notifications', 'date', 'date_us')]:
+        add_column(conn, table, new, 'INTEGER')
+        if old in columns(conn, table):
+            backfill(conn, table, f'{new} = {text_to_us_sql(old)}', f'{new} IS NULL')
+            if table == 'transactions':
+                conn.execute('DROP INDEX IF EXISTS idx_transactions_type_date')
+            conn.execute(f'ALTER TABLE {table} DROP COLUMN {old}')
+    # Sales reports scan by type and time, product history by product and
+    # time; the second also covers lookups by product_id alone
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_type_date_us ON transactions(type, date_us)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_product_date_us ON transactions(product_id, date_us)')
+    conn.execute('DROP INDEX IF EXISTS idx_product_id')
+
+
+def inventory_low_stock_triggers(conn):
+    # Low stock is tracked by triggers on the rows that change: a product
+    # going below its threshold gets (or refreshes) its one pending
+    # notification, and going back above it resolves that notification.
+    add_column(conn, 'notifications', 'product_id', 'INTEGER')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_products_low_stock ON products(id) WHERE quantity < low_threshold')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_notifications_pending_product ON notifications(product_id)
+        WHERE status = 'pending' AND product_id IS NOT NULL
+    ''')
+    notify = f'''
+            INSERT INTO notifications (message, date_us, product_id)
+            VALUES ('Low stock for product ID ' || new.id || ': Quantity ' || new.quantity || ' below threshold ' || new.low_threshold,
+                    {now_us_sql()}, new.id)
+            ON CONFLICT(product_id) WHERE status = 'pending' AND product_id IS NOT NULL
+            DO UPDATE SET message = excluded.message, date_us = excluded.date_us;
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS products_low_stock_insert AFTER INSERT ON products
+        WHEN new.quantity < new.low_threshold BEGIN {notify} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS products_low_stock_update AFTER UPDATE OF quantity, low_threshold ON products
+        WHEN new.quantity < new.low_threshold AND (new.quantity != old.quantity OR new.low_threshold != old.low_threshold) BEGIN {notify} END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS products_restocked AFTER UPDATE OF quantity, low_threshold ON products
+        WHEN old.quantity < old.low_threshold AND new.quantity >= new.low_threshold BEGIN
+            UPDATE notifications SET status = 'resolved' WHERE product_id = new.id AND status = 'pending';
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS products_low_stock_delete AFTER DELETE ON products BEGIN
+            UPDATE notifications SET status = 'resolved' WHERE product_id = old.id AND status = 'pending';
+        END
+    ''')
+    conn.execute(f'''
+        INSERT INTO notifications (message, date_us, product_id)
+        SELECT 'Low stock for product ID ' || id || ': Quantity ' || quantity || ' below threshold ' || low_threshold, {now_us_sql()}, id
+        FROM products WHERE quantity < low_threshold
+        ON CONFLICT(product_id) WHERE status = 'pending' AND product_id IS NOT NULL DO NOTHING
+    ''')
+
+
+def audit_schema(conn):
+    # Shared by inventory.db and standalone audit/archive files (see
+    # audit.py); the index serves rotation by age
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS audit_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            action TEXT,
+            details TEXT,
+            user TEXT,
+            timestamp_us INTEGER
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_audit_logs_timestamp_us ON audit_logs(timestamp_us)')
+
+
+def inventory_sales_rollup_trigger(conn):
+    # Sales are folded into sales_daily by the transaction that writes them,
+    # so reports only read. Sales not yet rolled up are folded in first.
+    import sales_rollup  # imports this module
+    last_id = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'sales_daily'").fetchone()[0]
+    high = conn.execute('SELECT MAX(id) FROM transactions').fetchone()[0]
+    if high is not None and high > last_id:
+        conn.execute(sales_rollup.CATCH_UP_SQL, (last_id, high))
+        conn.execute("UPDATE rollup_state SET last_id = ? WHERE name = 'sales_daily'", (high,))
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS transactions_sales_daily AFTER INSERT ON transactions
+        WHEN new.type = 'Withdrawal' AND new.product_id IS NOT NULL BEGIN
+            INSERT INTO sales_daily (day, product_id, quantity, revenue_paise)
+            VALUES ({local_day_sql('new.date_us')}, new.product_id, new.quantity,
+                    new.quantity * COALESCE(new.new_price_paise, (SELECT price_paise FROM products WHERE id = new.product_id), 0))
+            ON CONFLICT(day, product_id) DO UPDATE SET
+                quantity = quantity + excluded.quantity,
+                revenue_paise = revenue_paise + excluded.revenue_paise;
+            UPDATE rollup_state SET last_id = new.id WHERE name = 'sales_daily' AND last_id < new.id;
+        END
+    ''')
+
+
+INVENTORY_MIGRATIONS = [
+    Migration(1, "initial schema", inventory_initial_schema),
+    Migration(2, "sales, notification and approval indexes", inventory_lookup_indexes),
+    Migration(3, "REAL rupee prices to INTEGER paise", inventory_money_to_paise, batched=True),
+    Migration(4, "inventory grid sort indexes", inventory_sort_indexes),
+    Migration(5, "FTS5 product search index", inventory_search_index),
+    Migration(6, "daily sales rollup", inventory_sales_rollup),
+    Migration(7, "text dates to INTEGER epoch microseconds", inventory_timestamps_to_us, batched=True),
+    Migration(8, "trigger-maintained low-stock notifications", inventory_low_stock_triggers),
+    Migration(9, "audit log rotation index", audit_schema),
+    Migration(10, "trigger-maintained daily sales rollup", inventory_sales_rollup_trigger),
+]
+
+
+# Separate audit log and audit archive files
+
+AUDIT_MIGRATIONS = [
+    Migration(1, "audit log", audit_schema),
+]
@@ -0,0 +1,31 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Money is stored and computed as an int number of paise (1/100 rupee).
+# Integers are exact, so sums and comparisons never drift the way floats
+# do, and INTEGER columns aggregate faster than REAL ones in SQLite.
+PAISE_PER_RUPEE = 100
+
+
+def to_paise(value):
+    # Parse rupees given as text ("12.5", "₹1,000.00"), int, float or Decimal
+    if isinstance(value, str):
+        value = value.strip().replace("₹", "").replace(",", "")
+    elif isinstance(value, float):
+        value = repr(value)  # shortest repr, so 0.1 stays 0.1 instead of 0.1000000000000000055
+    try:
+        rupees = Decimal(value)
+    except (InvalidOperation, TypeError, ValueError):
+        raise ValueError(f"Invalid amount: {value!r}")
+    if not rupees.is_finite():
+        raise ValueError(f"Invalid amount: {value!r}")
+    # Rounding "10.005" would move a different amount than the one typed
+    if rupees.normalize().as_tuple().exponent < -2:
+        raise ValueError(f"Amount has more than 2 decimal places: {value!r}")
+    return int((rupees * PAISE_PER_RUPEE).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_money(paise):
+    # 123456 -> "1234.56"
+    sign = "-" if paise < 0 else ""
+    rupees, rest = divmod(abs(int(paise)), PAISE_PER_RUPEE)
+    return f"{sign}{rupees}.{rest:02d}"
@@ -0,0 +1,89 @@
+import argparse
+import time
+import db
+import migrations
+from money import format_money
+from timestamps import local_day_sql
+
+# sales_daily holds sold quantity and revenue per (day, product), so a
+# summary over any date range reads a few rollup rows instead of the whole
+# transaction history. A trigger on transactions (inventory migration 10)
+# folds each sale in as it is written, so summary() never writes and never
+# waits for checkout writers. catch_up() folds in any transactions after
+# the last one processed, which the migration also does once before the
+# trigger takes over. Revenue uses the price recorded on each sale.
+
+CATCH_UP_SQL = f'''
+    INSERT INTO sales_daily (day, product_id, quantity, revenue_paise)
+    SELECT {local_day_sql('t.date_us')}, t.product_id, SUM(t.quantity), SUM(t.quantity * COALESCE(t.new_price_paise, p.price_paise, 0))
+    FROM transactions t LEFT JOIN products p ON p.id = t.product_id
+    WHERE t.id > ? AND t.id <= ? AND t.type = 'Withdrawal' AND t.product_id IS NOT NULL
+    GROUP BY 1, t.product_id
+    ON CONFLICT(day, product_id) DO UPDATE SET
+        quantity = quantity + excluded.quantity,
+        revenue_paise = revenue_paise + excluded.revenue_paise
+'''
+
+
+def catch_up(db_path='inventory.db', batch_size=50000):
+    # Returns the number of transactions processed. Each batch moves the
+    # watermark in the same transaction as the totals, so a crash or a
+    # concurrent catch_up never counts a sale twice.
+    migrations.migrate(db_path, migrations.INVENTORY_MIGRATIONS)
+    conn = db.get_connection(db_path)
+    processed = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            last_id = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'sales_daily'").fetchone()[0]
+            high, count = conn.execute('SELECT MAX(id), COUNT(*) FROM (SELECT id FROM transactions WHERE id > ? ORDER BY id LIMIT ?)',
+                                       (last_id, batch_size)).fetchone()
+            if high is None:
+                conn.rollback()
+                return processed
+            conn.execute(CATCH_UP_SQL, (last_id, high))
+            conn.execute("UPDATE rollup_state SET last_id = ? WHERE name = 'sales_daily'", (high,))
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        processed += count
+
+
+def summary(db_path='inventory.db', start_date=None, end_date=None):
+    # (product name, quantity sold, revenue in paise) per product, for the
+    # inclusive YYYY-MM-DD range; either end may be omitted. Read-only.
+    migrations.migrate(db_path, migrations.INVENTORY_MIGRATIONS)
+    sql = '''
+        SELECT p.name, SUM(r.quantity), SUM(r.revenue_paise)
+        FROM sales_daily r JOIN products p ON p.id = r.product_id
+    '''
+    where, params = [], []
+    if start_date:
+        where.append('r.day >= ?')
+        params.append(start_date)
+    if end_date:
+        where.append('r.day <= ?')
+        params.append(end_date)
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' GROUP BY r.product_id ORDER BY p.name'
+    return db.get_connection(db_path).execute(sql, params).fetchall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bring the daily sales rollup up to date (e.g. from cron) and optionally print a summary")
+    parser.add_argument("--db", default="inventory.db")
+    parser.add_argument("--start-date", help="YYYY-MM-DD")
+    parser.add_argument("--end-date", help="YYYY-MM-DD inclusive")
+    parser.add_argument("--summary", action="store_true")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    count = catch_up(args.db)
+    print(f"Rolled up {count} new transactions in {time.perf_counter() - start:.2f}s")
+    if args.summary:
+        start = time.perf_counter()
+        rows = summary(args.db, args.start_date, args.end_date)
+        for name, quantity, revenue in rows:
+            print(f"{name}: {quantity} sold, revenue {format_money(revenue)}")
+        print(f"{len(rows)} products in {(time.perf_counter() - start) * 1000:.1f} ms")
@@ -0,0 +1,103 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Cancelled(Exception):
+    pass
+
+
+# One piece of background work. The worker function gets the task's
+# report() as its progress callback; report() raises Cancelled once the
+# task has been cancelled, which is how long jobs stop part way.
+class Task:
+    def __init__(self, executor, on_done, on_error, on_progress, on_cancel):
+        self.executor = executor
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_cancel = on_cancel
+        self.future = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        if self.future is not None and self.future.cancel():
+            # Never started, so the worker will not report back itself
+            self.executor._results.put((self, "error", Cancelled()))
+
+    def report(self, value):
+        if self.cancelled:
+            raise Cancelled()
+        self.executor._results.put((self, "progress", value))
+
+
+# Runs blocking work (SQLite, file I/O, password hashing) on a thread pool
+# and hands results back to the Tk thread through a queue drained with
+# root.after, so callbacks may touch widgets freely. The queue is only
+# polled while tasks are outstanding.
+class TaskExecutor:
+    def __init__(self, root, max_workers=4, poll_ms=20):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tk-task")
+        self._results = queue.Queue()
+        self._pending = 0
+        self._polling = False
+
+    def submit(self, func, *args, on_done=None, on_error=None, on_progress=None, on_cancel=None):
+        # If on_progress is given, func is called with progress=task.report
+        task = Task(self, on_done, on_error, on_progress, on_cancel)
+        kwargs = {"progress": task.report} if on_progress else {}
+        self._pending += 1
+        task.future = self._pool.submit(self._run, task, func, args, kwargs)
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+        return task
+
+    def _run(self, task, func, args, kwargs):
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self._results.put((task, "error", e))
+        else:
+            self._results.put((task, "done", result))
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    task, kind, value = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                if kind != "progress":
+                    self._pending -= 1
+                self._dispatch(task, kind, value)
+        finally:
+            if self._pending:
+                self.root.after(self.poll_ms, self._poll)
+            else:
+                self._polling = False
+
+    def _dispatch(self, task, kind, value):
+        if kind == "progress":
+            if task.on_progress and not task.cancelled:
+                task.on_progress(value)
+        elif isinstance(value, Cancelled) or (task.cancelled and kind == "done"):
+            if task.on_cancel:
+                task.on_cancel()
+        elif kind == "error":
+            if task.on_error:
+                task.on_error(value)
+            else:
+                self.root.report_callback_exception(type(value), value, value.__traceback__)
+        elif task.on_done:
+            task.on_done(value)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
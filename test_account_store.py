@@ -0,0 +1,59 @@
+import account_store
+import db
+from atm_service import init_db
+from ledger import Operation
+
+
+def make_store(tmp_path, shards):
+    db_path = str(tmp_path / "atm.db")
+    init_db(db_path)
+    account_store.reshard(db_path, shards)
+    store = account_store.AccountStore(db_path)
+    numbers = [str(700000 + i) for i in range(12)]
+    for number in numbers:
+        conn = db.get_connection(store.path_for(number))
+        conn.execute('''
+            INSERT INTO accounts (account_number, pin_hash, name, phone_no, balance_paise, withdrawn_today_paise)
+            VALUES (?, '', 'Test', '0', 10000, 0)
+        ''', (number,))
+        conn.commit()
+    return store, numbers
+
+
+def balances(store, numbers):
+    return {n: db.get_connection(store.path_for(n)).execute(
+        'SELECT balance_paise FROM accounts WHERE account_number = ?', (n,)).fetchone()[0] for n in numbers}
+
+
+def test_apply_batch_routes_operations_to_their_shards(tmp_path):
+    store, numbers = make_store(tmp_path, 3)
+    assert len({store.shard_of(n) for n in numbers}) > 1
+    same = next((a, b) for a in numbers for b in numbers if a != b and store.shard_of(a) == store.shard_of(b))
+    cross = next((a, b) for a in numbers for b in numbers if store.shard_of(a) != store.shard_of(b))
+    operations = [Operation("deposit", n, 100) for n in numbers]
+    operations += [
+        Operation("withdraw", numbers[0], 50, daily_limit=100000),
+        Operation("withdraw", numbers[1], 10 ** 9, daily_limit=10 ** 12),
+        Operation("transfer", same[0], 200, same[1]),
+        Operation("transfer", cross[0], 300, cross[1]),
+        Operation("transfer", cross[0], 10 ** 9, cross[1]),
+        Operation("deposit", "999999999", 100),
+    ]
+    results = store.apply_batch(operations)
+
+    assert [ok for ok, _ in results] == [True] * len(numbers) + [True, False, True, True, False, False]
+    assert results[-1] == (False, "Account not found")
+    expected = {n: 10100 for n in numbers}
+    expected[numbers[0]] -= 50
+    for source, target, amount in (same + (200,), cross + (300,)):
+        expected[source] -= amount
+        expected[target] += amount
+    assert balances(store, numbers) == expected
+    assert store.pending() == 0
+
+
+def test_apply_batch_on_one_shard_matches_the_ledger(tmp_path):
+    store, numbers = make_store(tmp_path, 1)
+    results = store.apply_batch([Operation("transfer", numbers[0], 500, numbers[1]), Operation("refund", numbers[0], 1)])
+    assert results[0][0] and results[0][1][0] == 9500
+    assert results[1] == (False, "Unknown operation: refund")
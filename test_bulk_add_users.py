@@ -0,0 +1,57 @@
+import hashlib
+import bulk_add_users
+import credentials
+import db
+from atm_service import AtmService, init_db
+
+
+def test_update_bumps_version_so_a_stale_rehash_loses(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "atm.db")
+    init_db(db_path)
+    conn = db.get_connection(db_path)
+    # A legacy unsalted hash, which login upgrades with a compare-and-swap
+    conn.execute('''
+        INSERT INTO accounts (account_number, pin_hash, name, phone_no, balance_paise, withdrawn_today_paise)
+        VALUES ('555001', ?, 'Old Name', '1111111111', 0, 0)
+    ''', (hashlib.sha256(b"1111").hexdigest(),))
+    conn.commit()
+    csv_path = tmp_path / "users.csv"
+    csv_path.write_text("account_number,name,phone_no,pin,balance\n555001,New Name,2222222222,2222,0\n", encoding="utf-8")
+
+    # The bulk update lands after login has read the account but before it
+    # stores the upgraded hash of the old PIN
+    verify_and_upgrade = credentials.verify_and_upgrade
+
+    def bulk_update_first(pin, stored):
+        stats = bulk_add_users.load(str(csv_path), db_path, workers=1, on_conflict="update")
+        assert (stats["inserted"], stats["updated"]) == (0, 1)
+        return verify_and_upgrade(pin, stored)
+    monkeypatch.setattr(credentials, "verify_and_upgrade", bulk_update_first)
+
+    service = AtmService(db_path)
+    service.login('555001', '1111')
+    monkeypatch.setattr(credentials, "verify_and_upgrade", verify_and_upgrade)
+
+    pin_hash, name, version = conn.execute("SELECT pin_hash, name, version FROM accounts WHERE account_number = '555001'").fetchone()
+    assert name == "New Name"
+    assert version == 1
+    assert credentials.verify_pin("2222", pin_hash)
+    assert not credentials.verify_pin("1111", pin_hash)
+
+
+def test_counts_only_rows_actually_written(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "atm.db")
+    init_db(db_path)
+    csv_path = tmp_path / "users.csv"
+    csv_path.write_text("account_number,name,phone_no,pin,balance\n555001,A,1111111111,1111,0\n555002,B,2222222222,2222,0\n", encoding="utf-8")
+    stats = bulk_add_users.load(str(csv_path), db_path, workers=1)
+    assert (stats["inserted"], stats["updated"], stats["rejected"]) == (2, 0, 0)
+
+    csv_path.write_text("account_number,name,phone_no,pin,balance\n555002,C,3333333333,3333,0\n555003,D,4444444444,4444,0\n", encoding="utf-8")
+    stats = bulk_add_users.load(str(csv_path), db_path, workers=1, on_conflict="update")
+    assert (stats["inserted"], stats["updated"], stats["rejected"]) == (1, 1, 0)
+
+    # An account created after the skip-mode prefilter is left alone and not counted
+    monkeypatch.setattr(bulk_add_users, "existing_accounts", lambda cursor, numbers: set())
+    stats = bulk_add_users.load(str(csv_path), db_path, workers=1)
+    assert (stats["inserted"], stats["updated"]) == (0, 0)
@@ -0,0 +1,93 @@
+import random
+import threading
+import account_store
+import db
+import loadgen
+from atm_service import AtmService, init_db
+from ledger import LedgerError
+
+THREADS = 6
+OPERATIONS = 60
+
+
+def hot_accounts(tmp_path, shards, per_shard=2):
+    db_path = str(tmp_path / "atm.db")
+    init_db(db_path)
+    account_store.reshard(db_path, shards)
+    store = account_store.AccountStore(db_path)
+    numbers = []
+    for shard in range(shards):
+        numbers += [n for n in (str(910000 + i) for i in range(100)) if store.shard_of(n) == shard][:per_shard]
+    for number in numbers:
+        conn = db.get_connection(store.path_for(number))
+        conn.execute('''
+            INSERT INTO accounts (account_number, pin_hash, name, phone_no, balance_paise, withdrawn_today_paise, daily_limit_paise)
+            VALUES (?, '', 'Hot', '0', 100000000, 0, 1000000000)
+        ''', (number,))
+        conn.commit()
+    return db_path, store, numbers
+
+
+def state(store, numbers):
+    return {n: db.get_connection(store.path_for(n)).execute(
+        'SELECT balance_paise, version FROM accounts WHERE account_number = ?', (n,)).fetchone() for n in numbers}
+
+
+def test_hot_accounts_across_shards_conserve_money(tmp_path):
+    db_path, store, numbers = hot_accounts(tmp_path, 2)
+    service = AtmService(db_path)
+    before = state(store, numbers)
+    tallies = []
+    problems = []
+
+    def worker(index):
+        rng = random.Random(index)
+        tally = {"deposited": 0, "withdrawn": 0, "writes": 0, "cross": 0}
+        try:
+            for _ in range(OPERATIONS):
+                kind = rng.choice(("deposit", "withdraw", "transfer"))
+                amount = rng.randint(1, 100) * 100
+                try:
+                    if kind == "deposit":
+                        service.deposit(rng.choice(numbers), amount)
+                        tally["deposited"] += amount
+                    elif kind == "withdraw":
+                        service.withdraw(rng.choice(numbers), amount)
+                        tally["withdrawn"] += amount
+                    else:
+                        source, target = rng.sample(numbers, 2)
+                        service.transfer(source, target, amount)
+                        tally["cross"] += store.shard_of(source) != store.shard_of(target)
+                except LedgerError:
+                    continue
+                tally["writes"] += 2 if kind == "transfer" else 1
+        except Exception as e:
+            problems.append(e)
+        tallies.append(tally)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    after = state(store, numbers)
+
+    assert problems == []
+    assert sum(t["cross"] for t in tallies) > 0
+    deposited = sum(t["deposited"] for t in tallies)
+    withdrawn = sum(t["withdrawn"] for t in tallies)
+    assert sum(after[n][0] - before[n][0] for n in numbers) == deposited - withdrawn
+    for n in numbers:
+        logged = db.get_connection(store.path_for(n)).execute('''
+            SELECT COALESCE(SUM(CASE WHEN type IN ('Deposit', 'Transfer In') THEN amount_paise ELSE -amount_paise END), 0)
+            FROM transactions WHERE account_number = ?
+        ''', (n,)).fetchone()[0]
+        assert after[n][0] - before[n][0] == logged
+    assert sum(after[n][1] - before[n][1] for n in numbers) == sum(t["writes"] for t in tallies)
+    assert store.pending() == 0
+
+
+def test_loadgen_contention_reports_money_conserved(tmp_path):
+    report = loadgen.contention(str(tmp_path / "bench-atm.db"), accounts=4, threads=4, seconds=0.5, shards=2)
+    assert report["checks"] == {"total_balance": True, "per_account_log": True, "versions": True, "transfers_settled": True}
+    assert report["operations"]["transfer"]["count"] > 0
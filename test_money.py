@@ -0,0 +1,21 @@
+import pytest
+from money import format_money, to_paise
+
+
+def test_to_paise_parses_rupees():
+    assert to_paise("12.5") == 1250
+    assert to_paise("₹1,000.00") == 100000
+    assert to_paise(0.1) == 10
+    assert to_paise(7) == 700
+    assert to_paise("10.500") == 1050
+
+
+@pytest.mark.parametrize("value", ["10.005", "0.001", 1.999, "abc", "NaN", "Infinity"])
+def test_to_paise_rejects_invalid_amounts(value):
+    with pytest.raises(ValueError):
+        to_paise(value)
+
+
+def test_format_money():
+    assert format_money(123456) == "1234.56"
+    assert format_money(-5) == "-0.05"
@@ -0,0 +1,73 @@
+import time
+from datetime import datetime, timedelta
+
+# Event times are stored as INTEGER microseconds since the Unix epoch (UTC)
+# in *_us columns. Integers compare and index cheaply, so a date range is
+# an index range scan. Days and displayed times use the local timezone,
+# like the old text columns did.
+US_PER_SECOND = 1000000
+DISPLAY_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def now_us():
+    return time.time_ns() // 1000
+
+
+def to_us(moment):
+    return round(moment.timestamp() * US_PER_SECOND)
+
+
+def from_us(us):
+    return datetime.fromtimestamp(us / US_PER_SECOND)
+
+
+def format_us(us, fmt=DISPLAY_FORMAT):
+    return from_us(us).strftime(fmt) if us is not None else ""
+
+
+def local_day(us=None):
+    # Local YYYY-MM-DD of an epoch-microsecond time, by default now
+    return (from_us(us) if us is not None else datetime.now()).strftime("%Y-%m-%d")
+
+
+def parse_day(day):
+    # "YYYY-MM-DD" -> local midnight; raises ValueError otherwise
+    return datetime.strptime(day, "%Y-%m-%d")
+
+
+def day_range_us(start_day=None, end_day=None):
+    # Inclusive YYYY-MM-DD days -> (start_us, end_us) for
+    # "column >= start_us AND column < end_us"; a missing end is None
+    start_us = to_us(parse_day(start_day)) if start_day else None
+    end_us = to_us(parse_day(end_day) + timedelta(days=1)) if end_day else None
+    return start_us, end_us
+
+
+def range_sql(column, start_day=None, end_day=None):
+    # SQL conditions and parameters for the day range
+    start_us, end_us = day_range_us(start_day, end_day)
+    conditions, params = [], []
+    if start_us is not None:
+        conditions.append(f'{column} >= ?')
+        params.append(start_us)
+    if end_us is not None:
+        conditions.append(f'{column} < ?')
+        params.append(end_us)
+    return conditions, params
+
+
+def local_day_sql(column):
+    # SQL expression for the local YYYY-MM-DD day of a *_us column
+    return f"date({column} / {US_PER_SECOND}, 'unixepoch', 'localtime')"
+
+
+def now_us_sql():
+    # SQL expression for the current time in epoch microseconds, for
+    # triggers (julianday keeps sub-millisecond precision)
+    return "CAST((julianday('now') - 2440587.5) * 86400000000 AS INTEGER)"
+
+
+def text_to_us_sql(column):
+    # SQL expression converting an old local "YYYY-MM-DD HH:MM:SS" text
+    # column to epoch microseconds
+    return f"CAST(strftime('%s', {column}, 'utc') AS INTEGER) * {US_PER_SECOND}"
@@ -0,0 +1,261 @@
+import threading
+import tkinter as tk
+from collections import OrderedDict
+from tkinter import ttk
+import db
+
+
+# Serves any window of a sorted, filtered result set in fixed-size pages.
+# Pages are fetched with keyset queries, "(sort, key) > (last sort, last
+# key)", which follow an index instead of skipping rows like OFFSET does.
+# The boundary of each page is remembered once seen. Jumping straight to
+# an unseen page finds its boundary with a one-row OFFSET probe on the
+# index. Only the last cache_pages pages are kept in memory. The row count
+# is kept until the filter changes, so re-sorting does not count again.
+# rows() and count() may run on worker threads; a page read while the sort
+# or filter changed is returned but not cached.
+class KeysetPager:
+    def __init__(self, db_path, select_sql, from_sql, sort_columns, key, page_size=200, cache_pages=8):
+        self.db_path = db_path
+        self.select_sql = select_sql
+        self.from_sql = from_sql
+        self.sort_columns = sort_columns  # sort name -> SQL expression
+        self.key = key
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self.where_sql = ""
+        self.where_params = []
+        self.sort = None
+        self.descending = False
+        self._count = None
+        self._filter_version = 0
+        self._version = 0
+        self._lock = threading.Lock()
+        self.set_sort(next(iter(sort_columns)))
+
+    def set_filter(self, where_sql="", params=()):
+        with self._lock:
+            self.where_sql = where_sql
+            self.where_params = list(params)
+            self._count = None
+            self._filter_version += 1
+            self._reset()
+
+    def set_sort(self, sort, descending=False):
+        if sort not in self.sort_columns:
+            raise ValueError(f"Cannot sort by {sort}")
+        with self._lock:
+            self.sort = sort
+            self.descending = descending
+            self._reset()
+
+    def _reset(self):
+        self._pages = OrderedDict()
+        self._anchors = {}
+        self._version += 1
+
+    def count(self):
+        # Safe to call from a worker thread; a count that finishes after
+        # the filter changed is returned but not kept
+        with self._lock:
+            if self._count is not None:
+                return self._count
+            version = self._filter_version
+            where_sql, where_params = self.where_sql, list(self.where_params)
+        count = db.get_connection(self.db_path).execute(
+            f'SELECT COUNT(*) FROM {self.from_sql}{self._where(where_sql)}', where_params).fetchone()[0]
+        with self._lock:
+            if version == self._filter_version:
+                self._count = count
+        return count
+
+    def known_count(self):
+        # The row count if it has been counted for the current filter, else None
+        return self._count
+
+    def rows(self, start, size):
+        # Rows start .. start + size - 1 of the current ordering
+        result = []
+        page = start // self.page_size
+        offset = start % self.page_size
+        while len(result) < size:
+            rows = self._page(page)
+            result.extend(rows[offset:offset + size - len(result)])
+            if len(rows) < self.page_size:
+                break
+            page += 1
+            offset = 0
+        return result
+
+    def _where(self, where_sql, extra=None):
+        parts = [p for p in (where_sql, extra) if p]
+        return ' WHERE ' + ' AND '.join(f'({p})' for p in parts) if parts else ''
+
+    def _order(self, sort_sql, descending):
+        direction = ' DESC' if descending else ''
+        if sort_sql == self.key:
+            return f'{self.key}{direction}'
+        return f'{sort_sql}{direction}, {self.key}{direction}'
+
+    def _after(self, anchor, sort_sql, descending):
+        # Rows strictly after anchor in the given ordering
+        op = '<' if descending else '>'
+        if sort_sql == self.key:
+            return f'{self.key} {op} ?', [anchor[1]]
+        return f'({sort_sql}, {self.key}) {op} (?, ?)', list(anchor)
+
+    def _page(self, page):
+        with self._lock:
+            if page in self._pages:
+                self._pages.move_to_end(page)
+                return self._pages[page]
+            version = self._version
+            anchor = self._anchors.get(page)
+            sort_sql = self.sort_columns[self.sort]
+            descending = self.descending
+            where_sql = self.where_sql
+            where_params = list(self.where_params)
+        order = self._order(sort_sql, descending)
+        conn = db.get_connection(self.db_path)
+        extra, params = None, []
+        if page > 0:
+            if anchor is None:
+                anchor = conn.execute(
+                    f'SELECT {sort_sql}, {self.key} FROM {self.from_sql}{self._where(where_sql)} ORDER BY {order} LIMIT 1 OFFSET ?',
+                    where_params + [page * self.page_size - 1]).fetchone()
+                if anchor is None:
+                    return []
+            extra, params = self._after(anchor, sort_sql, descending)
+        rows = conn.execute(
+            f'SELECT {self.select_sql}, {sort_sql}, {self.key} FROM {self.from_sql}{self._where(where_sql, extra)} ORDER BY {order} LIMIT ?',
+            where_params + params + [self.page_size]).fetchall()
+        next_anchor = rows[-1][-2:] if rows else None
+        rows = [row[:-2] for row in rows]
+        with self._lock:
+            if version == self._version:
+                if next_anchor:
+                    self._anchors[page + 1] = next_anchor
+                self._pages[page] = rows
+                while len(self._pages) > self.cache_pages:
+                    self._pages.popitem(last=False)
+        return rows
+
+
+# A Treeview that holds only the rows currently on screen. It owns the
+# scrollbar, maps its position onto the pager's row count and rewrites
+# the same height items in place as the view moves. Clicking a sortable
+# heading re-sorts in SQL. Given run_task (TaskExecutor.submit's
+# signature), every query runs in the background: each page is drawn when
+# it arrives unless the view has moved on since, and until the row count
+# comes back the scrollbar waits.
+class VirtualTreeview(ttk.Frame):
+    def __init__(self, parent, pager, columns, format_row=tuple, height=20, run_task=None, **tree_options):
+        super().__init__(parent)
+        self.pager = pager
+        self.format_row = format_row
+        self.height = height
+        self.run_task = run_task
+        self.first = 0
+        self.total = None
+        self.generation = 0
+        self.headings = {}
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", height=height, selectmode="browse", **tree_options)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.on_scroll)
+        self.tree.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
+        self.scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll_by(-1 if event.delta > 0 else 1, "units"))
+        self.tree.bind("<Button-4>", lambda event: self.scroll_by(-1, "units"))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_by(1, "units"))
+        self.tree.bind("<Prior>", lambda event: self.scroll_by(-1, "pages"))
+        self.tree.bind("<Next>", lambda event: self.scroll_by(1, "pages"))
+
+    def heading(self, column, text, sort=None):
+        self.headings[column] = (text, sort)
+        self.tree.heading(column, text=text, command=(lambda: self.sort_by(sort)) if sort else "")
+
+    def sort_by(self, sort):
+        descending = self.pager.sort == sort and not self.pager.descending
+        self.pager.set_sort(sort, descending)
+        for column, (text, column_sort) in self.headings.items():
+            arrow = (" ▼" if descending else " ▲") if column_sort == sort else ""
+            self.tree.heading(column, text=text + arrow)
+        self.refresh()
+
+    def set_filter(self, where_sql="", params=()):
+        self.pager.set_filter(where_sql, params)
+        self.refresh()
+
+    def set_pager(self, pager):
+        self.pager = pager
+        for column, (text, _) in self.headings.items():
+            self.tree.heading(column, text=text)
+        self.refresh()
+
+    def refresh(self):
+        self.first = 0
+        self.total = self.pager.known_count()
+        if self.total is None:
+            if self.run_task is None:
+                self.total = self.pager.count()
+            else:
+                pager = self.pager
+                self.run_task(pager.count, on_done=lambda _: self.show_count(pager))
+        self.render()
+
+    def show_count(self, pager):
+        total = pager.known_count()
+        if pager is self.pager and total is not None and self.winfo_exists():
+            self.total = total
+            self.render()
+
+    def on_scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            if self.total is not None:
+                self.scroll_to(int(float(amount) * self.total))
+        else:
+            self.scroll_by(int(amount), unit)
+
+    def scroll_by(self, amount, unit):
+        self.scroll_to(self.first + amount * (self.height if unit == "pages" else 3))
+        return "break"
+
+    def scroll_to(self, first):
+        first = max(0, first)
+        if self.total is not None:
+            first = min(first, max(self.total - self.height, 0))
+        if first != self.first:
+            self.first = first
+            self.render()
+
+    def render(self):
+        self.generation += 1
+        if self.run_task is None:
+            self.show_rows(self.generation, self.first, self.pager.rows(self.first, self.height))
+            return
+        generation, first = self.generation, self.first
+        self.run_task(self.pager.rows, first, self.height, on_done=lambda rows: self.show_rows(generation, first, rows))
+
+    def show_rows(self, generation, first, rows):
+        if generation != self.generation or not self.winfo_exists():
+            return
+        if self.total is None and first > 0 and len(rows) < self.height:
+            # Still counting and scrolled past the end: back up so the last
+            # rows fill the view
+            self.first = max(first + len(rows) - self.height, 0) if rows else max(first - self.height, 0)
+            self.render()
+            return
+        items = self.tree.get_children()
+        self.tree.selection_remove(self.tree.selection())
+        for i, row in enumerate(rows):
+            if i < len(items):
+                self.tree.item(items[i], values=self.format_row(row))
+            else:
+                self.tree.insert("", "end", values=self.format_row(row))
+        if len(items) > len(rows):
+            self.tree.delete(*items[len(rows):])
+        if self.total:
+            self.scrollbar.set(self.first / self.total, (self.first + len(rows)) / self.total)
+        else:
+            self.scrollbar.set(0, 1)
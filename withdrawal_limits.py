@@ -0,0 +1,88 @@
+import argparse
+import time
+from datetime import datetime, timedelta
+import account_store
+import cache
+import db
+import migrations
+from ledger import AccountNotFound
+from money import format_money, to_paise
+from timestamps import local_day
+
+
+# Per-account daily withdrawal limits. Accounts without their own
+# daily_limit_paise use default_limit. Limits are read on every
+# withdrawal, so they are cached; set_limit() drops the cached value, and
+# a change made by another process shows up within ttl seconds.
+class LimitTracker:
+    def __init__(self, db_path, default_limit, maxsize=100000, ttl=300):
+        self.db_path = db_path
+        self.default_limit = default_limit
+        self.cache = cache.LookupCache(f"daily_limits:{db_path}", maxsize, ttl)
+
+    def limit(self, account_number):
+        return self.cache.get(account_number, self._load)
+
+    def _load(self, account_number):
+        row = db.get_connection(account_store.get_store(self.db_path).path_for(account_number)).execute(
+            'SELECT daily_limit_paise FROM accounts WHERE account_number = ?', (account_number,)).fetchone()
+        return row[0] if row and row[0] is not None else self.default_limit
+
+    def set_limit(self, account_number, limit):
+        # limit in paise; None goes back to the default
+        conn = db.get_connection(account_store.get_store(self.db_path).path_for(account_number))
+        cursor = conn.execute('UPDATE accounts SET daily_limit_paise = ?, version = version + 1 WHERE account_number = ?', (limit, account_number))
+        conn.commit()
+        if cursor.rowcount == 0:
+            raise AccountNotFound("Account not found")
+        self.cache.invalidate(account_number)
+
+
+def reset_all(db_path='atm.db', batch_size=1000, pause=0.0):
+    # Midnight job: zero the counters left from earlier days. Withdrawals
+    # already ignore those, so this only keeps the column honest for
+    # reports; it runs in short rowid-range transactions so ATMs are never
+    # kept waiting. Covers every shard. Returns the number of accounts reset.
+    account_store.init_db(db_path)
+    count = 0
+    for path in account_store.shard_paths(db_path):
+        conn = db.get_connection(path)
+        before = conn.total_changes
+        migrations.backfill(conn, 'accounts', 'withdrawn_today_paise = 0, version = version + 1',
+                            f"withdrawn_today_paise != 0 AND (withdrawal_day IS NULL OR withdrawal_day < '{local_day()}')",
+                            batch_size, pause)
+        count += conn.total_changes - before
+    return count
+
+
+def seconds_until_midnight():
+    now = datetime.now()
+    return ((now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0) - now).total_seconds()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Daily withdrawal limits: reset counters or set an account's limit")
+    parser.add_argument("--db", default="atm.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+    reset = sub.add_parser("reset", help="zero counters from earlier days (e.g. from cron just after midnight)")
+    reset.add_argument("--batch-size", type=int, default=1000)
+    reset.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    reset.add_argument("--daily", action="store_true", help="keep running and reset after every midnight")
+    limit = sub.add_parser("set", help="set an account's daily limit in rupees, or 'default'")
+    limit.add_argument("account_number")
+    limit.add_argument("amount")
+    args = parser.parse_args()
+    if args.command == "set":
+        import atm_service
+        atm_service.init_db(args.db)
+        tracker = LimitTracker(args.db, atm_service.DAILY_WITHDRAWAL_LIMIT)
+        tracker.set_limit(args.account_number, None if args.amount == "default" else to_paise(args.amount))
+        print(f"Daily limit for {args.account_number}: ₹{format_money(tracker.limit(args.account_number))}")
+    else:
+        while True:
+            start = time.perf_counter()
+            count = reset_all(args.db, args.batch_size, args.pause)
+            print(f"Reset {count} withdrawal counters in {time.perf_counter() - start:.2f}s")
+            if not args.daily:
+                break
+            time.sleep(seconds_until_midnight() + 1)